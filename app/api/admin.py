@@ -0,0 +1,146 @@
+"""
+Административные роуты диагностики производительности
+"""
+import logging
+import secrets
+import threading
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from app.config import settings
+from app.profiling import profiler, slow_requests, loop_monitor
+from app.tracing import ring_buffer_sink
+from app.services.export import ExportError, export_records, make_export_encoder
+from app.services.redis_service import create_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Проверяет административный токен из заголовка X-Admin-Token"""
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Административный доступ отключен")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=403, detail="Неверный административный токен")
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.post("/profiler/start")
+async def start_profiler(interval_ms: float = Query(5.0, gt=0, le=1000)):
+    """
+    Запускает сэмплирующий профайлер потока event loop
+    
+    - **interval_ms**: Интервал между снимками стека в миллисекундах
+    """
+    if profiler.running:
+        raise HTTPException(status_code=409, detail="Профайлер уже запущен")
+    
+    # Эндпоинт выполняется в потоке event loop, его и профилируем
+    profiler.start(threading.get_ident(), interval=interval_ms / 1000)
+    logger.info(f"Профайлер запущен с интервалом {interval_ms} мс")
+    return {"status": "started", "interval_ms": interval_ms}
+
+
+@router.post("/profiler/stop", response_class=PlainTextResponse)
+async def stop_profiler():
+    """
+    Останавливает профайлер
+    
+    Возвращает стеки в формате folded stacks для построения flamegraph
+    """
+    if not profiler.running:
+        raise HTTPException(status_code=409, detail="Профайлер не запущен")
+    
+    folded = profiler.stop()
+    logger.info("Профайлер остановлен")
+    return PlainTextResponse(folded)
+
+
+@router.get("/slow_requests/")
+async def get_slow_requests():
+    """
+    Самые медленные запросы с разбивкой времени по этапам
+    """
+    return {
+        "capacity": slow_requests.size,
+        "threshold_ms": slow_requests.threshold_ms(),
+        "requests": slow_requests.snapshot()
+    }
+
+
+@router.delete("/slow_requests/")
+async def clear_slow_requests():
+    """Очищает журнал медленных запросов"""
+    slow_requests.clear()
+    return {"status": "cleared"}
+
+
+@router.get("/traces/")
+async def recent_traces(limit: int = 50):
+    """
+    Последние трассы запросов из кольцевого буфера
+    
+    - **limit**: Максимальное количество трасс
+    
+    Возвращает трассы, начиная с самой свежей. Трассы содержат ключи Redis,
+    ID запросов и адреса внешних сервисов, поэтому доступны только по токену
+    """
+    return {"traces": ring_buffer_sink.recent(limit)}
+
+
+@router.get("/event_loop/")
+async def get_event_loop_stats():
+    """
+    Количество задач asyncio и обнаруженные блокировки event loop
+    """
+    return loop_monitor.stats()
+
+
+@router.get("/export/")
+async def export_requests(
+    format: str = Query("ndjson", pattern="^(ndjson|parquet)$"),
+    compression: str = Query("gzip", pattern="^(none|gzip|zstd)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """
+    Потоковая выгрузка истории запросов
+    
+    - **format**: ndjson или parquet
+    - **compression**: none, gzip или zstd
+    - **since**, **until**: Диапазон saved_at [since, until)
+    
+    Выгрузка использует отдельное подключение к Redis и не занимает пул
+    основного сервиса; при включенном архиве выгружаются и его записи
+    """
+    try:
+        encoder = make_export_encoder(format, compression)
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    client = create_redis_client(max_connections=settings.export_max_connections)
+    
+    async def stream():
+        try:
+            async for chunk in export_records(
+                client,
+                encoder,
+                settings.export_batch_size,
+                since,
+                until,
+                archive_path=settings.archive_path if settings.archive_enabled else None
+            ):
+                yield chunk
+        finally:
+            await client.close()
+    
+    logger.info(f"Запущена выгрузка истории запросов: {format}, {compression}")
+    return StreamingResponse(
+        stream(),
+        media_type=encoder.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{encoder.filename}"'}
+    )
@@ -0,0 +1,174 @@
+"""
+WebSocket канал приема данных для высокочастотных источников
+
+Клиент держит одно соединение и отправляет сообщения вида
+{"id": <correlation id>, "data": {...}}. Каждое сообщение проходит тот же
+конвейер DataProcessorService, что и POST /process_data/, а ответ
+{"id": ..., "result": {...}} или {"id": ..., "error": {...}} отправляется по
+готовности, поэтому порядок ответов может не совпадать с порядком сообщений.
+
+Каждое принятое сообщение занимает слот до отправки ответа на него. Когда
+свободных слотов нет, сервер перестает читать соединение, и отправитель
+упирается в окно TCP - так ограничиваются и обработка, и очередь ответов.
+"""
+import asyncio
+import itertools
+import logging
+import uuid
+from typing import Any, Set
+
+import orjson
+from fastapi import APIRouter, Depends, WebSocket
+
+from app.api.parsing import JsonLimitError, decode_json
+from app.config import settings
+from app.deadline import set_deadline
+from app.services.data_processor import DataProcessorService, get_data_processor
+from app.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def _error(message_id: Any, status: int, detail: str) -> str:
+    return orjson.dumps({"id": message_id, "error": {"status": status, "detail": detail}}).decode()
+
+
+class IngestConnection:
+    """
+    Обработка сообщений одного WebSocket соединения
+    
+    Args:
+        websocket: Принятое соединение
+        data_processor: Сервис обработки данных
+        max_in_flight: Максимум сообщений, ожидающих ответа
+        max_message_size: Максимальный размер сообщения в байтах
+    """
+    
+    def __init__(
+        self,
+        websocket: WebSocket,
+        data_processor: DataProcessorService,
+        max_in_flight: int = 64,
+        max_message_size: int = 1024 * 1024
+    ):
+        self.websocket = websocket
+        self.data_processor = data_processor
+        self.max_in_flight = max_in_flight
+        self.max_message_size = max_message_size
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._outgoing: asyncio.Queue = asyncio.Queue()
+        self._tasks: Set[asyncio.Task] = set()
+        # ID запросов: один uuid4 на соединение и порядковый номер сообщения
+        self._connection_id = uuid.uuid4().hex
+        self._sequence = itertools.count(1)
+        self.received = 0
+    
+    async def run(self):
+        """Обслуживает соединение до отключения клиента"""
+        await self.websocket.send_text(
+            orjson.dumps({"event": "ready", "max_in_flight": self.max_in_flight}).decode()
+        )
+        reader = asyncio.create_task(self._read_loop())
+        writer = asyncio.create_task(self._write_loop())
+        try:
+            done, _ = await asyncio.wait({reader, writer}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    logger.warning(f"Соединение приема данных прервано: {task.exception()!r}")
+        finally:
+            # Клиент ушел: ответы на оставшиеся сообщения доставить уже некому
+            pending = [reader, writer, *self._tasks]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.info(
+                f"Соединение приема данных {self._connection_id} закрыто, "
+                f"сообщений: {self.received}"
+            )
+    
+    async def _read_loop(self):
+        while True:
+            # Без свободного слота следующее сообщение не читается
+            await self._slots.acquire()
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            
+            self.received += 1
+            raw = message.get("bytes")
+            if raw is None:
+                raw = (message.get("text") or "").encode()
+            
+            if len(raw) > self.max_message_size:
+                self._outgoing.put_nowait(
+                    _error(None, 413, f"Сообщение больше {self.max_message_size} байт")
+                )
+                continue
+            
+            try:
+                payload = decode_json(raw, settings.request_max_json_depth, settings.request_max_json_keys)
+            except JsonLimitError as e:
+                self._outgoing.put_nowait(_error(None, e.status_code, e.detail))
+                continue
+            
+            message_id = payload.get("id") if isinstance(payload, dict) else None
+            data = payload.get("data") if isinstance(payload, dict) else None
+            if message_id is None:
+                self._outgoing.put_nowait(_error(None, 422, "Поле id обязательно"))
+                continue
+            if not isinstance(data, dict):
+                self._outgoing.put_nowait(
+                    _error(message_id, 422, "Поле data обязательно и должно быть JSON объектом")
+                )
+                continue
+            
+            task = asyncio.create_task(self._process(message_id, data))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _process(self, message_id: Any, data: dict):
+        request_id = f"{self._connection_id}-{next(self._sequence)}"
+        # Задача работает в копии контекста, дедлайн действует только для нее
+        set_deadline(settings.deadline_default_seconds)
+        try:
+            with tracer.start_trace("WS /ingest/", request_id=request_id):
+                result = await self.data_processor.process_data(data, request_id=request_id)
+            reply = f'{{"id":{orjson.dumps(message_id).decode()},"result":{result.model_dump_json()}}}'
+        except Exception as e:
+            logger.error(f"Ошибка обработки сообщения {message_id}: {str(e)}")
+            reply = _error(message_id, 500, f"Внутренняя ошибка сервера: {str(e)}")
+        self._outgoing.put_nowait(reply)
+    
+    async def _write_loop(self):
+        while True:
+            reply = await self._outgoing.get()
+            try:
+                await self.websocket.send_text(reply)
+            finally:
+                self._slots.release()
+
+
+@router.websocket("/ingest/")
+async def ingest(
+    websocket: WebSocket,
+    data_processor: DataProcessorService = Depends(get_data_processor)
+):
+    """
+    Поток сообщений {"id": ..., "data": {...}} по одному соединению
+    
+    Ответы приходят по мере готовности с тем же id
+    """
+    await websocket.accept()
+    logger.info(
+        f"Открыто соединение приема данных от "
+        f"{websocket.client.host if websocket.client else 'unknown'}"
+    )
+    connection = IngestConnection(
+        websocket,
+        data_processor,
+        max_in_flight=settings.ingest_max_in_flight,
+        max_message_size=settings.ingest_max_message_size
+    )
+    await connection.run()
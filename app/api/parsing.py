@@ -0,0 +1,169 @@
+"""
+Быстрый разбор JSON тел запросов с ограничениями размера и сложности
+"""
+import re
+from itertools import accumulate
+from operator import add
+from typing import Any
+
+import orjson
+from fastapi import HTTPException, Request
+
+from app.config import settings
+
+# Строки JSON целиком (с учетом экранирования), чтобы скобки и двоеточия
+# внутри значений не влияли на подсчет вложенности и ключей
+_STRING_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+
+# Оставляет только скобки, приводя их к виду "(" и ")"
+_BRACKETS_TABLE = bytes.maketrans(b"{}[]", b"()()")
+_NON_BRACKETS = bytes(byte for byte in range(256) if byte not in b"{}[]")
+
+# Скобки упаковываются по 8 в байт ("(" - бит 1, ")" - бит 0); для каждого
+# значения байта заранее известны изменение глубины и наибольший подъем
+# внутри восьмерки
+_BITS_TABLE = bytes.maketrans(b"()", b"10")
+
+
+def _bracket_byte_tables():
+    net, peak = [], []
+    for value in range(256):
+        depth = highest = 0
+        for bit in range(7, -1, -1):
+            depth += 1 if value >> bit & 1 else -1
+            highest = max(highest, depth)
+        net.append(depth)
+        peak.append(highest)
+    return net, peak
+
+
+_BYTE_NET, _BYTE_PEAK = _bracket_byte_tables()
+
+
+class JsonLimitError(ValueError):
+    """Документ превышает ограничения или не является корректным JSON"""
+    
+    def __init__(self, detail: str, status_code: int = 422):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+def check_json_limits(body: bytes, max_depth: int, max_keys: int):
+    """
+    Проверяет глубину вложенности и количество ключей без полного разбора
+    
+    Сначала сравниваются дешевые верхние оценки по сырым байтам (каждый ключ
+    сопровождается двоеточием, каждый уровень - открывающей скобкой). Точный
+    подсчет без учета содержимого строк выполняется, только если оценка
+    превышает ограничение.
+    
+    Args:
+        body: Тело документа
+        max_depth: Максимальная глубина вложенности объектов и массивов
+        max_keys: Максимальное суммарное количество ключей во всех объектах
+    
+    Raises:
+        JsonLimitError: Если документ превышает ограничения
+    """
+    keys_bound = body.count(b":")
+    depth_bound = body.count(b"{") + body.count(b"[")
+    if keys_bound <= max_keys and depth_bound <= max_depth:
+        return
+    
+    structure = _STRING_RE.sub(b"", body)
+    
+    keys = structure.count(b":")
+    if keys > max_keys:
+        raise JsonLimitError(f"Слишком много ключей в документе: {keys} > {max_keys}")
+    
+    brackets = structure.translate(_BRACKETS_TABLE, _NON_BRACKETS)
+    if _exceeds_depth(brackets, max_depth):
+        raise JsonLimitError(f"Слишком глубокая вложенность документа: больше {max_depth}")
+
+
+def _exceeds_depth(brackets: bytes, max_depth: int) -> bool:
+    """
+    Проверяет, превышает ли вложенность строки из скобок "(" и ")" max_depth
+    
+    Глубина перед каждой восьмеркой скобок - накопленная сумма изменений
+    предыдущих восьмерок, наибольшая глубина внутри восьмерки - эта сумма
+    плюс подъем из таблицы. Все шаги выполняются встроенными итераторами за
+    один проход, время не зависит от глубины и формы документа.
+    """
+    if not brackets:
+        return False
+    # Дополнение закрывающими скобками не увеличивает глубину
+    bits = brackets.translate(_BITS_TABLE) + b"0" * (-len(brackets) % 8)
+    packed = int(bits, 2).to_bytes(len(bits) // 8, "big")
+    depths = accumulate(map(_BYTE_NET.__getitem__, packed), initial=0)
+    return max(map(add, depths, map(_BYTE_PEAK.__getitem__, packed))) > max_depth
+
+
+def decode_json(body: bytes, max_depth: int, max_keys: int) -> Any:
+    """
+    Проверяет ограничения и разбирает JSON из байт
+    
+    Args:
+        body: Тело документа
+        max_depth: Максимальная глубина вложенности
+        max_keys: Максимальное количество ключей
+    
+    Returns:
+        Разобранный документ
+    
+    Raises:
+        JsonLimitError: Если документ некорректен или превышает ограничения
+    """
+    check_json_limits(body, max_depth, max_keys)
+    try:
+        return orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        raise JsonLimitError(f"Некорректный JSON: {str(e)}")
+
+
+async def read_body(request: Request, max_size: int) -> bytes:
+    """
+    Читает тело запроса, прерывая чтение при превышении размера
+    
+    Args:
+        request: Входящий запрос
+        max_size: Максимальный размер тела в байтах
+    
+    Raises:
+        HTTPException: 413 если тело больше max_size
+    """
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_size:
+        raise HTTPException(status_code=413, detail=f"Тело запроса больше {max_size} байт")
+    
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_size:
+            raise HTTPException(status_code=413, detail=f"Тело запроса больше {max_size} байт")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def parse_process_data_body(request: Request) -> dict:
+    """
+    Разбирает тело POST /process_data/ в обход стандартной валидации FastAPI
+    
+    Returns:
+        dict: Значение поля data
+    
+    Raises:
+        HTTPException: 413 при превышении размера, 422 при ошибке формата
+    """
+    body = await read_body(request, settings.request_max_body_size)
+    try:
+        payload = decode_json(body, settings.request_max_json_depth, settings.request_max_json_keys)
+    except JsonLimitError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    data = payload.get("data") if isinstance(payload, dict) else None
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=422, detail="Поле data обязательно и должно быть JSON объектом")
+    return data
@@ -2,8 +2,8 @@
 API роуты для приложения
 """
 import logging
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, Response
 from typing import Dict, Any
 from datetime import datetime
 
@@ -11,24 +11,34 @@ from app.models.schemas import (
     ProcessDataRequest, 
     ProcessDataResponse, 
     ErrorResponse, 
-    HealthCheckResponse
+    HealthCheckResponse,
+    ReadinessResponse
 )
-from app.services.data_processor import DataProcessorService
-from app.services.redis_service import RedisService
+from app.services.data_processor import DataProcessorService, get_data_processor
+from app.services.redis_service import RedisService, get_redis_service
 from app.config import settings
+from app.api.parsing import parse_process_data_body
 
 logger = logging.getLogger(__name__)
 
 # Создаем роутер
 router = APIRouter()
 
-# Инициализируем сервисы
-data_processor = DataProcessorService()
-redis_service = RedisService()
 
-
-@router.post("/process_data/", response_model=ProcessDataResponse)
-async def process_data(request: ProcessDataRequest) -> ProcessDataResponse:
+@router.post(
+    "/process_data/",
+    response_model=ProcessDataResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": ProcessDataRequest.model_json_schema()}}
+        }
+    }
+)
+async def process_data(
+    request: Request,
+    data_processor: DataProcessorService = Depends(get_data_processor)
+) -> Response:
     """
     Обрабатывает входящие данные асинхронно
     
@@ -36,15 +46,20 @@ async def process_data(request: ProcessDataRequest) -> ProcessDataResponse:
     
     Возвращает результат обработки с данными от внешнего API
     """
-    logger.info(f"Получен запрос на обработку данных: {request.data}")
+    # Тело разбирается напрямую из байт с ограничениями размера, глубины и
+    # количества ключей; повторная валидация Pydantic для data не нужна
+    data = await parse_process_data_body(request)
+    logger.info(f"Получен запрос на обработку данных, ключей верхнего уровня: {len(data)}")
     
     try:
         # Обрабатываем данные
-        result = await data_processor.process_data(request.data)
+        result = await data_processor.process_data(data)
         
         logger.info(f"Обработка данных завершена, request_id: {result.request_id}")
-        return result
-        
+        # Модель уже собрана сервисом, поэтому сериализуем ее без повторной
+        # валидации через response_model
+        return Response(content=result.model_dump_json(), media_type="application/json")
+    
     except Exception as e:
         logger.error(f"Критическая ошибка при обработке данных: {str(e)}")
         raise HTTPException(
@@ -54,7 +69,7 @@ async def process_data(request: ProcessDataRequest) -> ProcessDataResponse:
 
 
 @router.get("/health/", response_model=HealthCheckResponse)
-async def health_check():
+async def health_check(redis_service: RedisService = Depends(get_redis_service)):
     """
     Проверка состояния сервиса
     
@@ -72,6 +87,37 @@ async def health_check():
     )
 
 
+@router.get("/ready/", response_model=ReadinessResponse)
+async def readiness_check(
+    request: Request,
+    redis_service: RedisService = Depends(get_redis_service)
+):
+    """
+    Проверка готовности принимать трафик
+    
+    В отличие от /health/ возвращает 503, пока при старте не прогреты
+    подключения к Redis и внешнему API, а также пока нет подключения к Redis
+    """
+    warmed = getattr(request.app.state, "ready", False)
+    redis_connected = redis_service.redis_client is not None
+    ready = warmed and redis_connected
+    if ready:
+        status = "ready"
+    elif not warmed:
+        status = "starting"
+    else:
+        status = "redis_unavailable"
+    response = ReadinessResponse(
+        status=status,
+        redis_connected=redis_connected,
+        timestamp=datetime.now()
+    )
+    
+    if not ready:
+        return JSONResponse(status_code=503, content=response.model_dump(mode="json"))
+    return response
+
+
 @router.get("/")
 async def root():
     """
@@ -83,5 +129,6 @@ async def root():
         "message": "Async Data Processing API",
         "version": settings.app_version,
         "docs": "/docs",
-        "health": "/health/"
+        "health": "/health/",
+        "ready": "/ready/"
     }
@@ -0,0 +1,72 @@
+"""
+Командная строка приложения
+
+Запуск из корня проекта:
+    python -m app.cli export --format ndjson --compression zstd --since 2024-01-01 -o requests.ndjson.zst
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime
+
+from app.config import settings
+from app.services.export import (
+    EXPORT_COMPRESSIONS,
+    EXPORT_FORMATS,
+    ExportError,
+    export_records,
+    make_export_encoder
+)
+from app.services.redis_service import create_redis_client
+
+
+async def run_export(args) -> int:
+    """Выгружает историю запросов в файл или stdout"""
+    try:
+        encoder = make_export_encoder(args.format, args.compression)
+    except ExportError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    
+    client = create_redis_client(max_connections=settings.export_max_connections)
+    output = open(args.output, "wb") if args.output != "-" else sys.stdout.buffer
+    try:
+        async for chunk in export_records(
+            client,
+            encoder,
+            args.batch_size,
+            args.since,
+            args.until,
+            archive_path=settings.archive_path if settings.archive_enabled else None
+        ):
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+        else:
+            output.flush()
+        await client.close()
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=settings.app_name)
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    export = commands.add_parser("export", help="Потоковая выгрузка истории запросов из Redis и архива")
+    export.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    export.add_argument("--compression", choices=EXPORT_COMPRESSIONS, default="gzip")
+    export.add_argument("--since", type=datetime.fromisoformat,
+                        help="Нижняя граница saved_at (ISO 8601) включительно")
+    export.add_argument("--until", type=datetime.fromisoformat,
+                        help="Верхняя граница saved_at (ISO 8601) не включительно")
+    export.add_argument("--batch-size", type=int, default=settings.export_batch_size,
+                        help="Ключей в одном SCAN/MGET")
+    export.add_argument("-o", "--output", default="-", help="Файл результата, по умолчанию stdout")
+    
+    args = parser.parse_args(argv)
+    return asyncio.run(run_export(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
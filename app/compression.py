@@ -0,0 +1,367 @@
+"""
+Сжатие ответов и распаковка тел запросов
+
+gzip поддерживается всегда, brotli и zstd - если установлены пакеты brotli и
+zstandard; тела запросов в br распаковываются только с brotli >= 1.2. Ответ сжимается потоково: каждый фрагмент тела проходит через
+компрессор и сразу отправляется клиенту, целиком тело не буферизуется.
+"""
+import logging
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - зависит от окружения
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - зависит от окружения
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Ограниченная распаковка (output_buffer_limit) появилась в brotli 1.2; со
+# старыми версиями br используется только для сжатия ответов, иначе одно
+# маленькое тело могло бы распаковаться целиком в память
+_BROTLI_BOUNDED = brotli is not None and hasattr(brotli.Decompressor, "can_accept_more_data")
+
+# Окно zstd ограничено, чтобы кадр не мог потребовать буфер до 2 ГБ;
+# 8 МБ достаточно для всех уровней сжатия, кроме --ultra
+_ZSTD_MAX_WINDOW_SIZE = 1 << 23
+_ZSTD_WRITE_SIZE = 64 * 1024
+
+# Уже сжатые данные повторно не сжимаются
+_COMPRESSED_MEDIA_TYPES = frozenset({
+    "application/gzip",
+    "application/zstd",
+    "application/vnd.apache.parquet"
+})
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+    
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+    
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, level: int):
+        self._obj = brotli.Compressor(quality=level)
+    
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+    
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level: int):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+    
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+    
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+class _GzipDecoder:
+    def __init__(self):
+        # 47 = автоопределение заголовка zlib/gzip
+        self._obj = zlib.decompressobj(47)
+    
+    def decompress(self, data: bytes, max_length: int) -> bytes:
+        result = self._obj.decompress(data, max_length)
+        if self._obj.unconsumed_tail:
+            raise _BodyTooLarge()
+        return result
+
+
+class _BrotliDecoder:
+    def __init__(self):
+        self._obj = brotli.Decompressor()
+    
+    def decompress(self, data: bytes, max_length: int) -> bytes:
+        result = self._obj.process(data, output_buffer_limit=max_length)
+        # Вывод уперся в предел, а распаковано еще не все
+        if not self._obj.can_accept_more_data():
+            raise _BodyTooLarge()
+        return result
+
+
+class _ZstdDecoder:
+    """
+    Распаковка zstd с ограничением вывода
+    
+    stream_writer отдает распакованные данные порциями не больше write_size,
+    поэтому превышение предела обнаруживается до распаковки всего фрагмента.
+    """
+    
+    def __init__(self):
+        decompressor = zstandard.ZstdDecompressor(max_window_size=_ZSTD_MAX_WINDOW_SIZE)
+        self._writer = decompressor.stream_writer(self, write_size=_ZSTD_WRITE_SIZE)
+        self._output: List[bytes] = []
+        self._size = 0
+        self._limit = 0
+    
+    def write(self, data) -> int:
+        self._size += len(data)
+        if self._size > self._limit:
+            raise _BodyTooLarge()
+        self._output.append(bytes(data))
+        return len(data)
+    
+    def decompress(self, data: bytes, max_length: int) -> bytes:
+        self._output, self._size, self._limit = [], 0, max_length
+        self._writer.write(data)
+        return b"".join(self._output)
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+def available_encodings() -> List[str]:
+    """Кодировки, поддерживаемые в текущем окружении"""
+    encodings = ["gzip"]
+    if brotli is not None:
+        encodings.append("br")
+    if zstandard is not None:
+        encodings.append("zstd")
+    return encodings
+
+
+def make_encoder(encoding: str, level: int):
+    """Создает потоковый компрессор для кодировки"""
+    if encoding == "gzip":
+        return _GzipEncoder(level)
+    if encoding == "br" and brotli is not None:
+        return _BrotliEncoder(level)
+    if encoding == "zstd" and zstandard is not None:
+        return _ZstdEncoder(level)
+    raise ValueError(f"Кодировка {encoding} не поддерживается")
+
+
+def _make_decoder(encoding: str):
+    if encoding in ("gzip", "x-gzip", "deflate"):
+        return _GzipDecoder()
+    if encoding == "br" and _BROTLI_BOUNDED:
+        return _BrotliDecoder()
+    if encoding == "zstd" and zstandard is not None:
+        return _ZstdDecoder()
+    return None
+
+
+def negotiate_encoding(accept_encoding: str, preferred: Iterable[str]) -> Optional[str]:
+    """
+    Выбирает кодировку ответа по заголовку Accept-Encoding
+    
+    Args:
+        accept_encoding: Значение заголовка Accept-Encoding
+        preferred: Кодировки сервера в порядке предпочтения
+    
+    Returns:
+        Выбранная кодировка или None, если сжимать не нужно
+    """
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    
+    best, best_q = None, 0.0
+    for encoding in preferred:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware со сжатием ответов и распаковкой сжатых тел запросов
+    
+    Args:
+        app: ASGI приложение
+        minimum_size: Ответы меньшего размера отправляются без сжатия
+        levels: Уровни сжатия по кодировкам
+        preferred: Кодировки в порядке предпочтения сервера
+        max_request_size: Максимальный размер распакованного тела запроса
+    """
+    
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        levels: Optional[Dict[str, int]] = None,
+        preferred: Iterable[str] = ("zstd", "br", "gzip"),
+        max_request_size: int = 10 * 1024 * 1024
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": 6, "br": 4, "zstd": 3, **(levels or {})}
+        available = available_encodings()
+        self.preferred = [encoding for encoding in preferred if encoding in available]
+        self.max_request_size = max_request_size
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        headers = Headers(scope=scope)
+        
+        content_encoding = headers.get("content-encoding", "").strip().lower()
+        if content_encoding and content_encoding != "identity":
+            decoded = await self._decode_request(scope, receive, send, content_encoding)
+            if decoded is None:
+                return
+            scope, receive = decoded
+        
+        encoding = negotiate_encoding(headers.get("accept-encoding", ""), self.preferred)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        responder = _CompressingResponder(send, encoding, self.levels[encoding], self.minimum_size)
+        await self.app(scope, receive, responder.send)
+    
+    async def _decode_request(self, scope: Scope, receive: Receive, send: Send, encoding: str):
+        """Распаковывает тело запроса целиком с ограничением размера"""
+        decoder = _make_decoder(encoding)
+        if decoder is None:
+            response = PlainTextResponse(f"Unsupported Content-Encoding: {encoding}", status_code=415)
+            await response(scope, receive, send)
+            return None
+        
+        chunks = []
+        total = 0
+        more_body = True
+        try:
+            while more_body:
+                message = await receive()
+                if message["type"] != "http.request":
+                    return None
+                more_body = message.get("more_body", False)
+                chunk = decoder.decompress(message.get("body", b""), self.max_request_size - total + 1)
+                total += len(chunk)
+                if total > self.max_request_size:
+                    raise _BodyTooLarge()
+                chunks.append(chunk)
+        except _BodyTooLarge:
+            response = PlainTextResponse("Request body too large", status_code=413)
+            await response(scope, receive, send)
+            return None
+        except Exception as e:
+            logger.warning(f"Не удалось распаковать тело запроса ({encoding}): {str(e)}")
+            response = PlainTextResponse("Malformed compressed body", status_code=400)
+            await response(scope, receive, send)
+            return None
+        
+        body = b"".join(chunks)
+        scope = dict(scope)
+        request_headers = MutableHeaders(scope=scope)
+        del request_headers["content-encoding"]
+        request_headers["content-length"] = str(len(body))
+        
+        sent = False
+        
+        async def decoded_receive() -> Message:
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+        
+        return scope, decoded_receive
+
+
+class _CompressingResponder:
+    """Оборачивает send и сжимает тело ответа по мере отправки"""
+    
+    def __init__(self, send: Send, encoding: str, level: int, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self._start: Optional[Message] = None
+        self._encoder = None
+        self._passthrough = False
+    
+    async def send(self, message: Message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            self._start = {**message, "headers": list(message.get("headers", []))}
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "").split(";")[0].strip()
+            if "content-encoding" in headers or media_type in _COMPRESSED_MEDIA_TYPES:
+                self._passthrough = True
+            return
+        
+        if message_type != "http.response.body":
+            await self._send(message)
+            return
+        
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        
+        if self._passthrough:
+            await self._flush_start()
+            await self._send(message)
+            return
+        
+        if self._encoder is None:
+            headers = MutableHeaders(raw=self._start["headers"])
+            declared = headers.get("content-length")
+            size = int(declared) if declared else (None if more_body else len(body))
+            if size is not None and size < self.minimum_size:
+                self._passthrough = True
+                await self._flush_start()
+                await self._send(message)
+                return
+            
+            self._encoder = make_encoder(self.encoding, self.level)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["content-length"]
+            else:
+                compressed = self._encoder.compress(body) + self._encoder.finish()
+                headers["Content-Length"] = str(len(compressed))
+                self._start["headers"] = headers.raw
+                await self._flush_start()
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+            self._start["headers"] = headers.raw
+            await self._flush_start()
+        
+        chunk = self._encoder.compress(body)
+        if not more_body:
+            chunk += self._encoder.finish()
+        if chunk or not more_body:
+            await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+    
+    async def _flush_start(self):
+        if self._start is not None:
+            await self._send(self._start)
+            self._start = None
@@ -1,8 +1,10 @@
 """
 Конфигурация приложения через Pydantic BaseSettings
 """
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
 
 
 class Settings(BaseSettings):
@@ -21,11 +23,104 @@ class Settings(BaseSettings):
     redis_host: str = "localhost"
     redis_port: int = 6379
     redis_db: int = 0
+    redis_reconnect_min_delay: float = 0.5
+    redis_reconnect_max_delay: float = 30.0
+    # Ожидание ответа на PING, после которого Redis считается недоступным
+    redis_ping_timeout: float = 2.0
+    redis_request_ttl_hours: float = 24
+    
+    # Шардирование Redis: standalone (один узел), cluster (Redis Cluster) или
+    # sharded (консистентное хеширование на клиенте по узлам redis_nodes);
+    # узлы задаются URL вида redis://host:port/db
+    redis_mode: str = "standalone"
+    redis_nodes: List[str] = []
+    redis_ring_vnodes: int = 160
+    # Разделы ключей: в режимах шардирования хеш-тег записи - ее раздел, и на
+    # тот же шард попадает раздел индекса времени архива. Изменение делает
+    # существующие записи недоступными
+    redis_key_partitions: int = 1024
+    
+    # Резервное хранилище на время недоступности Redis
+    fallback_store_path: str = "redis_fallback.db"
+    fallback_store_max_records: int = 100_000
+    fallback_replay_batch_size: int = 500
+    
+    # Архив истории: записи старше archive_after_minutes переносятся из Redis
+    # в файлы-сегменты каталога archive_path и хранятся archive_retention_days;
+    # возраст записей отслеживается сортированными множествами history:index:{pN},
+    # по одному на раздел ключей (redis_key_partitions)
+    archive_enabled: bool = False
+    archive_path: str = "archive"
+    archive_after_minutes: float = 60
+    archive_retention_days: float = 30
+    archive_interval_seconds: float = 60.0
+    archive_batch_size: int = 1000
+    archive_segment_max_records: int = 100_000
+    archive_compact_min_segments: int = 8
     
     # Настройки внешнего API
     external_api_url: str = "https://catfact.ninja/fact"
     external_api_timeout: int = 10
     
+    # Настройки трассировки (доля трассируемых запросов от 0 до 1)
+    tracing_sample_rate: float = 0.0
+    tracing_ring_buffer_size: int = 1000
+    tracing_otlp_endpoint: str = ""
+    
+    # Диагностика (административные эндпоинты выключены при пустом токене)
+    admin_token: str = ""
+    slow_request_log_size: int = 50
+    loop_monitor_interval_ms: float = 50
+    loop_stall_threshold_ms: float = 100
+    
+    # Сжатие ответов и тел запросов (br и zstd требуют пакеты brotli и zstandard)
+    compression_minimum_size: int = 1024
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4
+    compression_zstd_level: int = 3
+    compression_max_request_size: int = 10 * 1024 * 1024
+    
+    # Ограничения тела POST /process_data/
+    request_max_body_size: int = 10 * 1024 * 1024
+    request_max_json_depth: int = 64
+    request_max_json_keys: int = 100_000
+    
+    # Выгрузка истории запросов (отдельный пул соединений с Redis)
+    export_batch_size: int = 1000
+    export_max_connections: int = 4
+    
+    # WebSocket канал приема данных: ограничение обрабатываемых одновременно
+    # сообщений одного соединения и размера сообщения
+    ingest_max_in_flight: int = 64
+    ingest_max_message_size: int = 1024 * 1024
+    
+    # Дедлайны запросов: бюджет клиента в секундах из заголовка или по умолчанию
+    deadline_header: str = "X-Request-Timeout"
+    deadline_default_seconds: float = 30.0
+    deadline_max_seconds: float = 120.0
+    deadline_route_seconds: Dict[str, float] = {"/api/v1/process_data/": 15.0}
+    # Выгрузка может долго искать первую запись диапазона, а сжатие ответа
+    # откладывает начало ответа до первого фрагмента
+    deadline_exempt_paths: List[str] = ["/api/v1/admin/export/"]
+    
+    @model_validator(mode="after")
+    def _check_redis_mode(self) -> "Settings":
+        """Ошибка режима Redis обнаруживается при старте, а не в цикле переподключения"""
+        if self.redis_mode not in ("standalone", "cluster", "sharded"):
+            raise ValueError(f"Неизвестный режим Redis: {self.redis_mode}")
+        if self.redis_mode != "standalone" and not self.redis_nodes:
+            raise ValueError(f"Режим Redis {self.redis_mode} требует непустой REDIS_NODES")
+        if self.redis_mode != "standalone":
+            for url in self.redis_nodes:
+                try:
+                    node = urlparse(url)
+                    node.port
+                except ValueError:
+                    node = None
+                if node is None or node.scheme not in ("redis", "rediss") or not node.hostname:
+                    raise ValueError(f"Некорректный узел Redis в REDIS_NODES: {url!r}, ожидается redis://host:port/db")
+        return self
+    
     model_config = {
         "env_file": ".env",
         "case_sensitive": False
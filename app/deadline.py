@@ -0,0 +1,252 @@
+"""
+Дедлайны запросов
+
+Дедлайн берется из заголовка запроса (оставшееся у клиента время в секундах)
+или из значения по умолчанию для маршрута и хранится в contextvar. Сервисы
+ограничивают свои таймауты оставшимся бюджетом, а DeadlineMiddleware
+прерывает обработку, когда дедлайн истек или клиент отключился.
+"""
+import asyncio
+import logging
+import math
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Awaitable, Dict, Iterable, Optional, TypeVar
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.models.schemas import ErrorResponse
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Абсолютный момент истечения по time.monotonic()
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Бюджет времени запроса исчерпан"""
+
+
+def set_deadline(timeout: float):
+    """
+    Устанавливает дедлайн для текущего контекста
+    
+    Args:
+        timeout: Бюджет времени в секундах от текущего момента
+    
+    Returns:
+        Токен для восстановления предыдущего значения
+    """
+    return _deadline.set(time.monotonic() + timeout)
+
+
+def reset_deadline(token):
+    """Восстанавливает дедлайн, действовавший до set_deadline"""
+    _deadline.reset(token)
+
+
+def time_left() -> Optional[float]:
+    """Оставшееся до дедлайна время в секундах или None, если дедлайна нет"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def bound_timeout(default: Optional[float] = None) -> Optional[float]:
+    """
+    Ограничивает таймаут операции оставшимся бюджетом запроса
+    
+    Args:
+        default: Собственный таймаут операции
+    
+    Returns:
+        Меньшее из default и оставшегося времени
+    
+    Raises:
+        DeadlineExceeded: Если бюджет уже исчерпан
+    """
+    left = time_left()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded()
+    return left if default is None else min(default, left)
+
+
+async def with_deadline(awaitable: Awaitable[T], default: Optional[float] = None) -> T:
+    """
+    Выполняет операцию с таймаутом, не превышающим оставшийся бюджет
+    
+    Args:
+        awaitable: Операция
+        default: Собственный таймаут операции
+    
+    Raises:
+        DeadlineExceeded: Если бюджет исчерпан до или во время операции
+        asyncio.TimeoutError: Если истек собственный таймаут операции
+    """
+    try:
+        timeout = bound_timeout(default)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        left = time_left()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded()
+        raise
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware, устанавливающее дедлайн запроса и прерывающее
+    обработку при его истечении или отключении клиента
+    
+    При истечении дедлайна отправляется 504, при отключении клиента -
+    пустой ответ 499 (код nginx "Client Closed Request").
+    
+    Args:
+        app: ASGI приложение
+        header: Заголовок с бюджетом времени клиента в секундах
+        default_timeout: Дедлайн по умолчанию
+        route_timeouts: Дедлайны по умолчанию для отдельных путей
+        max_timeout: Верхняя граница бюджета, запрошенного клиентом
+        exempt_paths: Пути без дедлайна (длительные потоковые выгрузки)
+    """
+    
+    def __init__(
+        self,
+        app: ASGIApp,
+        header: str = "X-Request-Timeout",
+        default_timeout: float = 30.0,
+        route_timeouts: Optional[Dict[str, float]] = None,
+        max_timeout: float = 120.0,
+        exempt_paths: Iterable[str] = ()
+    ):
+        self.app = app
+        self.header = header.lower()
+        self.default_timeout = default_timeout
+        self.route_timeouts = route_timeouts or {}
+        self.max_timeout = max_timeout
+        self.exempt_paths = frozenset(exempt_paths)
+    
+    def _timeout_for(self, scope: Scope) -> float:
+        timeout = self.route_timeouts.get(scope["path"], self.default_timeout)
+        requested = Headers(scope=scope).get(self.header)
+        if requested:
+            try:
+                value = float(requested)
+            except ValueError:
+                value = None
+            # nan, бесконечность и неположительный бюджет игнорируются
+            if value is None or not math.isfinite(value) or value <= 0:
+                logger.warning(f"Некорректное значение заголовка {self.header}: {requested}")
+            else:
+                timeout = min(value, self.max_timeout)
+        return timeout
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        
+        timeout = self._timeout_for(scope)
+        token = set_deadline(timeout)
+        try:
+            await self._run(scope, receive, send, timeout)
+        finally:
+            reset_deadline(token)
+    
+    async def _run(self, scope: Scope, receive: Receive, send: Send, timeout: float):
+        body_read = asyncio.Event()
+        disconnected = asyncio.Event()
+        response_started = False
+        
+        async def tracked_receive() -> Message:
+            if body_read.is_set():
+                # Тело уже прочитано: следующим сообщением может быть только отключение
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+                body_read.set()
+            elif not message.get("more_body", False):
+                body_read.set()
+            return message
+        
+        async def tracked_send(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+        
+        async def watch_disconnect():
+            await body_read.wait()
+            if not disconnected.is_set():
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+        
+        app_task = asyncio.create_task(self.app(scope, tracked_receive, tracked_send))
+        watcher = asyncio.create_task(watch_disconnect())
+        disconnect_wait = asyncio.create_task(disconnected.wait())
+        try:
+            done, _ = await asyncio.wait(
+                {app_task, disconnect_wait},
+                timeout=max(timeout, 0),
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if app_task in done:
+                app_task.result()
+                return
+            
+            if disconnect_wait in done and not app_task.done():
+                logger.info(f"Клиент отключился, обработка {scope['path']} прервана")
+                await self._cancel(app_task)
+                # Внешние middleware (BaseHTTPMiddleware) ждут завершенного ответа,
+                # поэтому он отправляется, хотя клиент его уже не получит
+                if response_started:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+                else:
+                    await Response(status_code=499)(scope, receive, send)
+                return
+            
+            # Дедлайн истек
+            if response_started:
+                # Ответ уже отправляется, прерывать его поздно
+                await app_task
+                return
+            logger.warning(f"Дедлайн {timeout:.3f}с истек, обработка {scope['path']} прервана")
+            await self._cancel(app_task)
+            response = JSONResponse(
+                status_code=504,
+                content=ErrorResponse(
+                    error="HTTP 504",
+                    detail="Истек дедлайн обработки запроса",
+                    timestamp=datetime.now(),
+                    request_id=str(uuid.uuid4())
+                ).model_dump(mode="json")
+            )
+            await response(scope, receive, send)
+        finally:
+            watcher.cancel()
+            disconnect_wait.cancel()
+    
+    @staticmethod
+    async def _cancel(task: asyncio.Task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
@@ -1,6 +1,7 @@
 """
 Основной файл FastAPI приложения
 """
+import asyncio
 import logging
 import sys
 from contextlib import asynccontextmanager
@@ -8,12 +9,21 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
+import time
 import uuid
 
 from app.config import settings
 from app.api.routes import router
-from app.services.redis_service import RedisService
+from app.api.admin import router as admin_router
+from app.api.ingest import router as ingest_router
+from app.services.archive import HistoryArchiver, get_segment_archive
+from app.services.redis_service import get_redis_service
+from app.services.external_api import get_external_api_service
 from app.models.schemas import ErrorResponse
+from app.tracing import tracer, collect_stages, OtlpHttpSink
+from app.profiling import profiler, slow_requests, loop_monitor
+from app.compression import CompressionMiddleware
+from app.deadline import DeadlineMiddleware
 
 # Настройка логирования
 logging.basicConfig(
@@ -27,8 +37,31 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-# Глобальный экземпляр Redis сервиса
-redis_service = RedisService()
+
+async def warmup(app: FastAPI):
+    """
+    Прогревает подключения после старта, не задерживая прием трафика
+    
+    Пока прогрев не завершен, /ready/ отвечает 503, а /health/ уже доступен.
+    Недоступность внешнего API не блокирует готовность: без него сервис
+    отвечает без external_api_data
+    """
+    await get_redis_service().connect()
+    await get_external_api_service().warmup()
+    app.state.ready = True
+    if get_redis_service().redis_client is None:
+        logger.warning("Прогрев завершен без подключения к Redis, /ready/ отвечает 503")
+    else:
+        logger.info("Подключения прогреты, приложение готово принимать трафик")
+
+
+def _log_warmup_failure(task: asyncio.Task):
+    """Сообщает об ошибке прогрева: иначе /ready/ молча остается в 503"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(
+            f"Ошибка прогрева, приложение не будет готово: {str(task.exception())}",
+            exc_info=task.exception()
+        )
 
 
 @asynccontextmanager
@@ -38,14 +71,41 @@ async def lifespan(app: FastAPI):
     """
     # Startup
     logger.info("Запуск приложения...")
-    await redis_service.connect()
+    app.state.ready = False
+    warmup_task = asyncio.create_task(warmup(app))
+    warmup_task.add_done_callback(_log_warmup_failure)
+    otlp_sink = None
+    if settings.tracing_otlp_endpoint:
+        otlp_sink = OtlpHttpSink(settings.tracing_otlp_endpoint, settings.app_name)
+        otlp_sink.start()
+        tracer.add_sink(otlp_sink)
+    loop_monitor.start()
+    archiver = None
+    if settings.archive_enabled:
+        archive = get_segment_archive()
+        archive.open()
+        get_redis_service().archive = archive
+        archiver = HistoryArchiver(get_redis_service(), archive, batch_size=settings.archive_batch_size)
+        archiver.start(settings.archive_interval_seconds)
     logger.info("Приложение запущено успешно")
     
     yield
     
     # Shutdown
     logger.info("Остановка приложения...")
-    await redis_service.disconnect()
+    warmup_task.cancel()
+    await loop_monitor.stop()
+    if profiler.running:
+        profiler.stop()
+    if otlp_sink:
+        tracer.sinks.remove(otlp_sink)
+        await otlp_sink.stop()
+    await get_external_api_service().close()
+    if archiver:
+        await archiver.stop()
+    await get_redis_service().disconnect()
+    if archiver:
+        archiver.archive.close()
     logger.info("Приложение остановлено")
 
 
@@ -68,6 +128,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Сжатие ответов и распаковка сжатых тел запросов
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.compression_minimum_size,
+    levels={
+        "gzip": settings.compression_gzip_level,
+        "br": settings.compression_brotli_quality,
+        "zstd": settings.compression_zstd_level
+    },
+    max_request_size=settings.compression_max_request_size
+)
+
+# Дедлайн запроса и прерывание обработки при отключении клиента
+app.add_middleware(
+    DeadlineMiddleware,
+    header=settings.deadline_header,
+    default_timeout=settings.deadline_default_seconds,
+    route_timeouts=settings.deadline_route_seconds,
+    max_timeout=settings.deadline_max_seconds,
+    exempt_paths=settings.deadline_exempt_paths
+)
+
 
 # Middleware для логирования запросов
 @app.middleware("http")
@@ -75,6 +157,8 @@ async def log_requests(request: Request, call_next):
     """Логирование всех HTTP запросов"""
     request_id = str(uuid.uuid4())
     start_time = datetime.now()
+    started = time.perf_counter()
+    stages = collect_stages() if slow_requests.size > 0 else None
     
     # Логируем входящий запрос
     logger.info(
@@ -83,7 +167,12 @@ async def log_requests(request: Request, call_next):
     )
     
     # Обрабатываем запрос
-    response = await call_next(request)
+    with tracer.start_trace(
+        f"{request.method} {request.url.path}",
+        request_id=request_id
+    ) as span:
+        response = await call_next(request)
+        span.set_attribute("http.status_code", response.status_code)
     
     # Логируем ответ
     process_time = (datetime.now() - start_time).total_seconds()
@@ -92,8 +181,24 @@ async def log_requests(request: Request, call_next):
         f"за {process_time:.3f}с"
     )
     
+    # Учитываем запрос в журнале самых медленных
+    duration_ms = (time.perf_counter() - started) * 1000
+    if stages is not None and duration_ms > slow_requests.threshold_ms():
+        slow_requests.add(duration_ms, {
+            "request_id": request_id,
+            "method": request.method,
+            "path": request.url.path,
+            "status_code": response.status_code,
+            "started_at": start_time.isoformat(),
+            "duration_ms": round(duration_ms, 3),
+            "stages_ms": {name: round(value, 3) for name, value in stages.items()},
+            "trace_id": span.trace_id
+        })
+    
     # Добавляем request_id в заголовки ответа
     response.headers["X-Request-ID"] = request_id
+    if span.trace_id:
+        response.headers["X-Trace-ID"] = span.trace_id
     
     return response
 
@@ -113,7 +218,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
             detail=exc.detail,
             timestamp=datetime.now(),
             request_id=request_id
-        ).dict()
+        ).model_dump(mode="json")
     )
 
 
@@ -131,12 +236,14 @@ async def general_exception_handler(request: Request, exc: Exception):
             detail="Произошла внутренняя ошибка сервера",
             timestamp=datetime.now(),
             request_id=request_id
-        ).dict()
+        ).model_dump(mode="json")
     )
 
 
 # Подключение роутов
 app.include_router(router, prefix="/api/v1")
+app.include_router(admin_router, prefix="/api/v1/admin", tags=["admin"])
+app.include_router(ingest_router, prefix="/api/v1", tags=["ingest"])
 
 
 if __name__ == "__main__":
@@ -42,3 +42,10 @@ class HealthCheckResponse(BaseModel):
     app_name: str
     version: str
     timestamp: datetime
+
+
+class ReadinessResponse(BaseModel):
+    """Модель для readiness check"""
+    status: str
+    redis_connected: bool
+    timestamp: datetime
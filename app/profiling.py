@@ -0,0 +1,193 @@
+"""
+Инструменты диагностики производительности: сэмплирующий профайлер потока
+event loop, журнал самых медленных запросов и монитор задержек event loop
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профайлер одного потока
+    
+    Фоновый поток с заданным интервалом снимает стек целевого потока через
+    sys._current_frames() и считает одинаковые стеки. Результат отдается в
+    формате folded stacks ("func;func;func count"), который принимают
+    flamegraph.pl, speedscope и inferno.
+    """
+    
+    def __init__(self):
+        self._samples: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._target_thread_id: Optional[int] = None
+        self.interval = 0.005
+        self.started_at: Optional[float] = None
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+    
+    def start(self, target_thread_id: int, interval: float = 0.005):
+        """
+        Запускает профилирование
+        
+        Args:
+            target_thread_id: Идентификатор профилируемого потока
+            interval: Интервал между снимками стека в секундах
+        """
+        if self.running:
+            raise RuntimeError("Профайлер уже запущен")
+        self._samples = Counter()
+        self._target_thread_id = target_thread_id
+        self.interval = interval
+        self.started_at = time.monotonic()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+    
+    def stop(self) -> str:
+        """
+        Останавливает профилирование
+        
+        Returns:
+            str: Стеки в формате folded stacks
+        """
+        if not self.running:
+            raise RuntimeError("Профайлер не запущен")
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        return self.folded()
+    
+    def folded(self) -> str:
+        """Возвращает накопленные стеки в формате folded stacks"""
+        return "\n".join(
+            f"{stack} {count}" for stack, count in self._samples.most_common()
+        )
+    
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self._samples[";".join(reversed(stack))] += 1
+
+
+class SlowRequestLog:
+    """Хранит N самых медленных запросов с разбивкой времени по этапам"""
+    
+    def __init__(self, size: int = 50):
+        self.size = size
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+    
+    def add(self, duration_ms: float, record: Dict[str, Any]):
+        """
+        Учитывает завершенный запрос
+        
+        Args:
+            duration_ms: Длительность запроса в миллисекундах
+            record: Описание запроса
+        """
+        if self.size <= 0:
+            return
+        item = (duration_ms, next(self._counter), record)
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, item)
+        elif duration_ms > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+    
+    def threshold_ms(self) -> float:
+        """Минимальная длительность, при которой запрос попадет в журнал"""
+        if len(self._heap) < self.size:
+            return 0.0
+        return self._heap[0][0]
+    
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Возвращает запросы, начиная с самого медленного"""
+        return [record for _, _, record in sorted(self._heap, reverse=True)]
+    
+    def clear(self):
+        self._heap.clear()
+
+
+class LoopMonitor:
+    """
+    Обнаруживает блокировки event loop
+    
+    Фоновая задача засыпает на фиксированный интервал и измеряет, насколько
+    позже она проснулась. Опоздание больше порога считается блокировкой.
+    """
+    
+    def __init__(self, interval: float = 0.05, threshold: float = 0.1, history: int = 100):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self.stall_count = 0
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Запускает мониторинг в текущем event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Останавливает мониторинг"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - expected
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self.stall_count += 1
+                self.stalls.append({
+                    "detected_at": datetime.now().isoformat(),
+                    "lag_ms": round(lag * 1000, 3)
+                })
+                logger.warning(f"Event loop заблокирован на {lag * 1000:.1f} мс")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Статистика задач и блокировок event loop"""
+        tasks = asyncio.all_tasks()
+        return {
+            "tasks_total": len(tasks),
+            "tasks_pending": sum(1 for task in tasks if not task.done()),
+            "stall_threshold_ms": self.threshold * 1000,
+            "stall_count": self.stall_count,
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "recent_stalls": list(self.stalls)
+        }
+
+
+# Глобальные экземпляры инструментов диагностики
+profiler = SamplingProfiler()
+slow_requests = SlowRequestLog(size=settings.slow_request_log_size)
+loop_monitor = LoopMonitor(
+    interval=settings.loop_monitor_interval_ms / 1000,
+    threshold=settings.loop_stall_threshold_ms / 1000
+)
@@ -0,0 +1,558 @@
+"""
+Архив истории запросов в локальных сегментах
+
+Записи старше archive_after_minutes переносятся из Redis в неизменяемые
+файлы-сегменты. Каждый сегмент содержит записи подряд и отсортированный по
+хешу request_id индекс; файл отображается в память (mmap), поиск идет
+двоичным поиском по индексу без чтения файла целиком, а значение отдается
+срезом отображения без копирования. Мелкие сегменты периодически
+сливаются в крупные, а записи старше срока хранения удаляются.
+
+Формат сегмента (little-endian):
+    заголовок: magic "RQSG", версия, количество записей, минимальный и
+        максимальный saved_at (unix time), смещение индекса
+    записи: saved_at (double), длина id (u16), длина значения (u32), id, значение
+    индекс: пары (хеш id u64, смещение записи u64), отсортированные по хешу
+"""
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+
+from app.config import settings
+from app.services.redis_sharding import partition_tag
+
+if TYPE_CHECKING:
+    from app.services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"RQSG"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHHIddQ")
+_RECORD = struct.Struct("<dHI")
+_ENTRY = struct.Struct("<QQ")
+
+# Запись для сегмента: request_id, saved_at (unix time), значение
+ArchiveRecord = Tuple[str, float, bytes]
+
+
+def _id_hash(request_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(request_id.encode(), digest_size=8).digest(), "little")
+
+
+def history_index_key(partition: int) -> str:
+    """
+    Раздел индекса времени
+    
+    Индекс - сортированные множества request_id со значением saved_at (unix
+    time), по одному на раздел ключей. Хеш-тег раздела совпадает с хеш-тегом
+    ключей его записей, поэтому в режимах шардирования запись и ее элемент
+    индекса находятся на одном шарде и сохраняются одним пайплайном узла.
+    """
+    return f"history:index:{partition_tag(partition)}"
+
+
+class Segment:
+    """
+    Неизменяемый сегмент архива, отображенный в память
+    
+    Args:
+        path: Путь к файлу сегмента
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.count, self.min_saved_at, self.max_saved_at, self._index_offset = (
+            _HEADER.unpack_from(self._mmap, 0)
+        )
+        if magic != _MAGIC or version != _VERSION:
+            self._mmap.close()
+            raise ValueError(f"Файл {path} не является сегментом архива")
+        self.size = len(self._mmap)
+    
+    def _entry(self, position: int) -> Tuple[int, int]:
+        return _ENTRY.unpack_from(self._mmap, self._index_offset + position * _ENTRY.size)
+    
+    def _record(self, offset: int) -> Tuple[float, str, memoryview]:
+        saved_at, id_length, value_length = _RECORD.unpack_from(self._mmap, offset)
+        start = offset + _RECORD.size
+        request_id = self._mmap[start:start + id_length].decode()
+        value = memoryview(self._mmap)[start + id_length:start + id_length + value_length]
+        return saved_at, request_id, value
+    
+    def get(self, request_id: str) -> Optional[memoryview]:
+        """
+        Находит значение записи двоичным поиском по индексу
+        
+        Returns:
+            Значение без копирования или None, если записи нет
+        """
+        target = _id_hash(request_id)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < target:
+                low = middle + 1
+            else:
+                high = middle
+        
+        # Одинаковый хеш у разных id маловероятен, но проверяется
+        while low < self.count:
+            id_hash, offset = self._entry(low)
+            if id_hash != target:
+                break
+            _, found_id, value = self._record(offset)
+            if found_id == request_id:
+                return value
+            low += 1
+        return None
+    
+    def records(self) -> Iterator[Tuple[float, str, memoryview]]:
+        """Записи сегмента в порядке записи"""
+        offset = _HEADER.size
+        while offset < self._index_offset:
+            saved_at, request_id, value = self._record(offset)
+            yield saved_at, request_id, value
+            offset += _RECORD.size + len(request_id.encode()) + len(value)
+    
+    def close(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            # На значение еще ссылается memoryview; отображение освободится вместе с ним
+            pass
+
+
+def write_segment(path: str, records) -> Optional[str]:
+    """
+    Записывает сегмент во временный файл и атомарно переименовывает его
+    
+    Args:
+        path: Путь к итоговому файлу
+        records: Итерируемые тройки (request_id, saved_at, значение)
+    
+    Returns:
+        Путь к сегменту или None, если записей не было
+    """
+    temporary = path + ".tmp"
+    entries: List[Tuple[int, int]] = []
+    min_saved_at, max_saved_at = float("inf"), float("-inf")
+    with open(temporary, "wb") as file:
+        file.write(b"\0" * _HEADER.size)
+        offset = _HEADER.size
+        for request_id, saved_at, value in records:
+            encoded_id = request_id.encode()
+            file.write(_RECORD.pack(saved_at, len(encoded_id), len(value)))
+            file.write(encoded_id)
+            file.write(value)
+            entries.append((_id_hash(request_id), offset))
+            offset += _RECORD.size + len(encoded_id) + len(value)
+            min_saved_at = min(min_saved_at, saved_at)
+            max_saved_at = max(max_saved_at, saved_at)
+        
+        if not entries:
+            file.close()
+            os.remove(temporary)
+            return None
+        
+        entries.sort()
+        for entry in entries:
+            file.write(_ENTRY.pack(*entry))
+        file.seek(0)
+        file.write(_HEADER.pack(_MAGIC, _VERSION, 0, len(entries), min_saved_at, max_saved_at, offset))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    return path
+
+
+class SegmentArchive:
+    """
+    Набор сегментов архива в каталоге
+    
+    Поиск идет от новых сегментов к старым, поэтому при повторном переносе
+    записи возвращается последняя версия. Список сегментов меняется только в
+    потоке event loop; файлы строятся в отдельном потоке.
+    
+    Args:
+        path: Каталог сегментов
+        retention_seconds: Срок хранения записей
+        segment_max_records: Целевой размер сегмента при слиянии
+        compact_min_segments: Слияние начинается при таком количестве мелких сегментов
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        retention_seconds: float = 30 * 24 * 3600,
+        segment_max_records: int = 100_000,
+        compact_min_segments: int = 8
+    ):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self.segment_max_records = segment_max_records
+        self.compact_min_segments = compact_min_segments
+        self.segments: List[Segment] = []
+        self._sequence = 0
+        self._lock = asyncio.Lock()
+    
+    def open(self):
+        """Открывает существующие сегменты каталога"""
+        os.makedirs(self.path, exist_ok=True)
+        for name in sorted(os.listdir(self.path)):
+            full_path = os.path.join(self.path, name)
+            if name.endswith((".tmp", ".merge")):
+                # Незавершенная запись или слияние до перезапуска
+                os.remove(full_path)
+                continue
+            if not name.endswith(".seg"):
+                continue
+            try:
+                self.segments.append(Segment(full_path))
+            except (ValueError, struct.error, OSError) as e:
+                logger.error(f"Поврежденный сегмент архива {full_path}: {str(e)}")
+                continue
+            self._sequence = max(self._sequence, int(name.split(".")[0]))
+        logger.info(f"Открыт архив истории: сегментов {len(self.segments)}")
+    
+    def _next_path(self) -> str:
+        self._sequence += 1
+        return os.path.join(self.path, f"{self._sequence:012d}.seg")
+    
+    def get(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Ищет запись в сегментах
+        
+        Returns:
+            Данные записи или None
+        """
+        for segment in reversed(self.segments):
+            value = segment.get(request_id)
+            if value is not None:
+                return orjson.loads(value)
+        return None
+    
+    async def append(self, records: List[ArchiveRecord]) -> int:
+        """
+        Записывает пачку записей новым сегментом
+        
+        Returns:
+            Количество записанных записей
+        """
+        async with self._lock:
+            path = await asyncio.to_thread(write_segment, self._next_path(), records)
+            if path is None:
+                return 0
+            self.segments.append(Segment(path))
+        return len(records)
+    
+    def _expired(self, now: float) -> List[Segment]:
+        cutoff = now - self.retention_seconds
+        return [segment for segment in self.segments if segment.max_saved_at < cutoff]
+    
+    async def enforce_retention(self) -> int:
+        """Удаляет сегменты, все записи которых старше срока хранения"""
+        async with self._lock:
+            expired = self._expired(time.time())
+            if expired:
+                self.segments = [segment for segment in self.segments if segment not in expired]
+                self._remove(expired)
+        return len(expired)
+    
+    def _compaction_group(self) -> List[Segment]:
+        """Первая подряд идущая серия мелких сегментов, ограниченная segment_max_records"""
+        run: List[Segment] = []
+        for segment in self.segments + [None]:
+            if segment is not None and segment.count < self.segment_max_records // 2:
+                run.append(segment)
+                continue
+            if len(run) >= self.compact_min_segments:
+                break
+            run = []
+        
+        group: List[Segment] = []
+        total = 0
+        for segment in run:
+            if group and total + segment.count > self.segment_max_records:
+                break
+            group.append(segment)
+            total += segment.count
+        return group
+    
+    async def compact(self) -> bool:
+        """
+        Сливает подряд идущие мелкие сегменты в один
+        
+        Сливаются только соседние сегменты, поэтому порядок поиска от новых к
+        старым сохраняется. Остается последняя версия каждой записи, записи
+        старше срока хранения отбрасываются.
+        
+        Returns:
+            True если слияние выполнено
+        """
+        async with self._lock:
+            group = self._compaction_group()
+            if len(group) < 2:
+                return False
+            
+            cutoff = time.time() - self.retention_seconds
+            # Результат занимает имя самого нового из сливаемых сегментов
+            path = group[-1].path
+            merged = await asyncio.to_thread(write_segment, path + ".merge", _merge(group, cutoff))
+            
+            position = self.segments.index(group[0])
+            group[-1].close()
+            if merged is not None:
+                # Сначала результат занимает свое место, и только потом удаляются
+                # исходные сегменты: при сбое между шагами записи лишь дублируются
+                os.replace(merged, path)
+                replacement = [Segment(path)]
+            else:
+                os.remove(path)
+                replacement = []
+            self._remove(group[:-1])
+            self.segments[position:position + len(group)] = replacement
+        logger.info(f"Слито сегментов архива: {len(group)}")
+        return True
+    
+    def _remove(self, segments: List[Segment]):
+        for segment in segments:
+            segment.close()
+            try:
+                os.remove(segment.path)
+            except FileNotFoundError:
+                pass
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "segments": len(self.segments),
+            "records": sum(segment.count for segment in self.segments),
+            "bytes": sum(segment.size for segment in self.segments)
+        }
+    
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+
+
+def _merge(group: List[Segment], cutoff: float) -> Iterator[ArchiveRecord]:
+    """Записи группы сегментов без дубликатов id и устаревших записей"""
+    seen = set()
+    for segment in reversed(group):
+        for saved_at, request_id, value in segment.records():
+            if saved_at < cutoff or request_id in seen:
+                continue
+            seen.add(request_id)
+            yield request_id, saved_at, value
+
+
+def open_segments(path: str) -> List[Segment]:
+    """
+    Открывает сегменты каталога для чтения в обход SegmentArchive
+    
+    Используется выгрузкой, в том числе из отдельного процесса. Сегменты
+    открываются от старых к новым: слияние сначала заменяет самый новый
+    сегмент группы и только потом удаляет остальные, поэтому исчезнувший к
+    моменту открытия сегмент уже вошел в открываемый позже результат
+    слияния. Открытое отображение доступно и после удаления файла.
+    """
+    segments: List[Segment] = []
+    if not os.path.isdir(path):
+        return segments
+    for name in sorted(os.listdir(path)):
+        if not name.endswith(".seg"):
+            continue
+        full_path = os.path.join(path, name)
+        try:
+            segments.append(Segment(full_path))
+        except FileNotFoundError:
+            continue
+        except (ValueError, struct.error, OSError) as e:
+            logger.error(f"Поврежденный сегмент архива {full_path}: {str(e)}")
+    return segments
+
+
+def iter_archived(
+    segments: List[Segment],
+    since: Optional[float] = None,
+    until: Optional[float] = None
+) -> Iterator[ArchiveRecord]:
+    """
+    Последние версии записей с saved_at в [since, until)
+    
+    Сегменты обходятся от новых к старым; запись пропускается, если ее ID
+    есть в более новом сегменте. Вместо множества всех ID выполняется поиск
+    по индексам, поэтому память не зависит от размера архива.
+    """
+    for position in range(len(segments) - 1, -1, -1):
+        segment = segments[position]
+        if since is not None and segment.max_saved_at < since:
+            continue
+        if until is not None and segment.min_saved_at >= until:
+            continue
+        newer = segments[position + 1:]
+        for saved_at, request_id, value in segment.records():
+            if since is not None and saved_at < since:
+                continue
+            if until is not None and saved_at >= until:
+                continue
+            if any(other.get(request_id) is not None for other in newer):
+                continue
+            yield request_id, saved_at, value
+
+
+def record_saved_at(value: str, fallback: float) -> float:
+    """saved_at записи в unix time или fallback, если поле отсутствует"""
+    try:
+        return datetime.fromisoformat(orjson.loads(value)["saved_at"]).timestamp()
+    except (KeyError, TypeError, ValueError, orjson.JSONDecodeError):
+        return fallback
+
+
+class HistoryArchiver:
+    """
+    Фоновый перенос стареющих записей из Redis в архив
+    
+    Возраст записи берется из индекса времени (см. history_index_key), который
+    RedisService пополняет при сохранении, в том числе при переносе записей из
+    резервного хранилища. Записи с saved_at старше archive_after_minutes
+    переносятся в сегмент и удаляются из Redis вместе с элементами индекса;
+    элементы индекса для уже истекших записей просто удаляются.
+    
+    Args:
+        redis_service: Сервис Redis
+        archive: Архив сегментов
+        batch_size: Записей в одной пачке переноса (один сегмент)
+    """
+    
+    def __init__(self, redis_service: "RedisService", archive: SegmentArchive, batch_size: int = 1000):
+        self.redis_service = redis_service
+        self.archive = archive
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+    
+    async def _archive_batch(self, client, aged: List[Tuple[str, str, float]]) -> int:
+        """
+        Переносит пачку записей из индекса
+        
+        Args:
+            client: Клиент Redis
+            aged: Ключ раздела индекса, request_id и saved_at каждой записи
+        
+        Returns:
+            Количество перенесенных записей
+        """
+        keys = [self.redis_service._key(request_id) for _, request_id, _ in aged]
+        mget = getattr(client, "mget_nonatomic", client.mget)
+        values = await mget(keys)
+        records = []
+        archived_keys = []
+        for (_, request_id, saved_at), key, value in zip(aged, keys, values):
+            if value is None:
+                # Запись истекла раньше переноса
+                continue
+            if isinstance(value, str):
+                value = value.encode()
+            records.append((request_id, saved_at, value))
+            archived_keys.append(key)
+        if records:
+            await self.archive.append(records)
+        
+        # Из Redis записи удаляются только после записи сегмента на диск
+        members: Dict[str, List[str]] = {}
+        for index_key, request_id, _ in aged:
+            members.setdefault(index_key, []).append(request_id)
+        pipe = client.pipeline(transaction=False)
+        for key in archived_keys:
+            pipe.delete(key)
+        for index_key, request_ids in members.items():
+            pipe.zrem(index_key, *request_ids)
+        await pipe.execute()
+        return len(records)
+    
+    async def run_once(self) -> int:
+        """
+        Один проход переноса, слияния и очистки
+        
+        Разделы индекса опрашиваются одним пайплайном; из каждого берется
+        доля пачки, и опрос повторяется для разделов, где записи остались.
+        
+        Returns:
+            Количество перенесенных записей
+        """
+        client = self.redis_service.redis_client
+        archived = 0
+        if client is not None:
+            cutoff = time.time() - settings.archive_after_minutes * 60
+            pending = [history_index_key(partition) for partition in range(settings.redis_key_partitions)]
+            while pending:
+                limit = max(1, -(-self.batch_size // len(pending)))
+                pipe = client.pipeline(transaction=False)
+                for index_key in pending:
+                    pipe.zrangebyscore(index_key, "-inf", cutoff, start=0, num=limit, withscores=True)
+                replies = await pipe.execute()
+                
+                aged = [
+                    (index_key, request_id, saved_at)
+                    for index_key, reply in zip(pending, replies)
+                    for request_id, saved_at in reply
+                ]
+                for offset in range(0, len(aged), self.batch_size):
+                    archived += await self._archive_batch(client, aged[offset:offset + self.batch_size])
+                pending = [index_key for index_key, reply in zip(pending, replies) if len(reply) >= limit]
+        
+        removed = await self.archive.enforce_retention()
+        while await self.archive.compact():
+            pass
+        
+        if archived or removed:
+            logger.info(f"Перенесено в архив записей: {archived}, удалено устаревших сегментов: {removed}")
+        return archived
+    
+    async def _loop(self, interval: float):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка переноса истории в архив: {str(e)}")
+            await asyncio.sleep(interval)
+    
+    def start(self, interval: float = 60.0):
+        """Запускает периодический перенос"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop(interval))
+    
+    async def stop(self):
+        """Останавливает периодический перенос"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+@lru_cache()
+def get_segment_archive() -> SegmentArchive:
+    """Общий архив сегментов по настройкам, создается при первом обращении"""
+    return SegmentArchive(
+        settings.archive_path,
+        retention_seconds=settings.archive_retention_days * 24 * 3600,
+        segment_max_records=settings.archive_segment_max_records,
+        compact_min_segments=settings.archive_compact_min_segments
+    )
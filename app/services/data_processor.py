@@ -3,11 +3,13 @@
 """
 import logging
 import uuid
-from typing import Dict, Any
+from functools import lru_cache
+from typing import Dict, Any, Optional
 from datetime import datetime
 from app.models.schemas import ProcessDataResponse, ExternalApiResponse
-from app.services.external_api import ExternalApiService
-from app.services.redis_service import RedisService
+from app.services.external_api import ExternalApiService, get_external_api_service
+from app.services.redis_service import RedisService, get_redis_service
+from app.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
@@ -15,32 +17,51 @@ logger = logging.getLogger(__name__)
 class DataProcessorService:
     """Сервис для асинхронной обработки данных"""
     
-    def __init__(self):
-        self.external_api_service = ExternalApiService()
-        self.redis_service = RedisService()
+    def __init__(
+        self,
+        external_api_service: Optional[ExternalApiService] = None,
+        redis_service: Optional[RedisService] = None
+    ):
+        # По умолчанию используются общие экземпляры, подключаемые в lifespan
+        self.external_api_service = external_api_service or get_external_api_service()
+        self.redis_service = redis_service or get_redis_service()
     
-    async def process_data(self, input_data: Dict[str, Any]) -> ProcessDataResponse:
+    async def process_data(
+        self,
+        input_data: Dict[str, Any],
+        request_id: Optional[str] = None
+    ) -> ProcessDataResponse:
         """
         Асинхронно обрабатывает входящие данные
         
         Args:
             input_data: Входящие данные для обработки
-            
+            request_id: Уникальный ID запроса, по умолчанию генерируется uuid4
+        
         Returns:
             ProcessDataResponse: Результат обработки
         """
-        request_id = str(uuid.uuid4())
+        request_id = request_id or str(uuid.uuid4())
         logger.info(f"Начало обработки данных, request_id: {request_id}")
         
+        with tracer.span("process_data", request_id=request_id) as span:
+            response = await self._process(request_id, input_data)
+            span.set_attribute("success", response.success)
+            return response
+    
+    async def _process(self, request_id: str, input_data: Dict[str, Any]) -> ProcessDataResponse:
+        """Выполняет этапы обработки: внешний API, трансформация, сохранение"""
         try:
             # Асинхронно получаем данные от внешнего API
             external_data = await self.external_api_service.get_cat_fact()
             
             # Обрабатываем входящие данные (простая трансформация)
-            processed_data = self._transform_data(input_data)
+            with tracer.span("transform_data"):
+                processed_data = self._transform_data(input_data)
             
-            # Создаем ответ
-            response = ProcessDataResponse(
+            # Создаем ответ (без повторной валидации: все поля уже нужных типов,
+            # а обход вложенного original_data дорог для больших документов)
+            response = ProcessDataResponse.model_construct(
                 success=True,
                 message="Данные успешно обработаны",
                 processed_data=processed_data,
@@ -62,7 +83,7 @@ class DataProcessorService:
             
             logger.info(f"Обработка данных завершена успешно, request_id: {request_id}")
             return response
-            
+        
         except Exception as e:
             logger.error(f"Ошибка при обработке данных, request_id: {request_id}: {str(e)}")
             
@@ -91,7 +112,7 @@ class DataProcessorService:
         
         Args:
             data: Входящие данные
-            
+        
         Returns:
             Dict: Трансформированные данные
         """
@@ -105,3 +126,10 @@ class DataProcessorService:
         }
         
         return transformed
+
+
+
+@lru_cache()
+def get_data_processor() -> DataProcessorService:
+    """Общий экземпляр DataProcessorService, создается при первом обращении"""
+    return DataProcessorService()
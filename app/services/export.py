@@ -0,0 +1,327 @@
+"""
+Потоковая выгрузка истории запросов из Redis и архива
+
+Ключи обходятся через SCAN, значения читаются пачками через MGET, причем
+следующая пачка ключей собирается, пока читается предыдущая. Если включен
+архив истории, после Redis выгружаются записи сегментов архива. Результат
+отдается фрагментами NDJSON (gzip, zstd или без сжатия) или Parquet
+(нужен пакет pyarrow), поэтому потребление памяти ограничено размером пачки.
+"""
+import asyncio
+import io
+import logging
+import time
+from itertools import islice
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import orjson
+
+from app.compression import make_encoder
+from app.services.archive import iter_archived, open_segments
+from app.services.redis_sharding import request_id_from_key
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("ndjson", "parquet")
+EXPORT_COMPRESSIONS = ("none", "gzip", "zstd")
+
+_MEDIA_TYPES = {
+    "none": "application/x-ndjson",
+    "gzip": "application/gzip",
+    "zstd": "application/zstd"
+}
+
+
+class ExportError(ValueError):
+    """Некорректные параметры выгрузки"""
+
+
+def _local_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """saved_at хранится в локальном времени без зоны, приводим границы к нему"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+class _NdjsonEncoder:
+    def __init__(self, compression: str, level: int):
+        self.compression = compression
+        self.media_type = _MEDIA_TYPES[compression]
+        self.filename = "requests.ndjson" + {"none": "", "gzip": ".gz", "zstd": ".zst"}[compression]
+        self._encoder = None if compression == "none" else make_encoder(compression, level)
+    
+    def encode(self, rows: List[Dict[str, Any]]) -> bytes:
+        chunk = b"".join(orjson.dumps(row) + b"\n" for row in rows)
+        return chunk if self._encoder is None else self._encoder.compress(chunk)
+    
+    def finish(self) -> bytes:
+        return b"" if self._encoder is None else self._encoder.finish()
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Файл только для записи, отдающий записанное по частям
+    
+    tell() продолжает расти после выдачи данных, поэтому смещения групп строк
+    в метаданных Parquet остаются верными.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class _ParquetEncoder:
+    """Каждая пачка записывается отдельной группой строк и сразу отдается"""
+    
+    def __init__(self, compression: str):
+        # pyarrow загружается только для выгрузки Parquet, а не при старте приложения
+        import pyarrow
+        import pyarrow.parquet
+        
+        self._pyarrow = pyarrow
+        self.media_type = "application/vnd.apache.parquet"
+        self.filename = "requests.parquet"
+        self._schema = pyarrow.schema([
+            ("request_id", pyarrow.string()),
+            ("saved_at", pyarrow.timestamp("us")),
+            ("success", pyarrow.bool_()),
+            ("record", pyarrow.string())
+        ])
+        self._sink = _ChunkSink()
+        self._writer = pyarrow.parquet.ParquetWriter(
+            self._sink,
+            self._schema,
+            compression=compression
+        )
+    
+    def encode(self, rows: List[Dict[str, Any]]) -> bytes:
+        saved_at = []
+        for row in rows:
+            try:
+                saved_at.append(datetime.fromisoformat(row["saved_at"]))
+            except (KeyError, TypeError, ValueError):
+                saved_at.append(None)
+        table = self._pyarrow.Table.from_pydict({
+            "request_id": [row["request_id"] for row in rows],
+            "saved_at": saved_at,
+            "success": [row.get("success") for row in rows],
+            "record": [orjson.dumps(row).decode() for row in rows]
+        }, schema=self._schema)
+        self._writer.write_table(table)
+        return self._sink.drain()
+    
+    def finish(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+def make_export_encoder(fmt: str = "ndjson", compression: str = "gzip", level: int = 6):
+    """
+    Создает кодировщик выгрузки
+    
+    Args:
+        fmt: ndjson или parquet
+        compression: none, gzip или zstd (для parquet - кодек внутри файла)
+        level: Уровень сжатия NDJSON
+    
+    Raises:
+        ExportError: Если формат или сжатие не поддерживаются в окружении
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Неизвестный формат выгрузки: {fmt}")
+    if compression not in EXPORT_COMPRESSIONS:
+        raise ExportError(f"Неизвестное сжатие выгрузки: {compression}")
+    
+    if fmt == "parquet":
+        try:
+            return _ParquetEncoder(compression)
+        except ImportError:
+            raise ExportError("Формат parquet требует пакет pyarrow")
+    
+    try:
+        return _NdjsonEncoder(compression, level)
+    except ValueError as e:
+        raise ExportError(str(e))
+
+
+async def iter_batches(
+    client,
+    batch_size: int = 1000,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    match: str = "request:*"
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Обходит записи запросов пачками
+    
+    Args:
+        client: Клиент Redis, ShardedRedis или RedisCluster
+        batch_size: Ключей в одном SCAN/MGET
+        since: Нижняя граница saved_at включительно
+        until: Верхняя граница saved_at не включительно
+        match: Шаблон ключей
+    
+    Yields:
+        Записи пачки с добавленным request_id (пустые пачки пропускаются)
+    """
+    since, until = _local_naive(since), _local_naive(until)
+    # RedisCluster не выполняет MGET по ключам разных слотов одной командой
+    mget = getattr(client, "mget_nonatomic", client.mget)
+    
+    async def fetch(keys: List[str]) -> List[Tuple[str, Any]]:
+        return list(zip(keys, await mget(keys)))
+    
+    def decode(pairs: List[Tuple[str, Any]]) -> List[Dict[str, Any]]:
+        rows = []
+        for key, value in pairs:
+            if value is None:
+                # Ключ истек между SCAN и MGET
+                continue
+            record = orjson.loads(value)
+            if since is not None or until is not None:
+                try:
+                    saved_at = datetime.fromisoformat(record["saved_at"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if since is not None and saved_at < since:
+                    continue
+                if until is not None and saved_at >= until:
+                    continue
+            rows.append({"request_id": request_id_from_key(key), **record})
+        return rows
+    
+    pending: Optional[asyncio.Task] = None
+    keys: List[str] = []
+    try:
+        async for key in client.scan_iter(match=match, count=batch_size):
+            keys.append(key)
+            if len(keys) < batch_size:
+                continue
+            # Следующая пачка читается, пока предыдущая кодируется и отправляется
+            previous, pending = pending, asyncio.create_task(fetch(keys))
+            keys = []
+            if previous is not None:
+                rows = await asyncio.to_thread(decode, await previous)
+                if rows:
+                    yield rows
+        
+        if pending is not None:
+            rows = await asyncio.to_thread(decode, await pending)
+            pending = None
+            if rows:
+                yield rows
+        if keys:
+            rows = await asyncio.to_thread(decode, await fetch(keys))
+            if rows:
+                yield rows
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+
+async def iter_archived_batches(
+    path: str,
+    batch_size: int = 1000,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Обходит записи архива истории пачками
+    
+    Сегменты читаются в отдельном потоке, чтобы чтение с диска не
+    блокировало event loop.
+    
+    Args:
+        path: Каталог сегментов архива
+        batch_size: Записей в пачке
+        since: Нижняя граница saved_at включительно
+        until: Верхняя граница saved_at не включительно
+    
+    Yields:
+        Записи пачки с добавленным request_id
+    """
+    since, until = _local_naive(since), _local_naive(until)
+    segments = await asyncio.to_thread(open_segments, path)
+    records = iter_archived(
+        segments,
+        since.timestamp() if since is not None else None,
+        until.timestamp() if until is not None else None
+    )
+    
+    def next_rows() -> List[Dict[str, Any]]:
+        return [
+            {"request_id": request_id, **orjson.loads(value)}
+            for request_id, _, value in islice(records, batch_size)
+        ]
+    
+    try:
+        while True:
+            rows = await asyncio.to_thread(next_rows)
+            if not rows:
+                break
+            yield rows
+    finally:
+        records.close()
+        for segment in segments:
+            segment.close()
+
+
+async def export_records(
+    client,
+    encoder,
+    batch_size: int = 1000,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    archive_path: Optional[str] = None
+) -> AsyncIterator[bytes]:
+    """
+    Выгружает записи запросов фрагментами выбранного формата
+    
+    Сначала выгружаются записи Redis, затем архива: запись, перенесенная в
+    архив во время выгрузки, не теряется, но может встретиться дважды с
+    одним request_id. Разбор и кодирование пачек выполняются в отдельном
+    потоке, чтобы длинная выгрузка не задерживала event loop основного API.
+    
+    Args:
+        client: Клиент Redis, выделенный для выгрузки
+        encoder: Кодировщик из make_export_encoder
+        batch_size: Ключей в одном SCAN/MGET
+        since: Нижняя граница saved_at включительно
+        until: Верхняя граница saved_at не включительно
+        archive_path: Каталог архива истории, если архив включен
+    """
+    started = time.perf_counter()
+    exported = 0
+    sources = [iter_batches(client, batch_size, since, until)]
+    if archive_path is not None:
+        sources.append(iter_archived_batches(archive_path, batch_size, since, until))
+    for source in sources:
+        async for rows in source:
+            exported += len(rows)
+            chunk = await asyncio.to_thread(encoder.encode, rows)
+            if chunk:
+                yield chunk
+    tail = await asyncio.to_thread(encoder.finish)
+    if tail:
+        yield tail
+    logger.info(f"Выгружено записей: {exported} за {time.perf_counter() - started:.1f} с")
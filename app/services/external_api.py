@@ -1,11 +1,17 @@
 """
 Сервис для работы с внешними API
 """
-import httpx
 import logging
-from typing import Optional
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
 from app.config import settings
 from app.models.schemas import ExternalApiResponse
+from app.tracing import tracer
+from app.deadline import DeadlineExceeded, bound_timeout
+
+if TYPE_CHECKING:
+    import httpx
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +22,43 @@ class ExternalApiService:
     def __init__(self):
         self.base_url = settings.external_api_url
         self.timeout = settings.external_api_timeout
+        self._client: Optional["httpx.AsyncClient"] = None
+    
+    def _get_client(self) -> "httpx.AsyncClient":
+        """Возвращает HTTP клиента с пулом соединений, создавая его при первом вызове"""
+        if self._client is None:
+            import httpx
+            
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                event_hooks={"request": [_attach_trace_hook]}
+            )
+        return self._client
+    
+    async def warmup(self) -> bool:
+        """
+        Создает HTTP клиента и открывает соединение с внешним API
+        
+        Первый запрос пользователя не платит ни за импорт httpx, ни за
+        установку TCP/TLS соединения: оно остается в пуле клиента.
+        
+        Returns:
+            bool: True если соединение установлено
+        """
+        client = self._get_client()
+        try:
+            with tracer.span("external_api.WARMUP", url=self.base_url):
+                await client.head(self.base_url)
+            return True
+        except Exception as e:
+            logger.warning(f"Не удалось прогреть соединение с внешним API: {str(e)}")
+            return False
+    
+    async def close(self):
+        """Закрывает HTTP клиента и его пул соединений"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
     
     async def get_cat_fact(self) -> Optional[ExternalApiResponse]:
         """
@@ -24,20 +67,31 @@ class ExternalApiService:
         Returns:
             ExternalApiResponse или None в случае ошибки
         """
+        import httpx
+        
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                logger.info(f"Запрос к внешнему API: {self.base_url}")
-                response = await client.get(self.base_url)
-                response.raise_for_status()
-                
-                data = response.json()
-                logger.info(f"Получен ответ от внешнего API: {data}")
-                
-                return ExternalApiResponse(
-                    fact=data.get("fact", ""),
-                    length=data.get("length", 0)
-                )
-                
+            # Таймаут ограничивается оставшимся бюджетом запроса
+            timeout = bound_timeout(self.timeout)
+        except DeadlineExceeded:
+            logger.warning(f"Дедлайн запроса истек, внешний API не вызывается: {self.base_url}")
+            return None
+        
+        try:
+            client = self._get_client()
+            logger.info(f"Запрос к внешнему API: {self.base_url}")
+            with tracer.span("external_api.get", url=self.base_url) as span:
+                response = await client.get(self.base_url, timeout=timeout)
+                span.set_attribute("http.status_code", response.status_code)
+            response.raise_for_status()
+            
+            data = response.json()
+            logger.info(f"Получен ответ от внешнего API: {data}")
+            
+            return ExternalApiResponse(
+                fact=data.get("fact", ""),
+                length=data.get("length", 0)
+            )
+        
         except httpx.TimeoutException:
             logger.error(f"Таймаут при запросе к внешнему API: {self.base_url}")
             return None
@@ -47,3 +101,41 @@ class ExternalApiService:
         except Exception as e:
             logger.error(f"Неожиданная ошибка при запросе к внешнему API: {str(e)}")
             return None
+
+
+async def _attach_trace_hook(request: "httpx.Request"):
+    """
+    Event hook httpx: подключает trace-расширение httpcore к запросу,
+    чтобы разделить время установки соединения и время передачи данных
+    """
+    if not tracer.is_recording():
+        return
+    request.extensions["trace"] = _HttpTimings().on_event
+
+
+class _HttpTimings:
+    """Собирает события httpcore в спаны connect и transfer"""
+    
+    def __init__(self):
+        self.connect_start: Optional[int] = None
+        self.connect_end: Optional[int] = None
+        self.transfer_start: Optional[int] = None
+    
+    async def on_event(self, event_name: str, info: dict):
+        now = time.time_ns()
+        if event_name == "connection.connect_tcp.started":
+            self.connect_start = now
+        elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            self.connect_end = now
+        elif event_name.endswith(".send_request_headers.started"):
+            self.transfer_start = now
+            if self.connect_start is not None and self.connect_end is not None:
+                tracer.record("external_api.connect", self.connect_start, self.connect_end)
+        elif event_name.endswith(".receive_response_body.complete") and self.transfer_start is not None:
+            tracer.record("external_api.transfer", self.transfer_start, now)
+
+
+@lru_cache()
+def get_external_api_service() -> ExternalApiService:
+    """Общий экземпляр ExternalApiService, создается при первом обращении"""
+    return ExternalApiService()
@@ -0,0 +1,123 @@
+"""
+Локальное резервное хранилище записей на время недоступности Redis
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class FallbackStore:
+    """
+    Ограниченный append-only журнал записей в SQLite
+    
+    Пока Redis недоступен, RedisService складывает сюда ключ, значение и момент
+    истечения TTL. После восстановления подключения записи вычитываются
+    пачками в порядке добавления и удаляются после успешной отправки в Redis.
+    При переполнении вытесняются самые старые записи.
+    """
+    
+    def __init__(self, path: str, max_records: int = 100_000):
+        self.path = path
+        self.max_records = max_records
+        self._conn: Optional[sqlite3.Connection] = None
+        self._count = 0
+        self._lock = asyncio.Lock()
+    
+    def _open(self) -> sqlite3.Connection:
+        """Открывает (и при необходимости создает) файл журнала"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "key TEXT NOT NULL, "
+                "value TEXT NOT NULL, "
+                "expire_at REAL NOT NULL)"
+            )
+            self._count = conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+            self._conn = conn
+        return self._conn
+    
+    def _append(self, key: str, value: str, expire_at: float) -> int:
+        conn = self._open()
+        dropped = 0
+        conn.execute("BEGIN")
+        try:
+            if self._count >= self.max_records:
+                dropped = self._count - self.max_records + 1
+                conn.execute(
+                    "DELETE FROM records WHERE id IN "
+                    "(SELECT id FROM records ORDER BY id LIMIT ?)",
+                    (dropped,)
+                )
+            conn.execute(
+                "INSERT INTO records (key, value, expire_at) VALUES (?, ?, ?)",
+                (key, value, expire_at)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._count += 1 - dropped
+        return dropped
+    
+    def _read_batch(self, limit: int) -> List[Tuple[int, str, str, float]]:
+        conn = self._open()
+        return conn.execute(
+            "SELECT id, key, value, expire_at FROM records ORDER BY id LIMIT ?",
+            (limit,)
+        ).fetchall()
+    
+    def _delete_upto(self, last_id: int) -> None:
+        conn = self._open()
+        deleted = conn.execute("DELETE FROM records WHERE id <= ?", (last_id,)).rowcount
+        self._count = max(self._count - deleted, 0)
+    
+    async def append(self, key: str, value: str, ttl_seconds: float) -> None:
+        """
+        Добавляет запись в журнал
+        
+        Args:
+            key: Ключ Redis
+            value: Сериализованное значение
+            ttl_seconds: Время жизни записи в секундах
+        """
+        async with self._lock:
+            dropped = await asyncio.to_thread(
+                self._append, key, value, time.time() + ttl_seconds
+            )
+        if dropped:
+            logger.warning(f"Резервное хранилище переполнено, вытеснено записей: {dropped}")
+    
+    async def read_batch(self, limit: int) -> List[Tuple[int, str, str, float]]:
+        """
+        Возвращает самые старые записи журнала
+        
+        Args:
+            limit: Максимальное количество записей
+        
+        Returns:
+            List: Кортежи (id, key, value, expire_at)
+        """
+        async with self._lock:
+            return await asyncio.to_thread(self._read_batch, limit)
+    
+    async def delete_upto(self, last_id: int) -> None:
+        """Удаляет из журнала все записи с id не больше last_id"""
+        async with self._lock:
+            await asyncio.to_thread(self._delete_upto, last_id)
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def close(self) -> None:
+        """Закрывает файл журнала"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -1,100 +1,382 @@
 """
 Сервис для работы с Redis
 """
-import redis.asyncio as redis
+import asyncio
 import json
 import logging
-from typing import Optional, Dict, Any
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional, Dict, Any
 from datetime import datetime, timedelta
 from app.config import settings
+from app.services.archive import SegmentArchive, history_index_key, record_saved_at
+from app.services.fallback_store import FallbackStore
+from app.services.redis_sharding import ShardedRedis, key_partition, request_id_from_key, request_key
+from app.tracing import tracer
+from app.deadline import DeadlineExceeded, with_deadline
+
+if TYPE_CHECKING:
+    import redis.asyncio as redis
 
 logger = logging.getLogger(__name__)
 
 
+def create_redis_client(max_connections: Optional[int] = None):
+    """
+    Создает клиента Redis согласно settings.redis_mode
+    
+    Каждый клиент получает собственный пул соединений, поэтому отдельный
+    клиент (например, для выгрузки) не занимает соединения основного.
+    
+    Args:
+        max_connections: Ограничение пула соединений каждого узла
+    """
+    import redis.asyncio as redis
+    
+    options = {"decode_responses": True}
+    if max_connections is not None:
+        options["max_connections"] = max_connections
+    
+    if settings.redis_mode == "cluster":
+        from urllib.parse import urlparse
+        from redis.asyncio.cluster import ClusterNode, RedisCluster
+        
+        nodes = [urlparse(url) for url in settings.redis_nodes]
+        return RedisCluster(
+            startup_nodes=[ClusterNode(node.hostname, node.port or 6379) for node in nodes],
+            **options
+        )
+    
+    if settings.redis_mode == "sharded":
+        return ShardedRedis(
+            {url: redis.Redis.from_url(url, **options) for url in settings.redis_nodes},
+            vnodes=settings.redis_ring_vnodes
+        )
+    
+    if settings.redis_mode != "standalone":
+        raise ValueError(f"Неизвестный режим Redis: {settings.redis_mode}")
+    
+    return redis.Redis(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        db=settings.redis_db,
+        **options
+    )
+
+
 class RedisService:
     """Сервис для работы с Redis"""
     
-    def __init__(self):
-        self.redis_client: Optional[redis.Redis] = None
+    def __init__(
+        self,
+        fallback_store: Optional[FallbackStore] = None,
+        archive: Optional[SegmentArchive] = None
+    ):
+        self.redis_client: Optional["redis.Redis"] = None
+        if fallback_store is None:
+            fallback_store = FallbackStore(
+                settings.fallback_store_path,
+                max_records=settings.fallback_store_max_records
+            )
+        self.fallback_store = fallback_store
+        # Архив истории; запрос, не найденный в Redis, ищется в нем
+        self.archive = archive
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._probe_task: Optional[asyncio.Task] = None
+        self._auto_reconnect = False
     
-    async def connect(self):
-        """Подключение к Redis"""
+    @staticmethod
+    def _partition(request_id: str) -> int:
+        """Раздел ключей записи"""
+        return key_partition(request_id, settings.redis_key_partitions)
+    
+    @staticmethod
+    def _key(request_id: str) -> str:
+        """Ключ записи; в режимах шардирования с хеш-тегом раздела ключей"""
+        if settings.redis_mode == "standalone":
+            return request_key(request_id)
+        return request_key(request_id, RedisService._partition(request_id))
+    
+    def _create_client(self):
+        """Создает клиента Redis согласно settings.redis_mode"""
+        return create_redis_client()
+    
+    async def _open_client(self) -> bool:
+        """
+        Создает клиента Redis и проверяет подключение
+        
+        Шардированный клиент считается подключенным, если отвечает хотя бы один
+        узел: записи на недоступные шарды попадут в резервное хранилище.
+        Ошибки конфигурации не перехватываются.
+        """
+        self.redis_client = self._create_client()
         try:
-            self.redis_client = redis.Redis(
-                host=settings.redis_host,
-                port=settings.redis_port,
-                db=settings.redis_db,
-                decode_responses=True
-            )
-            # Проверяем подключение
-            await self.redis_client.ping()
-            logger.info("Успешное подключение к Redis")
+            with tracer.span("redis.PING"):
+                if isinstance(self.redis_client, ShardedRedis):
+                    await self._ping_shards(self.redis_client)
+                else:
+                    await asyncio.wait_for(self.redis_client.ping(), settings.redis_ping_timeout)
+            logger.info(f"Успешное подключение к Redis (режим {settings.redis_mode})")
+            return True
         except Exception as e:
             logger.error(f"Ошибка подключения к Redis: {str(e)}")
             self.redis_client = None
+            return False
+    
+    @staticmethod
+    async def _ping_shards(client: ShardedRedis):
+        import redis.asyncio as redis
+        
+        available = await client.available_nodes()
+        if not available:
+            raise redis.ConnectionError("Ни один узел Redis не отвечает")
+        down = [node for node in client.clients if node not in available]
+        if down:
+            logger.warning(f"Недоступны узлы Redis: {', '.join(down)}")
+    
+    async def connect(self):
+        """Подключение к Redis, при неудаче запускается фоновое переподключение"""
+        self._auto_reconnect = True
+        if await self._open_client():
+            await self._replay_fallback()
+        else:
+            self._schedule_reconnect()
     
     async def disconnect(self):
         """Отключение от Redis"""
+        self._auto_reconnect = False
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        if self._probe_task:
+            self._probe_task.cancel()
+            self._probe_task = None
         if self.redis_client:
             await self.redis_client.close()
             logger.info("Отключение от Redis")
+        self.fallback_store.close()
+    
+    def _schedule_reconnect(self):
+        """Запускает фоновое переподключение, если оно еще не запущено"""
+        if not self._auto_reconnect:
+            return
+        if self._reconnect_task and not self._reconnect_task.done():
+            return
+        self._reconnect_task = asyncio.create_task(self._reconnect_loop())
+    
+    async def _reconnect_loop(self):
+        """Переподключается к Redis с экспоненциальной задержкой"""
+        delay = settings.redis_reconnect_min_delay
+        while self._auto_reconnect:
+            await asyncio.sleep(delay)
+            if await self._restore():
+                await self._replay_fallback()
+                return
+            delay = min(delay * 2, settings.redis_reconnect_max_delay)
+    
+    async def _restore(self) -> bool:
+        """Для шардированного клиента ждет ответа всех узлов, иначе создает клиента заново"""
+        if isinstance(self.redis_client, ShardedRedis):
+            try:
+                await asyncio.wait_for(self.redis_client.ping(), settings.redis_ping_timeout)
+            except Exception:
+                return False
+            logger.info("Все узлы Redis снова доступны")
+            return True
+        return await self._open_client()
+    
+    def _schedule_probe(self):
+        """Запускает проверку зависшего Redis, если она еще не запущена"""
+        if self._probe_task and not self._probe_task.done():
+            return
+        self._probe_task = asyncio.create_task(self._probe())
     
-    async def save_request(self, request_id: str, data: Dict[str, Any], ttl_hours: int = 24) -> bool:
+    async def _probe(self):
+        """
+        Проверяет Redis после записи, прерванной дедлайном
+        
+        Зависший Redis не отклоняет соединения, а не отвечает; если он не
+        ответил на PING за redis_ping_timeout, подключение считается
+        потерянным и записи идут в резервное хранилище.
+        """
+        client = self.redis_client
+        if client is None:
+            return
+        try:
+            with tracer.span("redis.PING"):
+                await asyncio.wait_for(client.ping(), settings.redis_ping_timeout)
+        except Exception as e:
+            if self.redis_client is client:
+                logger.error(f"Redis не отвечает: {str(e) or type(e).__name__}")
+                await self._handle_failure()
+    
+    async def _handle_failure(self):
+        """Помечает подключение потерянным и запускает переподключение"""
+        if isinstance(self.redis_client, ShardedRedis):
+            # Узлы независимы: клиент остается, записи на доступные шарды
+            # продолжаются, а переподключение ждет восстановления остальных
+            self._schedule_reconnect()
+            return
+        client, self.redis_client = self.redis_client, None
+        if client is not None:
+            try:
+                await client.close()
+            except Exception:
+                pass
+        self._schedule_reconnect()
+    
+    async def _replay_fallback(self):
+        """Переносит накопленные в резервном хранилище записи в Redis пачками"""
+        import redis.asyncio as redis
+        
+        replayed = 0
+        while self.redis_client:
+            batch = await self.fallback_store.read_batch(settings.fallback_replay_batch_size)
+            if not batch:
+                break
+            
+            now = time.time()
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for _, key, value, expire_at in batch:
+                    ttl = int(expire_at - now)
+                    if ttl > 0:
+                        pipe.setex(key, ttl, value)
+                        if self.archive is not None:
+                            # Возраст для архива - исходное время сохранения, а не переноса
+                            request_id = request_id_from_key(key)
+                            pipe.zadd(
+                                history_index_key(self._partition(request_id)),
+                                {request_id: record_saved_at(value, now)}
+                            )
+                with tracer.span("redis.PIPELINE", commands=len(pipe)):
+                    await pipe.execute()
+            except (redis.ConnectionError, redis.TimeoutError) as e:
+                logger.error(f"Потеряно подключение к Redis при переносе резервных записей: {str(e)}")
+                await self._handle_failure()
+                break
+            except Exception as e:
+                logger.error(f"Ошибка переноса резервных записей в Redis: {str(e)}")
+                break
+            
+            await self.fallback_store.delete_upto(batch[-1][0])
+            replayed += len(batch)
+        
+        if replayed:
+            logger.info(f"Перенесено в Redis резервных записей: {replayed}")
+    
+    async def _buffer(self, key: str, value: str, ttl: timedelta):
+        """Сохраняет запись в резервное хранилище"""
+        # Локальная запись занимает миллисекунды и не ограничивается дедлайном:
+        # иначе при зависшем Redis запись терялась бы вместе с бюджетом
+        try:
+            await self.fallback_store.append(key, value, ttl.total_seconds())
+            logger.warning(f"Redis недоступен, запись {key} сохранена в резервное хранилище")
+        except Exception as e:
+            logger.error(f"Ошибка сохранения в резервное хранилище: {str(e)}")
+    
+    async def save_request(
+        self,
+        request_id: str,
+        data: Dict[str, Any],
+        ttl_hours: Optional[float] = None
+    ) -> bool:
         """
         Сохраняет данные запроса в Redis
         
+        Если Redis недоступен или не ответил до истечения дедлайна запроса,
+        запись попадает в резервное хранилище и будет перенесена в Redis после
+        переподключения.
+        
         Args:
             request_id: Уникальный ID запроса
             data: Данные для сохранения
-            ttl_hours: Время жизни записи в часах
-            
+            ttl_hours: Время жизни записи в часах, по умолчанию redis_request_ttl_hours
+        
         Returns:
-            bool: True если успешно сохранено
+            bool: True если успешно сохранено в Redis
         """
+        import redis.asyncio as redis
+        
+        key = self._key(request_id)
+        if ttl_hours is None:
+            ttl_hours = settings.redis_request_ttl_hours
+        ttl = timedelta(hours=ttl_hours)
+        saved_at = datetime.now()
+        data_with_timestamp = {
+            **data,
+            "saved_at": saved_at.isoformat()
+        }
+        value = json.dumps(data_with_timestamp, ensure_ascii=False)
+        
         if not self.redis_client:
-            logger.warning("Redis не подключен, данные не сохранены")
+            if not self._auto_reconnect:
+                logger.warning("Redis не подключен, данные не сохранены")
+                return False
+            await self._buffer(key, value, ttl)
+            self._schedule_reconnect()
             return False
         
         try:
-            key = f"request:{request_id}"
-            data_with_timestamp = {
-                **data,
-                "saved_at": datetime.now().isoformat()
-            }
-            
-            await self.redis_client.setex(
-                key,
-                timedelta(hours=ttl_hours),
-                json.dumps(data_with_timestamp, ensure_ascii=False)
-            )
+            if self.archive is None:
+                with tracer.span("redis.SETEX", key=key):
+                    await with_deadline(self.redis_client.setex(key, ttl, value))
+            else:
+                # Вместе с записью пополняется индекс времени для архива
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.setex(key, ttl, value)
+                pipe.zadd(history_index_key(self._partition(request_id)), {request_id: saved_at.timestamp()})
+                with tracer.span("redis.PIPELINE", commands=len(pipe)):
+                    await with_deadline(pipe.execute())
             logger.info(f"Данные запроса {request_id} сохранены в Redis")
             return True
+        except DeadlineExceeded:
+            logger.warning(f"Дедлайн запроса истек, данные запроса {request_id} сохраняются в резервное хранилище")
+            await self._buffer(key, value, ttl)
+            self._schedule_probe()
+            return False
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            logger.error(f"Потеряно подключение к Redis: {str(e)}")
+            await self._buffer(key, value, ttl)
+            await self._handle_failure()
+            return False
         except Exception as e:
             logger.error(f"Ошибка сохранения в Redis: {str(e)}")
             return False
     
     async def get_request(self, request_id: str) -> Optional[Dict[str, Any]]:
         """
-        Получает данные запроса из Redis
+        Получает данные запроса из Redis, а при их отсутствии из архива
         
         Args:
             request_id: Уникальный ID запроса
-            
+        
         Returns:
             Dict с данными или None если не найдено
         """
         if not self.redis_client:
             logger.warning("Redis не подключен")
-            return None
+            return self._get_archived(request_id)
         
         try:
-            key = f"request:{request_id}"
-            data = await self.redis_client.get(key)
+            key = self._key(request_id)
+            with tracer.span("redis.GET", key=key):
+                data = await self.redis_client.get(key)
             if data:
                 return json.loads(data)
-            return None
         except Exception as e:
             logger.error(f"Ошибка получения данных из Redis: {str(e)}")
+        return self._get_archived(request_id)
+    
+    def _get_archived(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """Ищет запрос в архиве истории"""
+        if self.archive is None:
+            return None
+        try:
+            with tracer.span("archive.GET", request_id=request_id):
+                return self.archive.get(request_id)
+        except Exception as e:
+            logger.error(f"Ошибка получения данных из архива: {str(e)}")
             return None
     
     async def is_healthy(self) -> bool:
@@ -103,7 +385,14 @@ class RedisService:
             return False
         
         try:
-            await self.redis_client.ping()
+            with tracer.span("redis.PING"):
+                await self.redis_client.ping()
             return True
         except Exception:
             return False
+
+
+@lru_cache()
+def get_redis_service() -> RedisService:
+    """Общий экземпляр RedisService, создается при первом обращении"""
+    return RedisService()
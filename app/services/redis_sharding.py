@@ -0,0 +1,243 @@
+"""
+Клиентское шардирование Redis на консистентном хешировании
+
+ShardedRedis повторяет используемую RedisService часть интерфейса клиента
+redis.asyncio.Redis и распределяет ключи по нескольким независимым узлам.
+Как и в Redis Cluster, шард выбирается по хеш-тегу ключа (часть в фигурных
+скобках), поэтому запись и связанные с ней ключи попадают на один узел.
+"""
+import asyncio
+import hashlib
+from bisect import bisect
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+
+def hash_tag(key: str) -> str:
+    """
+    Возвращает часть ключа, по которой выбирается шард
+    
+    Правило совпадает с Redis Cluster: если в ключе есть непустая подстрока
+    между первой "{" и следующей за ней "}", хешируется только она.
+    """
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def key_partition(request_id: str, partitions: int) -> int:
+    """Раздел ключей запроса: записи раздела и его индекс имеют общий хеш-тег"""
+    return _hash(request_id) % partitions
+
+
+def partition_tag(partition: int) -> str:
+    """Хеш-тег раздела ключей"""
+    return f"{{p{partition}}}"
+
+
+def request_key(request_id: str, partition: Optional[int] = None) -> str:
+    """
+    Ключ записи запроса
+    
+    Args:
+        request_id: ID запроса
+        partition: Раздел ключей (см. key_partition); в режимах шардирования
+            ключ получает хеш-тег раздела, чтобы запись и ее элемент индекса
+            времени располагались на одном шарде
+    """
+    if partition is not None:
+        return f"request:{partition_tag(partition)}:{request_id}"
+    return f"request:{request_id}"
+
+
+def request_id_from_key(key: str) -> str:
+    """ID запроса из ключа записи, обратное к request_key"""
+    request_id = key.split(":", 1)[1]
+    if request_id.startswith("{"):
+        request_id = request_id[request_id.index("}") + 2:]
+    return request_id
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Кольцо консистентного хеширования с виртуальными узлами
+    
+    При добавлении или удалении узла переезжает только около 1/N ключей.
+    
+    Args:
+        nodes: Имена узлов
+        vnodes: Количество точек каждого узла на кольце
+    """
+    
+    def __init__(self, nodes: List[str], vnodes: int = 160):
+        if not nodes:
+            raise ValueError("Кольцо хеширования требует хотя бы один узел")
+        points = sorted(
+            (_hash(f"{node}#{i}"), node)
+            for node in nodes
+            for i in range(vnodes)
+        )
+        self._points = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+    
+    def node_for(self, key: str) -> str:
+        """Узел, отвечающий за ключ"""
+        index = bisect(self._points, _hash(hash_tag(key)))
+        return self._nodes[index % len(self._nodes)]
+
+
+class ShardedRedis:
+    """
+    Клиент поверх нескольких независимых узлов Redis
+    
+    Args:
+        clients: Клиенты узлов по именам (например, по URL)
+        vnodes: Количество виртуальных узлов на кольце
+    """
+    
+    def __init__(self, clients: Dict[str, Any], vnodes: int = 160):
+        self.clients = dict(clients)
+        self.ring = HashRing(list(self.clients), vnodes)
+    
+    def client_for(self, key: str):
+        """Клиент шарда, отвечающего за ключ"""
+        return self.clients[self.ring.node_for(key)]
+    
+    async def ping(self) -> bool:
+        """Проверяет все узлы; ошибка любого узла пробрасывается"""
+        await asyncio.gather(*(client.ping() for client in self.clients.values()))
+        return True
+    
+    async def available_nodes(self) -> List[str]:
+        """Узлы, ответившие на PING"""
+        nodes = list(self.clients)
+        replies = await asyncio.gather(
+            *(self.clients[node].ping() for node in nodes),
+            return_exceptions=True
+        )
+        return [node for node, reply in zip(nodes, replies) if not isinstance(reply, BaseException)]
+    
+    async def setex(self, key: str, ttl, value):
+        return await self.client_for(key).setex(key, ttl, value)
+    
+    async def get(self, key: str):
+        return await self.client_for(key).get(key)
+    
+    async def delete(self, key: str):
+        return await self.client_for(key).delete(key)
+    
+    async def zadd(self, key: str, mapping: Dict[str, float]):
+        return await self.client_for(key).zadd(key, mapping)
+    
+    async def zrangebyscore(self, key: str, min, max, start: Optional[int] = None,
+                            num: Optional[int] = None, withscores: bool = False):
+        return await self.client_for(key).zrangebyscore(
+            key, min, max, start=start, num=num, withscores=withscores
+        )
+    
+    async def zrem(self, key: str, *members: str):
+        return await self.client_for(key).zrem(key, *members)
+    
+    async def mget(self, keys: List[str]) -> List[Any]:
+        """MGET с разбиением ключей по шардам; значения в исходном порядке"""
+        groups: Dict[str, List[int]] = {}
+        for index, key in enumerate(keys):
+            groups.setdefault(self.ring.node_for(key), []).append(index)
+        
+        nodes = list(groups)
+        replies = await asyncio.gather(*(
+            self.clients[node].mget([keys[index] for index in groups[node]])
+            for node in nodes
+        ))
+        results: List[Any] = [None] * len(keys)
+        for node, values in zip(nodes, replies):
+            for index, value in zip(groups[node], values):
+                results[index] = value
+        return results
+    
+    async def scan_iter(self, match: Optional[str] = None, count: Optional[int] = None) -> AsyncIterator[str]:
+        """Обходит ключи всех шардов по очереди"""
+        for client in self.clients.values():
+            async for key in client.scan_iter(match=match, count=count):
+                yield key
+    
+    def pipeline(self, transaction: bool = False) -> "ShardedPipeline":
+        """Пайплайн, группирующий команды по шардам"""
+        return ShardedPipeline(self, transaction)
+    
+    async def close(self):
+        await asyncio.gather(
+            *(client.close() for client in self.clients.values()),
+            return_exceptions=True
+        )
+
+
+class ShardedPipeline:
+    """
+    Пайплайн ShardedRedis
+    
+    Команды накапливаются в порядке вызова, при execute разбиваются по шардам
+    и отправляются одним пайплайном на каждый шард параллельно. Результаты
+    возвращаются в исходном порядке команд.
+    """
+    
+    def __init__(self, sharded: ShardedRedis, transaction: bool = False):
+        self._sharded = sharded
+        self._transaction = transaction
+        self._commands: List[Tuple[str, str, tuple]] = []
+    
+    def __len__(self) -> int:
+        return len(self._commands)
+    
+    def _add(self, name: str, key: str, *args) -> "ShardedPipeline":
+        self._commands.append((self._sharded.ring.node_for(key), name, (key, *args)))
+        return self
+    
+    def setex(self, key: str, ttl, value) -> "ShardedPipeline":
+        return self._add("setex", key, ttl, value)
+    
+    def get(self, key: str) -> "ShardedPipeline":
+        return self._add("get", key)
+    
+    def delete(self, key: str) -> "ShardedPipeline":
+        return self._add("delete", key)
+    
+    def zadd(self, key: str, mapping: Dict[str, float]) -> "ShardedPipeline":
+        return self._add("zadd", key, mapping)
+    
+    def zrangebyscore(self, key: str, min, max, start: Optional[int] = None,
+                      num: Optional[int] = None, withscores: bool = False) -> "ShardedPipeline":
+        return self._add("zrangebyscore", key, min, max, start, num, withscores)
+    
+    def zrem(self, key: str, *members: str) -> "ShardedPipeline":
+        return self._add("zrem", key, *members)
+    
+    async def execute(self) -> List[Any]:
+        groups: Dict[str, List[int]] = {}
+        for index, (node, _, _) in enumerate(self._commands):
+            groups.setdefault(node, []).append(index)
+        
+        async def run(node: str, indexes: List[int]):
+            pipe = self._sharded.clients[node].pipeline(transaction=self._transaction)
+            for index in indexes:
+                _, name, args = self._commands[index]
+                getattr(pipe, name)(*args)
+            return await pipe.execute()
+        
+        nodes = list(groups)
+        try:
+            replies = await asyncio.gather(*(run(node, groups[node]) for node in nodes))
+        finally:
+            self._commands = []
+        
+        results: List[Any] = [None] * sum(len(indexes) for indexes in groups.values())
+        for node, node_results in zip(nodes, replies):
+            for index, result in zip(groups[node], node_results):
+                results[index] = result
+        return results
@@ -0,0 +1,353 @@
+"""
+Легковесная трассировка запросов
+
+Контекст трассировки передается через contextvar, поэтому спаны, открытые в
+сервисах, автоматически становятся дочерними для спана middleware. Если
+запрос не попал в выборку, span() возвращает общий пустой объект и почти
+ничего не стоит.
+
+Независимо от выборки спаны могут суммировать длительность этапов в словарь,
+открытый через collect_stages() (его использует журнал медленных запросов).
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+
+def collect_stages() -> Dict[str, float]:
+    """
+    Включает сбор длительности этапов для текущего контекста
+    
+    Returns:
+        Dict: Словарь "имя спана -> суммарная длительность в мс", который
+        заполняется по мере завершения спанов
+    """
+    stages: Dict[str, float] = {}
+    _stage_timings.set(stages)
+    return stages
+
+
+def _add_stage(name: str, duration_ms: float):
+    stages = _stage_timings.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + duration_ms
+
+
+class Span:
+    """Отдельный участок работы внутри трассы"""
+    
+    __slots__ = (
+        "trace_id", "span_id", "parent_id", "name",
+        "start_ns", "end_ns", "attributes", "_trace"
+    )
+    
+    def __init__(self, name: str, trace: List["Span"], trace_id: str,
+                 parent_id: Optional[str] = None, start_ns: Optional[int] = None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self._trace = trace
+    
+    @property
+    def duration_ms(self) -> float:
+        """Длительность спана в миллисекундах"""
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1_000_000
+    
+    def set_attribute(self, key: str, value: Any):
+        """Добавляет атрибут к спану"""
+        self.attributes[key] = value
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Представление спана для JSON ответа"""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes
+        }
+
+
+class _NoopSpan:
+    """Пустой спан для запросов вне выборки"""
+    
+    trace_id = None
+    span_id = None
+    
+    def set_attribute(self, key: str, value: Any):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _StageScope:
+    """Замеряет длительность этапа для запроса вне выборки трассировки"""
+    
+    __slots__ = ("name", "stages", "_start")
+    
+    def __init__(self, name: str, stages: Dict[str, float]):
+        self.name = name
+        self.stages = stages
+        self._start = 0.0
+    
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return NOOP_SPAN
+    
+    def __exit__(self, exc_type, exc, tb):
+        elapsed_ms = (time.perf_counter() - self._start) * 1000
+        self.stages[self.name] = self.stages.get(self.name, 0.0) + elapsed_ms
+        return False
+
+
+class _SpanScope:
+    """Контекстный менеджер, делающий спан текущим"""
+    
+    __slots__ = ("tracer", "span", "_token")
+    
+    def __init__(self, tracer: "Tracer", span: Span):
+        self.tracer = tracer
+        self.span = span
+        self._token = None
+    
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self.span)
+        return self.span
+    
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.span.set_attribute("error", repr(exc))
+        self.tracer._finish(self.span)
+        return False
+
+
+class RingBufferSink:
+    """Хранит последние завершенные трассы в памяти"""
+    
+    def __init__(self, max_traces: int = 1000):
+        self._traces: Deque[List[Span]] = deque(maxlen=max_traces)
+    
+    def export(self, spans: List[Span]):
+        self._traces.append(spans)
+    
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Возвращает последние трассы, начиная с самой свежей
+        
+        Args:
+            limit: Максимальное количество трасс
+        
+        Returns:
+            List: Трассы со списками спанов
+        """
+        traces = list(self._traces)[-limit:] if limit > 0 else []
+        return [
+            {
+                "trace_id": spans[0].trace_id,
+                "spans": [span.to_dict() for span in spans]
+            }
+            for spans in reversed(traces)
+        ]
+
+
+class OtlpHttpSink:
+    """
+    Отправляет трассы в OTLP/HTTP коллектор в формате JSON
+    
+    Спаны копятся в ограниченной очереди и отправляются пачками из фоновой
+    задачи, поэтому обработка запроса не ждет коллектор. При переполнении
+    очереди трассы отбрасываются.
+    """
+    
+    def __init__(self, endpoint: str, service_name: str,
+                 max_queue: int = 10_000, batch_size: int = 512):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+    
+    def export(self, spans: List[Span]):
+        for span in spans:
+            try:
+                self._queue.put_nowait(span)
+            except asyncio.QueueFull:
+                logger.warning("Очередь OTLP экспорта переполнена, спаны отброшены")
+                return
+    
+    def start(self):
+        """Запускает фоновую отправку"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Останавливает фоновую отправку"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+    
+    async def _run(self):
+        import httpx
+        
+        async with httpx.AsyncClient(timeout=5) as client:
+            while True:
+                batch = [await self._queue.get()]
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                try:
+                    response = await client.post(self.endpoint, json=self._encode(batch))
+                    response.raise_for_status()
+                except Exception as e:
+                    logger.error(f"Ошибка отправки трасс в OTLP коллектор: {str(e)}")
+    
+    def _encode(self, spans: List[Span]) -> Dict[str, Any]:
+        """Формирует тело запроса ExportTraceServiceRequest"""
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "app.tracing"},
+                    "spans": [
+                        {
+                            "traceId": span.trace_id,
+                            "spanId": span.span_id,
+                            "parentSpanId": span.parent_id or "",
+                            "name": span.name,
+                            "kind": 2 if span.parent_id is None else 1,
+                            "startTimeUnixNano": str(span.start_ns),
+                            "endTimeUnixNano": str(span.end_ns),
+                            "attributes": [
+                                _otlp_attribute(key, value)
+                                for key, value in span.attributes.items()
+                            ]
+                        }
+                        for span in spans
+                    ]
+                }]
+            }]
+        }
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Tracer:
+    """Создает спаны и передает завершенные трассы в подключенные приемники"""
+    
+    def __init__(self, sample_rate: float = 0.0):
+        self.sample_rate = sample_rate
+        self.sinks: List[Any] = []
+    
+    def add_sink(self, sink):
+        """Подключает приемник трасс (объект с методом export(spans))"""
+        self.sinks.append(sink)
+    
+    def start_trace(self, name: str, **attributes):
+        """
+        Начинает новую трассу с учетом выборки
+        
+        Args:
+            name: Имя корневого спана
+            **attributes: Атрибуты корневого спана
+        
+        Returns:
+            Контекстный менеджер, возвращающий спан или NOOP_SPAN
+        """
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return NOOP_SPAN
+        span = Span(name, [], os.urandom(16).hex())
+        span.attributes.update(attributes)
+        return _SpanScope(self, span)
+    
+    def span(self, name: str, **attributes):
+        """
+        Открывает дочерний спан текущей трассы
+        
+        Args:
+            name: Имя спана
+            **attributes: Атрибуты спана
+        
+        Returns:
+            Контекстный менеджер, возвращающий спан или NOOP_SPAN
+        """
+        parent = _current_span.get()
+        if parent is None:
+            stages = _stage_timings.get()
+            if stages is None:
+                return NOOP_SPAN
+            return _StageScope(name, stages)
+        span = Span(name, parent._trace, parent.trace_id, parent.span_id)
+        span.attributes.update(attributes)
+        return _SpanScope(self, span)
+    
+    def record(self, name: str, start_ns: int, end_ns: int, **attributes):
+        """Добавляет в текущую трассу уже завершенный спан с заданными границами"""
+        _add_stage(name, (end_ns - start_ns) / 1_000_000)
+        parent = _current_span.get()
+        if parent is None:
+            return
+        span = Span(name, parent._trace, parent.trace_id, parent.span_id, start_ns=start_ns)
+        span.end_ns = end_ns
+        span.attributes.update(attributes)
+        parent._trace.append(span)
+    
+    def current_span(self) -> Optional[Span]:
+        """Текущий спан или None, если запрос не трассируется"""
+        return _current_span.get()
+    
+    def is_recording(self) -> bool:
+        """Записываются ли спаны или длительности этапов в текущем контексте"""
+        return _current_span.get() is not None or _stage_timings.get() is not None
+    
+    def _finish(self, span: Span):
+        span.end_ns = time.time_ns()
+        span._trace.append(span)
+        if span.parent_id is not None:
+            _add_stage(span.name, span.duration_ms)
+        else:
+            for sink in self.sinks:
+                try:
+                    sink.export(span._trace)
+                except Exception as e:
+                    logger.error(f"Ошибка экспорта трассы: {str(e)}")
+
+
+# Глобальный трассировщик и буфер последних трасс
+tracer = Tracer(sample_rate=settings.tracing_sample_rate)
+ring_buffer_sink = RingBufferSink(max_traces=settings.tracing_ring_buffer_size)
+tracer.add_sink(ring_buffer_sink)
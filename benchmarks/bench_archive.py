@@ -0,0 +1,80 @@
+"""
+Бенчмарк архива истории запросов
+
+Переносит записи в сегменты пачками заданного размера, затем сливает их и
+измеряет скорость записи, слияния и случайного чтения по ID из сегментов,
+отображенных в память.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_archive --records 200000 --batch-size 1000
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+
+from app.services.archive import SegmentArchive
+
+
+def _value(i: int) -> bytes:
+    return json.dumps({
+        "input_data": {"user_id": i, "action": "buy", "amount": i * 0.5},
+        "processed_data": {"data_keys": ["user_id", "action", "amount"], "transformation_applied": True},
+        "external_api_data": {"fact": "Cats sleep 70% of their lives.", "length": 31},
+        "success": True
+    }).encode()
+
+
+def _lookups(archive: SegmentArchive, ids, lookups: int) -> float:
+    started = time.perf_counter()
+    for request_id in random.choices(ids, k=lookups):
+        archive.get(request_id)
+    return lookups / (time.perf_counter() - started)
+
+
+async def main_async(args):
+    now = time.time()
+    ids = [f"req-{i:08d}" for i in range(args.records)]
+    with tempfile.TemporaryDirectory() as path:
+        archive = SegmentArchive(
+            path,
+            segment_max_records=args.records,
+            compact_min_segments=2
+        )
+        archive.open()
+        
+        started = time.perf_counter()
+        for offset in range(0, args.records, args.batch_size):
+            batch = ids[offset:offset + args.batch_size]
+            await archive.append([(request_id, now, _value(offset)) for request_id in batch])
+        write_rate = args.records / (time.perf_counter() - started)
+        segments = archive.stats()["segments"]
+        lookup_before = _lookups(archive, ids, args.lookups)
+        
+        started = time.perf_counter()
+        while await archive.compact():
+            pass
+        compact_rate = args.records / (time.perf_counter() - started)
+        lookup_after = _lookups(archive, ids, args.lookups)
+        stats = archive.stats()
+        archive.close()
+    
+    print(f"запись:   {write_rate:>10.0f} записей/с, сегментов {segments}")
+    print(f"слияние:  {compact_rate:>10.0f} записей/с, сегментов {stats['segments']}, "
+          f"{stats['bytes'] / 1e6:.1f} MB")
+    print(f"чтение до слияния:    {lookup_before:>10.0f} запросов/с")
+    print(f"чтение после слияния: {lookup_after:>10.0f} запросов/с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк архива истории запросов")
+    parser.add_argument("--records", type=int, default=200_000, help="Записей в архиве")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Записей в одном сегменте при переносе")
+    parser.add_argument("--lookups", type=int, default=20_000, help="Случайных чтений по ID")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
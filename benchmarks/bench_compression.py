@@ -0,0 +1,90 @@
+"""
+Бенчмарк сжатия ответов POST /process_data/
+
+Для тел ответа разного размера показывает количество байт на проводе и
+процессорное время потокового сжатия для каждой доступной кодировки.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_compression --sizes 1 16 256 2048
+"""
+import argparse
+import json
+import random
+import string
+import time
+from datetime import datetime
+
+from app.compression import available_encodings, make_encoder
+
+CHUNK_SIZE = 64 * 1024
+
+
+def make_response_body(target_kb: int) -> bytes:
+    """Строит тело ответа process_data примерно заданного размера"""
+    rng = random.Random(42)
+    data = {}
+    size = 0
+    i = 0
+    while size < target_kb * 1024 * 0.85:
+        value = {
+            "user_id": rng.randint(1, 10 ** 6),
+            "action": rng.choice(["buy", "sell", "hold"]),
+            "amount": round(rng.random() * 1000, 2),
+            "comment": "".join(rng.choices(string.ascii_letters + " ", k=40))
+        }
+        data[f"item_{i}"] = value
+        size += len(json.dumps(value)) + 10
+        i += 1
+    response = {
+        "success": True,
+        "message": "Данные успешно обработаны",
+        "processed_data": {
+            "original_data": data,
+            "processed_at": datetime.now().isoformat(),
+            "data_keys": list(data.keys()),
+            "data_type": "dict",
+            "transformation_applied": True
+        },
+        "external_api_data": {"fact": "Cats sleep 70% of their lives.", "length": 31},
+        "timestamp": datetime.now().isoformat(),
+        "request_id": "a1b2c3d4-e5f6-7890-abcd-ef1234567890"
+    }
+    return json.dumps(response, ensure_ascii=False).encode()
+
+
+def compress_streaming(body: bytes, encoding: str, level: int) -> int:
+    """Сжимает тело фрагментами, как это делает middleware, и возвращает размер"""
+    encoder = make_encoder(encoding, level)
+    total = 0
+    for offset in range(0, len(body), CHUNK_SIZE):
+        total += len(encoder.compress(body[offset:offset + CHUNK_SIZE]))
+    return total + len(encoder.finish())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сжатия ответов")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 16, 256, 2048],
+                        help="Размеры тела ответа в КБ")
+    parser.add_argument("--repeat", type=int, default=20, help="Повторов на измерение")
+    args = parser.parse_args()
+
+    levels = {"gzip": [1, 6, 9], "br": [1, 4, 9], "zstd": [1, 3, 9]}
+    print(f"{'size':>9} {'encoding':>9} {'level':>5} {'wire bytes':>11} {'ratio':>6} "
+          f"{'cpu ms':>8} {'MB/s':>8}")
+    for size_kb in args.sizes:
+        body = make_response_body(size_kb)
+        print(f"{len(body):>9} {'identity':>9} {'-':>5} {len(body):>11} {1.0:>6.2f} {0.0:>8.3f} {'-':>8}")
+        for encoding in available_encodings():
+            for level in levels[encoding]:
+                repeat = max(1, args.repeat * 256 // max(size_kb, 256))
+                started = time.process_time()
+                for _ in range(repeat):
+                    wire = compress_streaming(body, encoding, level)
+                cpu = (time.process_time() - started) / repeat
+                throughput = len(body) / cpu / 1e6 if cpu > 0 else float("inf")
+                print(f"{len(body):>9} {encoding:>9} {level:>5} {wire:>11} "
+                      f"{len(body) / wire:>6.2f} {cpu * 1000:>8.3f} {throughput:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Бенчмарк выгрузки истории запросов
+
+Прогоняет export_records по узлу Redis в памяти (или по реальному Redis через
+--url) и показывает записей в секунду и размер результата для каждого формата.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_export --records 200000
+    python -m benchmarks.bench_export --url redis://127.0.0.1:6379/0
+"""
+import argparse
+import asyncio
+import fnmatch
+import json
+import time
+from datetime import datetime, timedelta
+
+from app.services.export import ExportError, export_records, make_export_encoder
+
+
+class MemoryRedis:
+    """Узел Redis в памяти с SCAN и MGET"""
+    
+    def __init__(self, records: int):
+        started = datetime(2024, 1, 1)
+        self.data = {}
+        for i in range(records):
+            record = {
+                "input_data": {"user_id": i, "action": "buy", "amount": i * 0.5},
+                "processed_data": {"data_keys": ["user_id", "action", "amount"], "transformation_applied": True},
+                "external_api_data": {"fact": "Cats sleep 70% of their lives.", "length": 31},
+                "success": True,
+                "saved_at": (started + timedelta(seconds=i)).isoformat()
+            }
+            self.data[f"request:{i:08d}"] = json.dumps(record)
+    
+    async def scan_iter(self, match=None, count=None):
+        for index, key in enumerate(self.data):
+            if match is None or fnmatch.fnmatchcase(key, match):
+                yield key
+            if count and index % count == 0:
+                await asyncio.sleep(0)
+    
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+    
+    async def close(self):
+        pass
+
+
+async def main_async(args):
+    if args.url:
+        import redis.asyncio as redis
+        make_client = lambda: redis.Redis.from_url(args.url, decode_responses=True)
+    else:
+        memory = MemoryRedis(args.records)
+        make_client = lambda: memory
+    
+    print(f"{'format':>8} {'compression':>11} {'records/s':>10} {'MB':>8}")
+    for fmt, compression in [("ndjson", "none"), ("ndjson", "gzip"), ("ndjson", "zstd"),
+                             ("parquet", "zstd")]:
+        try:
+            encoder = make_export_encoder(fmt, compression)
+        except ExportError as e:
+            print(f"{fmt:>8} {compression:>11} пропущено: {e}")
+            continue
+        client = make_client()
+        size = 0
+        started = time.perf_counter()
+        async for chunk in export_records(client, encoder, args.batch_size):
+            size += len(chunk)
+        elapsed = time.perf_counter() - started
+        await client.close()
+        records = args.records if not args.url else await _count(args.url)
+        print(f"{fmt:>8} {compression:>11} {records / elapsed:>10.0f} {size / 1e6:>8.1f}")
+
+
+async def _count(url: str) -> int:
+    import redis.asyncio as redis
+    client = redis.Redis.from_url(url)
+    try:
+        return sum([1 async for _ in client.scan_iter(match="request:*", count=1000)])
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк выгрузки истории запросов")
+    parser.add_argument("--records", type=int, default=200_000, help="Записей в узле в памяти")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Ключей в одном SCAN/MGET")
+    parser.add_argument("--url", default="", help="URL реального Redis вместо узла в памяти")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
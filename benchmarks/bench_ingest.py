@@ -0,0 +1,163 @@
+"""
+Бенчмарк приема данных: POST /process_data/ против WebSocket /ingest/
+
+Сервер запускается в отдельном процессе uvicorn; внешний API и Redis в нем
+заменены заглушками, чтобы измерялись только транспорт и конвейер
+обработки. HTTP клиент держит keep-alive соединения с заданным числом
+конкурентных запросов, WebSocket клиент держит в обработке до
+max_in_flight сообщений на соединение.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_ingest --messages 5000 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+PAYLOAD = {"data": {"user_id": 123, "action": "buy", "amount": 100.5, "tags": ["a", "b"]}}
+
+
+def serve(port: int):
+    """Запускает приложение с заглушками внешнего API и Redis"""
+    import logging
+    import uvicorn
+    
+    from app.models.schemas import ExternalApiResponse
+    from app.services.external_api import ExternalApiService
+    from app.services.redis_service import RedisService
+    
+    fact = ExternalApiResponse(fact="Cats sleep 70% of their lives.", length=31)
+    
+    async def get_cat_fact(self):
+        return fact
+    
+    async def save_request(self, request_id, data, ttl_hours=24):
+        return True
+    
+    async def noop(self):
+        pass
+    
+    ExternalApiService.get_cat_fact = get_cat_fact
+    ExternalApiService.warmup = noop
+    RedisService.save_request = save_request
+    RedisService.connect = noop
+    
+    from app.main import app
+    
+    # Логи каждого запроса влияют на оба варианта одинаково, но шумят в выводе
+    logging.disable(logging.INFO)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(base: str, timeout: float = 15.0):
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(f"{base}/api/v1/health/", timeout=0.5):
+                return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.05)
+    raise TimeoutError("Сервер не запустился")
+
+
+async def bench_http(base: str, messages: int, concurrency: int) -> float:
+    import httpx
+    
+    body = json.dumps(PAYLOAD)
+    headers = {"Content-Type": "application/json"}
+    counter = iter(range(messages))
+    
+    async with httpx.AsyncClient(
+        base_url=base,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    ) as client:
+        async def worker():
+            for _ in counter:
+                response = await client.post("/api/v1/process_data/", content=body, headers=headers)
+                response.raise_for_status()
+        
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return messages / (time.perf_counter() - started)
+
+
+async def bench_websocket(base: str, messages: int, connections: int) -> float:
+    from websockets.asyncio.client import connect
+    
+    url = base.replace("http://", "ws://") + "/api/v1/ingest/"
+    per_connection = messages // connections
+    
+    async def producer():
+        async with connect(url, max_size=None) as websocket:
+            window = json.loads(await websocket.recv())["max_in_flight"]
+            credits = asyncio.Semaphore(window)
+            
+            async def send_all():
+                for i in range(per_connection):
+                    await credits.acquire()
+                    await websocket.send(json.dumps({"id": i, **PAYLOAD}))
+            
+            sender = asyncio.create_task(send_all())
+            for _ in range(per_connection):
+                reply = json.loads(await websocket.recv())
+                if "error" in reply:
+                    raise RuntimeError(reply["error"])
+                credits.release()
+            await sender
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(producer() for _ in range(connections)))
+    return per_connection * connections / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк HTTP и WebSocket приема данных")
+    parser.add_argument("--messages", type=int, default=5000, help="Сообщений на вариант")
+    parser.add_argument("--concurrency", type=int, default=32, help="Конкурентных HTTP запросов")
+    parser.add_argument("--connections", type=int, default=1, help="WebSocket соединений")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.serve:
+        serve(args.serve)
+        return
+    
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_ingest", "--serve", str(port)],
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    )
+    try:
+        _wait_ready(base)
+        # Прогрев обоих путей
+        asyncio.run(bench_http(base, 200, args.concurrency))
+        asyncio.run(bench_websocket(base, 200, args.connections))
+        
+        http_rate = asyncio.run(bench_http(base, args.messages, args.concurrency))
+        ws_rate = asyncio.run(bench_websocket(base, args.messages, args.connections))
+    finally:
+        server.terminate()
+        server.wait()
+    
+    print(f"{'transport':>10} {'messages/s':>11}")
+    print(f"{'http':>10} {http_rate:>11.0f}")
+    print(f"{'websocket':>10} {ws_rate:>11.0f}")
+    print(f"WebSocket быстрее HTTP в {ws_rate / http_rate:.2f} раза")
+
+
+if __name__ == "__main__":
+    main()
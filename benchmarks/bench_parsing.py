@@ -0,0 +1,105 @@
+"""
+Бенчмарк разбора тела POST /process_data/
+
+Сравнивает прежний путь FastAPI (json.loads, валидация ProcessDataRequest,
+повторная валидация и jsonable_encoder для response_model) с новым (проверка
+ограничений, orjson, model_dump_json) на документах разной формы. Отдельно
+показана стоимость только разбора тела.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_parsing --size-kb 256
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+
+from app.api.parsing import decode_json
+from app.models.schemas import ProcessDataRequest, ProcessDataResponse
+from app.services.data_processor import DataProcessorService
+
+
+def make_shapes(size_kb: int) -> dict:
+    """Документы примерно одного размера, но разной структуры"""
+    target = size_kb * 1024
+    flat = {f"key_{i}": i for i in range(target // 16)}
+    records = [
+        {"id": i, "name": f"user_{i}", "tags": ["a", "b"], "score": i * 0.5}
+        for i in range(target // 64)
+    ]
+    deep: dict = {"leaf": "x" * 32}
+    for _ in range(60):
+        deep = {"child": deep, "pad": "y" * (target // 60 // 2)}
+    strings = {f"text_{i}": "lorem ipsum dolor " * 50 for i in range(target // 920)}
+    return {
+        "flat_keys": flat,
+        "array_of_objects": {"records": records},
+        "deep_nesting": deep,
+        "long_strings": strings
+    }
+
+
+def bench(fn, body: bytes, min_time: float) -> float:
+    """Возвращает пропускную способность в МБ/с"""
+    runs = 0
+    started = time.perf_counter()
+    while True:
+        fn(body)
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return len(body) * runs / elapsed / 1e6
+
+
+def _response(data: dict, construct) -> ProcessDataResponse:
+    return construct(
+        success=True,
+        message="Данные успешно обработаны",
+        processed_data=DataProcessorService._transform_data(None, data),
+        external_api_data=None,
+        timestamp=datetime.now(),
+        request_id="a1b2c3d4-e5f6-7890-abcd-ef1234567890"
+    )
+
+
+def old_parse(body: bytes):
+    return ProcessDataRequest(**json.loads(body)).data
+
+
+def new_parse(body: bytes):
+    return decode_json(body, max_depth=64, max_keys=10 ** 7)["data"]
+
+
+def old_roundtrip(body: bytes):
+    response = _response(old_parse(body), ProcessDataResponse)
+    # Так FastAPI обрабатывает модель, возвращенную из эндпоинта с response_model
+    validated = ProcessDataResponse.model_validate(response.model_dump())
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False).encode()
+
+
+def new_roundtrip(body: bytes):
+    return _response(new_parse(body), ProcessDataResponse.model_construct).model_dump_json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора тела запроса")
+    parser.add_argument("--size-kb", type=int, default=256, help="Примерный размер документа, КБ")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Время на измерение, с")
+    args = parser.parse_args()
+
+    print(f"{'shape':>18} {'bytes':>9} | {'parse old':>9} {'new':>7} | "
+          f"{'roundtrip old':>13} {'new':>7} {'speedup':>8}   (MB/s)")
+    for name, data in make_shapes(args.size_kb).items():
+        body = json.dumps({"data": data}).encode()
+        parse_old = bench(old_parse, body, args.min_time)
+        parse_new = bench(new_parse, body, args.min_time)
+        round_old = bench(old_roundtrip, body, args.min_time)
+        round_new = bench(new_roundtrip, body, args.min_time)
+        print(f"{name:>18} {len(body):>9} | {parse_old:>9.1f} {parse_new:>7.1f} | "
+              f"{round_old:>13.1f} {round_new:>7.1f} {round_new / round_old:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Бенчмарк масштабирования записи по шардам Redis
+
+Несколько конкурентных писателей отправляют пачки SETEX через ShardedRedis,
+пайплайн которого группирует команды по шардам. По умолчанию узлы - модели
+Redis в памяти: команды узла выполняются последовательно (один поток, как у
+Redis) с заданной стоимостью, а сетевая задержка пайплайна - параллельно.
+С --nodes используются реальные redis-server (первые 1, 2, ... N из списка).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_sharding --shards 1 2 4 8
+    python -m benchmarks.bench_sharding --nodes redis://127.0.0.1:7000/0 redis://127.0.0.1:7001/0
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from app.config import settings
+from app.services.redis_sharding import ShardedRedis, key_partition, request_key
+
+
+class SimulatedNode:
+    """Узел Redis в памяти с последовательной обработкой команд"""
+    
+    def __init__(self, command_cost: float, rtt: float):
+        self.command_cost = command_cost
+        self.rtt = rtt
+        self.data = {}
+        self._lock = asyncio.Lock()
+    
+    async def _serve(self, count: int):
+        await asyncio.sleep(self.rtt)
+        async with self._lock:
+            # Узел занят пачкой целиком; другие узлы в это время работают
+            # параллельно, как отдельные процессы redis-server
+            await asyncio.sleep(self.command_cost * count)
+    
+    def pipeline(self, transaction: bool = False):
+        return SimulatedPipeline(self)
+    
+    async def close(self):
+        pass
+
+
+class SimulatedPipeline:
+    def __init__(self, node: SimulatedNode):
+        self.node = node
+        self.commands = []
+    
+    def setex(self, key, ttl, value):
+        self.commands.append((key, value))
+        return self
+    
+    async def execute(self):
+        await self.node._serve(len(self.commands))
+        self.node.data.update(self.commands)
+        return [True] * len(self.commands)
+
+
+def _key(request_id: str) -> str:
+    return request_key(request_id, key_partition(request_id, settings.redis_key_partitions))
+
+
+async def run_writers(client: ShardedRedis, writers: int, batches: int, batch_size: int) -> float:
+    """Записывает writers * batches * batch_size записей, возвращает записей в секунду"""
+    value = json.dumps({"data": {"key": "value" * 20}, "saved_at": "2024-01-01T00:00:00"})
+    
+    keys = [
+        [[_key(str(uuid.uuid4())) for _ in range(batch_size)] for _ in range(batches)]
+        for _ in range(writers)
+    ]
+    
+    async def writer(writer_keys):
+        for batch in writer_keys:
+            pipe = client.pipeline(transaction=False)
+            for key in batch:
+                pipe.setex(key, 3600, value)
+            await pipe.execute()
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(writer(writer_keys) for writer_keys in keys))
+    return writers * batches * batch_size / (time.perf_counter() - started)
+
+
+async def main_async(args):
+    if args.nodes:
+        import redis.asyncio as redis
+        configurations = [args.nodes[:count] for count in range(1, len(args.nodes) + 1)]
+    else:
+        configurations = [[f"sim://node{i}" for i in range(count)] for count in args.shards]
+    
+    print(f"{'shards':>6} {'records/s':>11} {'speedup':>8}")
+    baseline = None
+    for nodes in configurations:
+        if args.nodes:
+            clients = {url: redis.Redis.from_url(url) for url in nodes}
+        else:
+            clients = {
+                name: SimulatedNode(args.command_us / 1e6, args.rtt_ms / 1e3)
+                for name in nodes
+            }
+        client = ShardedRedis(clients)
+        try:
+            rate = await run_writers(client, args.writers, args.batches, args.batch_size)
+        finally:
+            await client.close()
+        baseline = baseline or rate
+        print(f"{len(nodes):>6} {rate:>11.0f} {rate / baseline:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк записи по шардам Redis")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Количество моделируемых шардов")
+    parser.add_argument("--nodes", nargs="*", default=[],
+                        help="URL реальных узлов Redis вместо моделей")
+    parser.add_argument("--writers", type=int, default=32, help="Конкурентных писателей")
+    parser.add_argument("--batches", type=int, default=20, help="Пачек на писателя")
+    parser.add_argument("--batch-size", type=int, default=100, help="Записей в пачке")
+    parser.add_argument("--command-us", type=float, default=20.0,
+                        help="Стоимость команды на моделируемом узле, мкс")
+    parser.add_argument("--rtt-ms", type=float, default=0.5,
+                        help="Сетевая задержка пайплайна до моделируемого узла, мс")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
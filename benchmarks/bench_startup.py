@@ -0,0 +1,94 @@
+"""
+Бенчмарк холодного старта
+
+Измеряет время импорта app.main в чистом интерпретаторе и время от запуска
+uvicorn до первого успешного ответа /health/ (liveness) и /ready/ (readiness).
+/ready/ отвечает 200 только при подключенном Redis, поэтому он должен быть
+запущен.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def measure_import() -> float:
+    """Время импорта app.main в новом процессе, секунды"""
+    output = subprocess.check_output([sys.executable, "-c", IMPORT_SNIPPET], text=True)
+    return float(output.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ok(url: str, started: float, timeout: float) -> float:
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=0.5) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.005)
+    raise TimeoutError(f"{url} не ответил за {timeout} с")
+
+
+def measure_first_request(timeout: float) -> tuple:
+    """Время до первого ответа /health/ и /ready/ после запуска uvicorn, секунды"""
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}/api/v1"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    )
+    try:
+        live = _wait_ok(f"{base}/health/", started, timeout)
+        ready = _wait_ok(f"{base}/ready/", started, timeout)
+        return live, ready
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного старта приложения")
+    parser.add_argument("--runs", type=int, default=5, help="Количество повторов")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Таймаут ожидания ответа, с")
+    args = parser.parse_args()
+
+    imports, lives, readies = [], [], []
+    for _ in range(args.runs):
+        imports.append(measure_import())
+        live, ready = measure_first_request(args.timeout)
+        lives.append(live)
+        readies.append(ready)
+
+    def fmt(values):
+        return f"median {statistics.median(values) * 1000:8.1f} ms   min {min(values) * 1000:8.1f} ms"
+
+    print(f"import app.main        {fmt(imports)}")
+    print(f"first /health/ (live)  {fmt(lives)}")
+    print(f"first /ready/          {fmt(readies)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 """
 Unit тесты для API эндпоинтов
 """
+import time
 import pytest
 import httpx
 from fastapi.testclient import TestClient
@@ -9,6 +10,7 @@ from datetime import datetime
 
 from app.main import app
 from app.models.schemas import ExternalApiResponse
+from app.services.redis_service import get_redis_service
 
 client = TestClient(app)
 
@@ -80,6 +82,37 @@ class TestProcessDataEndpoint:
         )
         
         assert response.status_code == 422  # Validation error
+    
+    def test_process_data_malformed_json(self):
+        """Тест с некорректным JSON"""
+        response = client.post(
+            "/api/v1/process_data/",
+            content=b'{"data": {',
+            headers={"Content-Type": "application/json"}
+        )
+        
+        assert response.status_code == 422
+    
+    def test_process_data_too_deep(self):
+        """Тест отказа для слишком глубоко вложенного документа"""
+        with patch('app.config.settings.request_max_json_depth', 5):
+            response = client.post(
+                "/api/v1/process_data/",
+                content=b'{"data": ' + b'{"a": ' * 10 + b'1' + b'}' * 10 + b'}',
+                headers={"Content-Type": "application/json"}
+            )
+        
+        assert response.status_code == 422
+    
+    def test_process_data_body_too_large(self):
+        """Тест отказа для слишком большого тела запроса"""
+        with patch('app.config.settings.request_max_body_size', 100):
+            response = client.post(
+                "/api/v1/process_data/",
+                json={"data": {"key": "x" * 200}}
+            )
+        
+        assert response.status_code == 413
 
 
 class TestHealthCheckEndpoint:
@@ -115,6 +148,137 @@ class TestHealthCheckEndpoint:
             assert data["status"] == "degraded"
 
 
+class TestReadinessEndpoint:
+    """Тесты для GET /ready/ эндпоинта"""
+    
+    def test_not_ready_before_warmup(self):
+        """Тест 503 до завершения прогрева подключений"""
+        app.state.ready = False
+        
+        response = client.get("/api/v1/ready/")
+        
+        assert response.status_code == 503
+        assert response.json()["status"] == "starting"
+    
+    def test_ready_after_warmup(self):
+        """Тест готовности после прогрева в lifespan"""
+        async def connect(self):
+            self.redis_client = AsyncMock()
+        
+        with patch('app.services.redis_service.RedisService.connect', connect), \
+             patch('app.services.external_api.ExternalApiService.warmup', new_callable=AsyncMock) as mock_warmup, \
+             TestClient(app) as lifespan_client:
+            for _ in range(50):
+                response = lifespan_client.get("/api/v1/ready/")
+                if response.status_code == 200:
+                    break
+                time.sleep(0.01)
+            get_redis_service().redis_client = None
+        
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
+        mock_warmup.assert_awaited_once()
+    
+    def test_warmup_failure_logged(self):
+        """Тест: ошибка прогрева записывается в лог, а не теряется в фоновой задаче"""
+        async def connect(self):
+            raise ValueError("invalid redis url")
+        
+        with patch('app.services.redis_service.RedisService.connect', connect), \
+             patch('app.main.logger') as mock_logger, \
+             TestClient(app) as lifespan_client:
+            for _ in range(50):
+                if mock_logger.error.called:
+                    break
+                time.sleep(0.01)
+            response = lifespan_client.get("/api/v1/ready/")
+        
+        assert response.status_code == 503
+        assert "invalid redis url" in mock_logger.error.call_args[0][0]
+    
+    def test_not_ready_without_redis(self):
+        """Тест 503 после прогрева, если подключение к Redis не установлено"""
+        app.state.ready = True
+        try:
+            with patch.object(get_redis_service(), 'redis_client', None):
+                response = client.get("/api/v1/ready/")
+        finally:
+            app.state.ready = False
+        
+        assert response.status_code == 503
+        assert response.json()["status"] == "redis_unavailable"
+        assert response.json()["redis_connected"] is False
+
+
+class TestTracesEndpoint:
+    """Тесты для GET /admin/traces/ эндпоинта"""
+    
+    def test_traces_recorded_when_sampled(self):
+        """Тест появления трассы запроса в кольцевом буфере"""
+        with patch('app.tracing.tracer.sample_rate', 1.0), \
+             patch('app.services.redis_service.RedisService.is_healthy') as mock_health:
+            mock_health.return_value = True
+            
+            response = client.get("/api/v1/health/")
+        
+        trace_id = response.headers["X-Trace-ID"]
+        with patch('app.config.settings.admin_token', 'secret'):
+            traces = client.get("/api/v1/admin/traces/", headers={"X-Admin-Token": "secret"}).json()["traces"]
+        
+        assert any(trace["trace_id"] == trace_id for trace in traces)
+    
+    def test_traces_require_admin_token(self):
+        """Тест: трассы недоступны без административного токена"""
+        with patch('app.config.settings.admin_token', 'secret'):
+            assert client.get("/api/v1/admin/traces/").status_code == 403
+        assert client.get("/api/v1/traces/").status_code == 404
+
+
+class TestAdminEndpoints:
+    """Тесты для административных эндпоинтов диагностики"""
+    
+    def test_admin_requires_token(self):
+        """Тест отказа в доступе без административного токена"""
+        with patch('app.config.settings.admin_token', "secret"):
+            response = client.get("/api/v1/admin/event_loop/")
+        
+        assert response.status_code == 403
+    
+    def test_slow_requests_capture_stages(self):
+        """Тест журнала медленных запросов с разбивкой по этапам"""
+        mock_external_response = ExternalApiResponse(fact="Test fact", length=9)
+        
+        with patch('app.config.settings.admin_token', "secret"), \
+             patch('app.services.external_api.ExternalApiService.get_cat_fact') as mock_get_fact, \
+             patch('app.services.redis_service.RedisService.save_request') as mock_save:
+            mock_get_fact.return_value = mock_external_response
+            mock_save.return_value = True
+            
+            # Журнал общий для всех тестов: убираем запросы предыдущих тестов
+            client.delete("/api/v1/admin/slow_requests/", headers={"X-Admin-Token": "secret"})
+            client.post("/api/v1/process_data/", json={"data": {"key": "value"}})
+            response = client.get(
+                "/api/v1/admin/slow_requests/",
+                headers={"X-Admin-Token": "secret"}
+            )
+        
+        assert response.status_code == 200
+        records = [r for r in response.json()["requests"] if r["path"] == "/api/v1/process_data/"]
+        assert records
+        assert "process_data" in records[0]["stages_ms"]
+    
+    def test_profiler_start_stop(self):
+        """Тест запуска и остановки профайлера"""
+        headers = {"X-Admin-Token": "secret"}
+        with patch('app.config.settings.admin_token', "secret"):
+            start = client.post("/api/v1/admin/profiler/start?interval_ms=1", headers=headers)
+            stop = client.post("/api/v1/admin/profiler/stop", headers=headers)
+        
+        assert start.status_code == 200
+        assert stop.status_code == 200
+        assert stop.headers["content-type"].startswith("text/plain")
+
+
 class TestRootEndpoint:
     """Тесты для корневого эндпоинта"""
     
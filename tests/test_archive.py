@@ -0,0 +1,283 @@
+"""
+Unit тесты для архива истории запросов
+"""
+import json
+import os
+import time
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from app.services.archive import (
+    HistoryArchiver,
+    Segment,
+    SegmentArchive,
+    iter_archived,
+    open_segments,
+    write_segment
+)
+from app.services.fallback_store import FallbackStore
+from app.services.redis_service import RedisService
+from app.services.redis_sharding import ShardedRedis
+from tests.test_sharding import FakeRedis
+
+
+def _record(request_id: str, saved_at: float, **extra) -> tuple:
+    value = json.dumps({"request_id": request_id, **extra}).encode()
+    return request_id, saved_at, value
+
+
+class TestSegment:
+    """Тесты для файла-сегмента"""
+    
+    def test_roundtrip_and_lookup(self, tmp_path):
+        """Тест: любая запись находится по ID, отсутствующая дает None"""
+        now = time.time()
+        path = write_segment(
+            str(tmp_path / "1.seg"),
+            [_record(f"id-{i}", now + i, n=i) for i in range(500)]
+        )
+        segment = Segment(path)
+        
+        assert segment.count == 500
+        assert segment.min_saved_at == now
+        assert segment.max_saved_at == now + 499
+        for i in (0, 137, 499):
+            assert json.loads(bytes(segment.get(f"id-{i}")))["n"] == i
+        assert segment.get("missing") is None
+        assert [request_id for _, request_id, _ in segment.records()][:3] == ["id-0", "id-1", "id-2"]
+        segment.close()
+    
+    def test_empty_segment_not_written(self, tmp_path):
+        """Тест: пустой сегмент не создается"""
+        assert write_segment(str(tmp_path / "1.seg"), []) is None
+        assert os.listdir(tmp_path) == []
+
+
+class TestSegmentArchive:
+    """Тесты для набора сегментов"""
+    
+    @pytest.mark.asyncio
+    async def test_newest_version_wins_and_reopen(self, tmp_path):
+        """Тест: при повторном переносе записи возвращается последняя версия, в том числе после перезапуска"""
+        now = time.time()
+        archive = SegmentArchive(str(tmp_path))
+        archive.open()
+        await archive.append([_record("a", now, v=1), _record("b", now, v=1)])
+        await archive.append([_record("a", now, v=2)])
+        
+        assert archive.get("a")["v"] == 2
+        assert archive.get("b")["v"] == 1
+        assert archive.get("c") is None
+        archive.close()
+        
+        reopened = SegmentArchive(str(tmp_path))
+        reopened.open()
+        assert reopened.get("a")["v"] == 2
+        assert reopened.stats()["segments"] == 2
+        reopened.close()
+    
+    @pytest.mark.asyncio
+    async def test_compaction(self, tmp_path):
+        """Тест: мелкие сегменты сливаются без дубликатов и устаревших записей"""
+        now = time.time()
+        archive = SegmentArchive(
+            str(tmp_path),
+            retention_seconds=3600,
+            segment_max_records=100,
+            compact_min_segments=3
+        )
+        archive.open()
+        await archive.append([_record("old", now - 7200), _record("a", now, v=1)])
+        await archive.append([_record("a", now, v=2), _record("b", now)])
+        assert await archive.compact() is False
+        await archive.append([_record("c", now)])
+        
+        assert await archive.compact() is True
+        assert archive.stats()["segments"] == 1
+        assert archive.stats()["records"] == 3
+        assert archive.get("a")["v"] == 2
+        assert archive.get("old") is None
+        assert len(os.listdir(tmp_path)) == 1
+        archive.close()
+    
+    @pytest.mark.asyncio
+    async def test_compaction_crash_keeps_records(self, tmp_path):
+        """Тест: сбой на любом шаге замены сегментов результатом слияния не теряет записи"""
+        now = time.time()
+        archive = SegmentArchive(str(tmp_path), segment_max_records=100, compact_min_segments=2)
+        archive.open()
+        await archive.append([_record("a", now)])
+        await archive.append([_record("b", now)])
+        replace = os.replace
+        
+        def crash_on_merge(source, target):
+            if source.endswith(".merge"):
+                raise OSError("crash")
+            replace(source, target)
+        
+        with patch('app.services.archive.os.replace', crash_on_merge):
+            with pytest.raises(OSError):
+                await archive.compact()
+        archive.close()
+        
+        reopened = SegmentArchive(str(tmp_path))
+        reopened.open()
+        assert reopened.get("a") is not None
+        assert reopened.get("b") is not None
+        reopened.close()
+    
+    @pytest.mark.asyncio
+    async def test_retention(self, tmp_path):
+        """Тест: сегменты старше срока хранения удаляются целиком"""
+        now = time.time()
+        archive = SegmentArchive(str(tmp_path), retention_seconds=3600)
+        archive.open()
+        await archive.append([_record("old", now - 7200)])
+        await archive.append([_record("old-and-new", now - 7200), _record("new", now)])
+        
+        assert await archive.enforce_retention() == 1
+        assert archive.get("old") is None
+        assert archive.get("new") is not None
+        assert len(os.listdir(tmp_path)) == 1
+        archive.close()
+
+
+class TestIterArchived:
+    """Тесты для обхода архива при выгрузке"""
+    
+    @pytest.mark.asyncio
+    async def test_latest_versions_in_range(self, tmp_path):
+        """Тест: каждая запись выдается один раз в последней версии и только в диапазоне"""
+        now = time.time()
+        archive = SegmentArchive(str(tmp_path))
+        archive.open()
+        await archive.append([_record("a", now - 100, v=1), _record("b", now - 100), _record("old", now - 7200)])
+        await archive.append([_record("a", now - 100, v=2), _record("c", now)])
+        
+        segments = open_segments(str(tmp_path))
+        records = {
+            request_id: json.loads(bytes(value))
+            for request_id, _, value in iter_archived(segments, since=now - 3600, until=now)
+        }
+        
+        assert records == {"a": {"request_id": "a", "v": 2}, "b": {"request_id": "b"}}
+        for segment in segments:
+            segment.close()
+        archive.close()
+    
+    @pytest.mark.asyncio
+    async def test_snapshot_survives_compaction(self, tmp_path):
+        """Тест: открытые для выгрузки сегменты читаются после их слияния и удаления"""
+        now = time.time()
+        archive = SegmentArchive(str(tmp_path), segment_max_records=100, compact_min_segments=2)
+        archive.open()
+        await archive.append([_record("a", now)])
+        await archive.append([_record("b", now)])
+        
+        segments = open_segments(str(tmp_path))
+        assert await archive.compact() is True
+        
+        assert sorted(request_id for request_id, _, _ in iter_archived(segments)) == ["a", "b"]
+        for segment in segments:
+            segment.close()
+        archive.close()
+
+
+class TestHistoryArchiver:
+    """Тесты для переноса истории из Redis в архив"""
+    
+    def _service(self, tmp_path, archive, client) -> RedisService:
+        service = RedisService(FallbackStore(str(tmp_path / "fallback.db")), archive=archive)
+        service.redis_client = client
+        return service
+    
+    @pytest.mark.asyncio
+    async def test_moves_aged_records(self, tmp_path):
+        """Тест: возраст берется из индекса времени независимо от TTL записи"""
+        archive = SegmentArchive(str(tmp_path / "archive"))
+        archive.open()
+        node = FakeRedis()
+        service = self._service(tmp_path, archive, node)
+        
+        await service.save_request("old", {"success": True}, ttl_hours=48)
+        await service.save_request("expired", {"success": True})
+        await service.save_request("new", {"success": True}, ttl_hours=0.5)
+        node.data["request:persistent"] = json.dumps({"success": True})
+        two_hours_ago = time.time() - 7200
+        for zset in node.zsets.values():
+            for request_id in ("old", "expired"):
+                if request_id in zset:
+                    zset[request_id] = two_hours_ago
+        await node.delete("request:expired")
+        
+        with patch('app.config.settings.archive_after_minutes', 60):
+            archived = await HistoryArchiver(service, archive).run_once()
+        
+        assert archived == 1
+        assert "request:old" not in node.data
+        assert "request:new" in node.data
+        assert "request:persistent" in node.data
+        assert archive.segments[0].min_saved_at == pytest.approx(two_hours_ago)
+        # В индексе остается только не перенесенная запись
+        assert [member for zset in node.zsets.values() for member in zset] == ["new"]
+        
+        # Прозрачное чтение: из Redis для новых записей, из архива для перенесенных
+        assert (await service.get_request("old"))["success"] is True
+        assert (await service.get_request("new"))["success"] is True
+        assert await service.get_request("expired") is None
+        assert await service.get_request("missing") is None
+        archive.close()
+    
+    @pytest.mark.asyncio
+    async def test_replayed_records_keep_saved_at(self, tmp_path):
+        """Тест: запись из резервного хранилища попадает в индекс с исходным saved_at"""
+        archive = SegmentArchive(str(tmp_path / "archive"))
+        archive.open()
+        saved_at = datetime.now() - timedelta(hours=2)
+        service = self._service(tmp_path, archive, FakeRedis())
+        await service.fallback_store.append(
+            "request:late",
+            json.dumps({"success": True, "saved_at": saved_at.isoformat()}),
+            24 * 3600
+        )
+        
+        await service._replay_fallback()
+        with patch('app.config.settings.archive_after_minutes', 60):
+            archived = await HistoryArchiver(service, archive).run_once()
+        
+        assert archived == 1
+        assert archive.segments[0].min_saved_at == pytest.approx(saved_at.timestamp())
+        archive.close()
+    
+    @pytest.mark.asyncio
+    async def test_sharded_keys(self, tmp_path):
+        """Тест: в режиме шардирования записи и разделы индекса переносятся пачками по шардам"""
+        archive = SegmentArchive(str(tmp_path / "archive"))
+        archive.open()
+        sharded = ShardedRedis({f"redis://node{i}:6379/0": FakeRedis() for i in range(3)})
+        service = self._service(tmp_path, archive, sharded)
+        
+        with patch('app.config.settings.redis_mode', "sharded"), \
+             patch('app.config.settings.redis_key_partitions', 2):
+            for i in range(20):
+                await service.save_request(f"req-{i}", {"success": True})
+            with patch('app.config.settings.archive_after_minutes', 0):
+                archived = await HistoryArchiver(service, archive, batch_size=3).run_once()
+            
+            assert archived == 20
+            assert all(not node.data for node in sharded.clients.values())
+            assert all(not any(node.zsets.values()) for node in sharded.clients.values())
+            assert (await service.get_request("req-7"))["success"] is True
+        archive.close()
+    
+    @pytest.mark.asyncio
+    async def test_archive_used_when_redis_unavailable(self, tmp_path):
+        """Тест: без подключения к Redis запрос читается из архива"""
+        archive = SegmentArchive(str(tmp_path / "archive"))
+        archive.open()
+        await archive.append([_record("abc", time.time(), success=True)])
+        service = self._service(tmp_path, archive, None)
+        
+        assert (await service.get_request("abc"))["success"] is True
+        archive.close()
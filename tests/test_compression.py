@@ -0,0 +1,185 @@
+"""
+Unit тесты для сжатия ответов и распаковки тел запросов
+"""
+import gzip
+import json
+import tracemalloc
+import zlib
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from unittest.mock import patch
+
+from app.compression import CompressionMiddleware, negotiate_encoding
+from app.main import app
+from app.models.schemas import ExternalApiResponse
+
+
+def _make_client(**options) -> TestClient:
+    async def small(request):
+        return PlainTextResponse("ok")
+    
+    async def large(request):
+        return PlainTextResponse("x" * 10_000)
+    
+    async def stream(request):
+        async def chunks():
+            for _ in range(10):
+                yield b"y" * 1000
+        return StreamingResponse(chunks(), media_type="text/plain")
+    
+    async def echo(request):
+        return PlainTextResponse(await request.body())
+    
+    test_app = Starlette(routes=[
+        Route("/small", small),
+        Route("/large", large),
+        Route("/stream", stream),
+        Route("/echo", echo, methods=["POST"])
+    ])
+    test_app.add_middleware(CompressionMiddleware, **options)
+    return TestClient(test_app)
+
+
+class TestNegotiation:
+    """Тесты выбора кодировки"""
+    
+    def test_prefers_server_order_and_respects_q(self):
+        """Тест выбора кодировки по предпочтениям сервера и q-значениям"""
+        assert negotiate_encoding("gzip, br", ["br", "gzip"]) == "br"
+        assert negotiate_encoding("gzip;q=1.0, br;q=0", ["br", "gzip"]) == "gzip"
+        assert negotiate_encoding("identity", ["br", "gzip"]) is None
+        assert negotiate_encoding("*", ["gzip"]) == "gzip"
+
+
+class TestCompressionMiddleware:
+    """Тесты для CompressionMiddleware"""
+    
+    def test_small_response_not_compressed(self):
+        """Тест отправки ответа меньше порога без сжатия"""
+        response = _make_client().get("/small", headers={"Accept-Encoding": "gzip"})
+        
+        assert "content-encoding" not in response.headers
+        assert response.text == "ok"
+    
+    def test_large_response_gzip(self):
+        """Тест сжатия большого ответа gzip"""
+        response = _make_client(preferred=("gzip",)).get("/large", headers={"Accept-Encoding": "gzip"})
+        
+        assert response.headers["content-encoding"] == "gzip"
+        assert int(response.headers["content-length"]) < 10_000
+        assert response.text == "x" * 10_000
+    
+    def test_streaming_response_compressed(self):
+        """Тест потокового сжатия ответа без Content-Length"""
+        response = _make_client(preferred=("gzip",)).get("/stream", headers={"Accept-Encoding": "gzip"})
+        
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert response.text == "y" * 10_000
+    
+    @pytest.mark.parametrize("encoding", ["br", "zstd"])
+    def test_optional_encodings(self, encoding):
+        """Тест сжатия brotli и zstd при наличии библиотек"""
+        pytest.importorskip({"br": "brotli", "zstd": "zstandard"}[encoding])
+        client = _make_client()
+        
+        response = client.get("/large", headers={"Accept-Encoding": encoding})
+        
+        assert response.headers["content-encoding"] == encoding
+    
+    def test_compressed_request_body(self):
+        """Тест распаковки сжатого тела запроса"""
+        response = _make_client().post(
+            "/echo",
+            content=gzip.compress(b"payload"),
+            headers={"Content-Encoding": "gzip"}
+        )
+        
+        assert response.text == "payload"
+    
+    def test_compressed_request_body_too_large(self):
+        """Тест отказа при превышении размера распакованного тела"""
+        response = _make_client(max_request_size=1000).post(
+            "/echo",
+            content=gzip.compress(b"z" * 100_000),
+            headers={"Content-Encoding": "gzip"}
+        )
+        
+        assert response.status_code == 413
+    
+    @pytest.mark.parametrize("encoding", ["gzip", "br", "zstd"])
+    def test_compression_bomb_rejected_without_inflating(self, encoding):
+        """Тест: маленькое тело, распаковывающееся в 64 МБ, отклоняется без выделения памяти под него"""
+        inflated = b"\0" * (64 * 1024 * 1024)
+        if encoding == "br":
+            bomb = pytest.importorskip("brotli").compress(inflated, quality=1)
+        elif encoding == "zstd":
+            bomb = pytest.importorskip("zstandard").ZstdCompressor(level=1).compress(inflated)
+        else:
+            compressor = zlib.compressobj(1, zlib.DEFLATED, 31)
+            bomb = compressor.compress(inflated) + compressor.flush()
+        del inflated
+        client = _make_client(max_request_size=1024 * 1024)
+        
+        tracemalloc.start()
+        try:
+            response = client.post("/echo", content=bomb, headers={"Content-Encoding": encoding})
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        
+        assert response.status_code == 413
+        assert peak < 16 * 1024 * 1024
+    
+    def test_unsupported_request_encoding(self):
+        """Тест отказа для неизвестной кодировки тела запроса"""
+        response = _make_client().post(
+            "/echo",
+            content=b"data",
+            headers={"Content-Encoding": "compress"}
+        )
+        
+        assert response.status_code == 415
+    
+    def test_br_request_rejected_with_old_brotli(self):
+        """Тест: без ограниченной распаковки (brotli < 1.2) тело в br отклоняется, а ответы сжимаются"""
+        brotli = pytest.importorskip("brotli")
+        client = _make_client()
+        
+        with patch('app.compression._BROTLI_BOUNDED', False):
+            response = client.post("/echo", content=brotli.compress(b"payload"), headers={"Content-Encoding": "br"})
+            compressed = client.get("/large", headers={"Accept-Encoding": "br"})
+        
+        assert response.status_code == 415
+        assert compressed.headers["content-encoding"] == "br"
+
+
+class TestProcessDataCompression:
+    """Тесты сжатия для POST /process_data/"""
+    
+    def test_gzip_request_and_response(self):
+        """Тест сжатого запроса и ответа для process_data"""
+        client = TestClient(app)
+        payload = {"data": {f"key_{i}": "value" * 20 for i in range(50)}}
+        
+        with patch('app.services.external_api.ExternalApiService.get_cat_fact') as mock_get_fact, \
+             patch('app.services.redis_service.RedisService.save_request') as mock_save:
+            mock_get_fact.return_value = ExternalApiResponse(fact="Test fact", length=9)
+            mock_save.return_value = True
+            
+            response = client.post(
+                "/api/v1/process_data/",
+                content=gzip.compress(json.dumps(payload).encode()),
+                headers={
+                    "Content-Type": "application/json",
+                    "Content-Encoding": "gzip",
+                    "Accept-Encoding": "gzip"
+                }
+            )
+        
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.json()["processed_data"]["original_data"] == payload["data"]
@@ -0,0 +1,346 @@
+"""
+Unit тесты для дедлайнов запросов
+"""
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.deadline import (
+    DeadlineExceeded,
+    DeadlineMiddleware,
+    bound_timeout,
+    reset_deadline,
+    set_deadline,
+    time_left,
+    with_deadline
+)
+from app.services.external_api import ExternalApiService
+from app.services.fallback_store import FallbackStore
+from app.services.redis_service import RedisService
+from tests.test_sharding import FakeRedis
+
+
+class TestDeadlineHelpers:
+    """Тесты для функций работы с дедлайном"""
+    
+    def test_no_deadline(self):
+        """Тест: без дедлайна используется собственный таймаут"""
+        assert time_left() is None
+        assert bound_timeout(10) == 10
+    
+    def test_bound_timeout_uses_remaining_budget(self):
+        """Тест: таймаут ограничивается оставшимся бюджетом"""
+        token = set_deadline(0.5)
+        try:
+            assert bound_timeout(10) <= 0.5
+            assert bound_timeout(0.1) == 0.1
+        finally:
+            reset_deadline(token)
+        assert time_left() is None
+    
+    def test_bound_timeout_expired(self):
+        """Тест: исчерпанный бюджет вызывает DeadlineExceeded"""
+        token = set_deadline(-1)
+        try:
+            with pytest.raises(DeadlineExceeded):
+                bound_timeout(10)
+        finally:
+            reset_deadline(token)
+    
+    @pytest.mark.asyncio
+    async def test_with_deadline_cancels_slow_operation(self):
+        """Тест: операция прерывается по истечении дедлайна"""
+        token = set_deadline(0.05)
+        try:
+            with pytest.raises(DeadlineExceeded):
+                await with_deadline(asyncio.sleep(5))
+        finally:
+            reset_deadline(token)
+    
+    @pytest.mark.asyncio
+    async def test_with_deadline_own_timeout(self):
+        """Тест: собственный таймаут операции не считается истечением дедлайна"""
+        token = set_deadline(5)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await with_deadline(asyncio.sleep(5), 0.01)
+        finally:
+            reset_deadline(token)
+
+
+class TestDeadlinePropagation:
+    """Тесты для ограничения вызовов сервисов дедлайном"""
+    
+    @pytest.mark.asyncio
+    async def test_external_api_passes_remaining_budget(self):
+        """Тест: внешний API вызывается с таймаутом не больше оставшегося бюджета"""
+        service = ExternalApiService()
+        response = MagicMock()
+        response.json.return_value = {"fact": "Cats sleep a lot", "length": 16}
+        response.raise_for_status = MagicMock()
+        client = MagicMock()
+        client.get = AsyncMock(return_value=response)
+        
+        token = set_deadline(2)
+        try:
+            with patch.object(service, '_get_client', return_value=client):
+                result = await service.get_cat_fact()
+        finally:
+            reset_deadline(token)
+        
+        assert result is not None
+        assert client.get.call_args.kwargs["timeout"] <= 2
+    
+    @pytest.mark.asyncio
+    async def test_external_api_skipped_after_deadline(self):
+        """Тест: после истечения дедлайна внешний API не вызывается"""
+        service = ExternalApiService()
+        client = MagicMock()
+        client.get = AsyncMock()
+        
+        token = set_deadline(-1)
+        try:
+            with patch.object(service, '_get_client', return_value=client):
+                result = await service.get_cat_fact()
+        finally:
+            reset_deadline(token)
+        
+        assert result is None
+        client.get.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_redis_save_bounded_by_deadline(self, tmp_path):
+        """Тест: медленная запись в Redis прерывается по дедлайну и сохраняется локально"""
+        service = RedisService(FallbackStore(str(tmp_path / "fallback.db")))
+        
+        async def slow_setex(*args):
+            await asyncio.sleep(5)
+        
+        service.redis_client = MagicMock()
+        service.redis_client.setex = slow_setex
+        service.redis_client.ping = AsyncMock(return_value=True)
+        
+        token = set_deadline(0.05)
+        try:
+            result = await service.save_request("test-id", {"key": "value"})
+        finally:
+            reset_deadline(token)
+        await service._probe_task
+        
+        assert result is False
+        assert len(service.fallback_store) == 1
+        # Redis ответил на проверку: подключение сохраняется
+        assert service.redis_client is not None
+        service.fallback_store.close()
+    
+    @pytest.mark.asyncio
+    async def test_hung_redis_switches_to_fallback(self, tmp_path):
+        """Тест: зависший Redis переводит сервис в режим резервного хранилища"""
+        service = RedisService(FallbackStore(str(tmp_path / "fallback.db")))
+        service._auto_reconnect = True
+        
+        async def hang(*args):
+            await asyncio.sleep(5)
+        
+        client = MagicMock()
+        client.setex = hang
+        client.ping = hang
+        client.close = AsyncMock()
+        service.redis_client = client
+        
+        with patch('app.config.settings.redis_ping_timeout', 0.05), \
+             patch.object(service, '_reconnect_loop', AsyncMock()) as mock_reconnect:
+            token = set_deadline(0.05)
+            try:
+                assert await service.save_request("first", {"key": "value"}) is False
+            finally:
+                reset_deadline(token)
+            await service._probe_task
+            
+            # Следующая запись сразу уходит в резервное хранилище, не дожидаясь Redis
+            token = set_deadline(0.05)
+            try:
+                assert await service.save_request("second", {"key": "value"}) is False
+            finally:
+                reset_deadline(token)
+        
+        assert service.redis_client is None
+        client.close.assert_awaited_once()
+        mock_reconnect.assert_called()
+        assert len(service.fallback_store) == 2
+        service._auto_reconnect = False
+        service.fallback_store.close()
+
+
+def _make_client(**options) -> TestClient:
+    async def fast(request):
+        return PlainTextResponse(f"{time_left():.3f}")
+    
+    async def slow(request):
+        await asyncio.sleep(5)
+        return PlainTextResponse("late")
+    
+    async def export(request):
+        await asyncio.sleep(0.2)
+        return PlainTextResponse(str(time_left()))
+    
+    test_app = Starlette(routes=[Route("/fast", fast), Route("/slow", slow), Route("/export", export)])
+    test_app.add_middleware(DeadlineMiddleware, **options)
+    return TestClient(test_app)
+
+
+class TestDeadlineMiddleware:
+    """Тесты для DeadlineMiddleware"""
+    
+    def test_header_sets_deadline(self):
+        """Тест: бюджет берется из заголовка запроса"""
+        client = _make_client(default_timeout=30)
+        response = client.get("/fast", headers={"X-Request-Timeout": "2"})
+        assert response.status_code == 200
+        assert 0 < float(response.text) <= 2
+    
+    def test_route_default_and_max(self):
+        """Тест: дедлайн маршрута по умолчанию и верхняя граница бюджета клиента"""
+        client = _make_client(route_timeouts={"/fast": 3}, max_timeout=5)
+        assert float(client.get("/fast").text) <= 3
+        response = client.get("/fast", headers={"X-Request-Timeout": "100"})
+        assert 3 < float(response.text) <= 5
+    
+    @pytest.mark.parametrize("value", ["nan", "inf", "-1", "0", "abc"])
+    def test_invalid_header_falls_back_to_route_default(self, value):
+        """Тест: некорректный бюджет клиента заменяется дедлайном маршрута"""
+        client = _make_client(route_timeouts={"/fast": 3})
+        response = client.get("/fast", headers={"X-Request-Timeout": value})
+        assert response.status_code == 200
+        assert 0 < float(response.text) <= 3
+    
+    def test_expired_deadline_returns_504(self):
+        """Тест: по истечении дедлайна обработка прерывается с ответом 504"""
+        client = _make_client()
+        response = client.get("/slow", headers={"X-Request-Timeout": "0.05"})
+        assert response.status_code == 504
+        assert response.json()["error"] == "HTTP 504"
+    
+    def test_exempt_path_has_no_deadline(self):
+        """Тест: для исключенных путей дедлайн не устанавливается"""
+        client = _make_client(default_timeout=0.05, exempt_paths=["/export"])
+        response = client.get("/export", headers={"X-Request-Timeout": "0.05"})
+        assert response.status_code == 200
+        assert response.text == "None"
+    
+    def test_export_not_cut_by_deadline_with_compression(self):
+        """Тест: выгрузка со сжатием не прерывается дедлайном до первого фрагмента"""
+        from app.main import app
+        
+        fake = FakeRedis()
+        
+        async def slow_scan(match=None, count=None):
+            await asyncio.sleep(0.2)
+            for key in []:
+                yield key
+        
+        fake.scan_iter = slow_scan
+        with patch('app.config.settings.admin_token', 'secret'), \
+             patch('app.api.admin.create_redis_client', return_value=fake):
+            response = TestClient(app).get(
+                "/api/v1/admin/export/",
+                params={"compression": "none"},
+                headers={"X-Admin-Token": "secret", "X-Request-Timeout": "0.05", "Accept-Encoding": "gzip"}
+            )
+        
+        assert response.status_code == 200
+    
+    @pytest.mark.asyncio
+    async def test_disconnect_cancels_handler(self):
+        """Тест: отключение клиента отменяет обработку запроса"""
+        cancelled = asyncio.Event()
+        
+        async def handler(scope, receive, send):
+            await receive()
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        
+        messages = [
+            {"type": "http.request", "body": b"", "more_body": False},
+            {"type": "http.disconnect"}
+        ]
+        
+        async def receive():
+            message = messages.pop(0)
+            if message["type"] == "http.disconnect":
+                await asyncio.sleep(0.01)
+            return message
+        
+        sent = []
+        
+        async def send(message):
+            sent.append(message)
+        
+        middleware = DeadlineMiddleware(handler, default_timeout=5)
+        scope = {"type": "http", "path": "/", "headers": []}
+        await asyncio.wait_for(middleware(scope, receive, send), 1)
+        
+        assert cancelled.is_set()
+        assert sent[0]["status"] == 499
+        assert sent[-1]["type"] == "http.response.body"
+    
+    @pytest.mark.asyncio
+    async def test_disconnect_through_app_stack(self):
+        """Тест: отключение клиента в полном стеке приложения не превращается в 500"""
+        from app.main import app
+        
+        cancelled = asyncio.Event()
+        
+        async def slow_process(data):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        
+        messages = [
+            {"type": "http.request", "body": b'{"data": {"a": 1}}', "more_body": False},
+            {"type": "http.disconnect"}
+        ]
+        
+        async def receive():
+            if not messages:
+                await asyncio.sleep(10)
+            message = messages.pop(0)
+            if message["type"] == "http.disconnect":
+                await asyncio.sleep(0.05)
+            return message
+        
+        sent = []
+        
+        async def send(message):
+            sent.append(message)
+        
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/api/v1/process_data/",
+            "raw_path": b"/api/v1/process_data/",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"content-type", b"application/json")],
+            "client": ("testclient", 50000),
+            "server": ("testserver", 80)
+        }
+        with patch('app.services.data_processor.DataProcessorService.process_data', side_effect=slow_process), \
+             patch('app.main.logger') as mock_logger:
+            await asyncio.wait_for(app(scope, receive, send), 2)
+        
+        assert cancelled.is_set()
+        assert sent[0]["status"] == 499
+        mock_logger.error.assert_not_called()
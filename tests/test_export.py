@@ -0,0 +1,265 @@
+"""
+Unit тесты для выгрузки истории запросов
+"""
+import asyncio
+import gzip
+import io
+import json
+import subprocess
+import sys
+import threading
+import orjson
+import pytest
+from datetime import datetime
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from app.cli import main as cli_main
+from app.main import app
+from app.services.archive import SegmentArchive
+from app.services.export import (
+    ExportError,
+    export_records,
+    iter_batches,
+    make_export_encoder
+)
+from app.services.redis_sharding import ShardedRedis, request_key
+from tests.test_sharding import FakeRedis
+
+
+def _fill(client, count: int = 25):
+    """Записи с saved_at 2024-01-01T00:00 + i часов"""
+    for i in range(count):
+        record = {"input_data": {"n": i}, "success": i % 2 == 0, "saved_at": f"2024-01-{1 + i // 24:02d}T{i % 24:02d}:00:00"}
+        client.data[f"request:{i}"] = json.dumps(record)
+    client.data["other:key"] = "{}"
+
+
+async def _archive(path, count: int = 5) -> SegmentArchive:
+    """Архив с записями archived-0..count-1, saved_at 2023-12-31T00:00 + i часов"""
+    archive = SegmentArchive(str(path))
+    archive.open()
+    records = []
+    for i in range(count):
+        saved_at = datetime(2023, 12, 31, i)
+        record = {"input_data": {"n": i}, "success": True, "saved_at": saved_at.isoformat()}
+        records.append((f"archived-{i}", saved_at.timestamp(), json.dumps(record).encode()))
+    await archive.append(records)
+    archive.close()
+    return archive
+
+
+class TestIterBatches:
+    """Тесты для обхода записей пачками"""
+    
+    @pytest.mark.asyncio
+    async def test_all_records_in_batches(self):
+        """Тест: выгружаются все записи запросов пачками не больше batch_size"""
+        client = FakeRedis()
+        _fill(client)
+        
+        batches = [batch async for batch in iter_batches(client, batch_size=10)]
+        
+        assert [len(batch) for batch in batches] == [10, 10, 5]
+        rows = [row for batch in batches for row in batch]
+        assert sorted(row["request_id"] for row in rows) == sorted(str(i) for i in range(25))
+        assert all("input_data" in row for row in rows)
+    
+    @pytest.mark.asyncio
+    async def test_time_range(self):
+        """Тест: фильтр по saved_at в диапазоне [since, until)"""
+        client = FakeRedis()
+        _fill(client)
+        
+        rows = [
+            row
+            async for batch in iter_batches(
+                client,
+                batch_size=7,
+                since=datetime(2024, 1, 1, 5),
+                until=datetime(2024, 1, 1, 10)
+            )
+            for row in batch
+        ]
+        
+        assert sorted(int(row["request_id"]) for row in rows) == [5, 6, 7, 8, 9]
+    
+    @pytest.mark.asyncio
+    async def test_sharded_client(self):
+        """Тест: выгрузка обходит все шарды и снимает хеш-тег с ID"""
+        sharded = ShardedRedis({f"node{i}": FakeRedis() for i in range(3)})
+        for i in range(20):
+            await sharded.setex(request_key(f"id-{i}", partition=i % 4), 60, json.dumps({"saved_at": "2024-01-01T00:00:00"}))
+        
+        rows = [row async for batch in iter_batches(sharded, batch_size=8) for row in batch]
+        
+        assert sorted(row["request_id"] for row in rows) == sorted(f"id-{i}" for i in range(20))
+
+
+class TestExportFormats:
+    """Тесты для форматов выгрузки"""
+    
+    @pytest.mark.asyncio
+    async def test_ndjson_gzip(self):
+        """Тест: NDJSON сжимается gzip потоково"""
+        client = FakeRedis()
+        _fill(client)
+        encoder = make_export_encoder("ndjson", "gzip")
+        
+        body = b"".join([chunk async for chunk in export_records(client, encoder, batch_size=10)])
+        
+        lines = gzip.decompress(body).decode().splitlines()
+        assert len(lines) == 25
+        assert json.loads(lines[0])["request_id"]
+        assert encoder.filename == "requests.ndjson.gz"
+    
+    @pytest.mark.asyncio
+    async def test_encoding_off_event_loop(self):
+        """Тест: разбор и кодирование пачек не выполняются в потоке event loop"""
+        client = FakeRedis()
+        _fill(client)
+        encoder = make_export_encoder("ndjson", "gzip")
+        threads = set()
+        encode, loads = encoder.encode, orjson.loads
+        
+        def tracked_encode(rows):
+            threads.add(threading.get_ident())
+            return encode(rows)
+        
+        def tracked_loads(value):
+            threads.add(threading.get_ident())
+            return loads(value)
+        
+        encoder.encode = tracked_encode
+        with patch('app.services.export.orjson.loads', tracked_loads):
+            body = b"".join([chunk async for chunk in export_records(client, encoder, batch_size=10)])
+        
+        assert len(gzip.decompress(body).splitlines()) == 25
+        assert threads and threading.get_ident() not in threads
+    
+    def test_invalid_options(self):
+        """Тест: неизвестные формат и сжатие отклоняются"""
+        with pytest.raises(ExportError):
+            make_export_encoder("csv", "gzip")
+        with pytest.raises(ExportError):
+            make_export_encoder("ndjson", "lz4")
+    
+    @pytest.mark.asyncio
+    async def test_parquet(self):
+        """Тест: Parquet выгрузка читается pyarrow"""
+        parquet = pytest.importorskip("pyarrow.parquet")
+        
+        client = FakeRedis()
+        _fill(client)
+        encoder = make_export_encoder("parquet", "zstd")
+        
+        body = b"".join([chunk async for chunk in export_records(client, encoder, batch_size=10)])
+        
+        table = parquet.read_table(io.BytesIO(body))
+        assert table.num_rows == 25
+        assert table.column_names == ["request_id", "saved_at", "success", "record"]
+    
+    def test_pyarrow_not_imported_at_startup(self):
+        """Тест: импорт приложения не загружает pyarrow"""
+        result = subprocess.run(
+            [sys.executable, "-c", "import sys, app.main; print('pyarrow' in sys.modules)"],
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        
+        assert result.stdout.strip() == "False"
+
+
+class TestExportEntryPoints:
+    """Тесты для эндпоинта и командной строки выгрузки"""
+    
+    def test_endpoint_streams_export(self):
+        """Тест: эндпоинт выгрузки использует отдельный клиент и закрывает его"""
+        fake = FakeRedis()
+        _fill(fake)
+        
+        with patch('app.config.settings.admin_token', 'secret'), \
+             patch('app.api.admin.create_redis_client', return_value=fake) as mock_create:
+            response = TestClient(app).get(
+                "/api/v1/admin/export/",
+                params={"compression": "none", "since": "2024-01-01T20:00:00"},
+                headers={"X-Admin-Token": "secret"}
+            )
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert len(response.text.splitlines()) == 5
+        mock_create.assert_called_once()
+        assert fake.closed
+    
+    @pytest.mark.asyncio
+    async def test_export_includes_archive(self, tmp_path):
+        """Тест: при включенном архиве выгрузка содержит записи Redis и архива"""
+        fake = FakeRedis()
+        _fill(fake)
+        await _archive(tmp_path)
+        encoder = make_export_encoder("ndjson", "none")
+        
+        body = b"".join([
+            chunk async for chunk in export_records(
+                fake, encoder, batch_size=2, since=datetime(2023, 12, 31, 2),
+                until=datetime(2024, 1, 1, 2), archive_path=str(tmp_path)
+            )
+        ])
+        
+        request_ids = sorted(json.loads(line)["request_id"] for line in body.splitlines())
+        assert request_ids == ["0", "1", "archived-2", "archived-3", "archived-4"]
+    
+    def test_endpoint_exports_archive(self, tmp_path):
+        """Тест: эндпоинт выгрузки читает архив, если он включен"""
+        fake = FakeRedis()
+        _fill(fake)
+        asyncio.run(_archive(tmp_path))
+        
+        with patch('app.config.settings.admin_token', 'secret'), \
+             patch('app.config.settings.archive_enabled', True), \
+             patch('app.config.settings.archive_path', str(tmp_path)), \
+             patch('app.api.admin.create_redis_client', return_value=fake):
+            response = TestClient(app).get(
+                "/api/v1/admin/export/",
+                params={"compression": "none"},
+                headers={"X-Admin-Token": "secret"}
+            )
+        
+        assert response.status_code == 200
+        assert len(response.text.splitlines()) == 30
+    
+    def test_endpoint_requires_admin(self):
+        """Тест: выгрузка недоступна без административного токена"""
+        with patch('app.config.settings.admin_token', 'secret'):
+            response = TestClient(app).get("/api/v1/admin/export/")
+        assert response.status_code == 403
+    
+    def test_cli_export(self, tmp_path):
+        """Тест: выгрузка в файл из командной строки"""
+        fake = FakeRedis()
+        _fill(fake)
+        output = tmp_path / "requests.ndjson.gz"
+        
+        with patch('app.cli.create_redis_client', return_value=fake):
+            code = cli_main(["export", "--until", "2024-01-01T03:00:00", "-o", str(output)])
+        
+        assert code == 0
+        assert len(gzip.decompress(output.read_bytes()).splitlines()) == 3
+        assert fake.closed
+    
+    def test_cli_export_archive(self, tmp_path):
+        """Тест: командная строка выгружает и записи архива"""
+        fake = FakeRedis()
+        _fill(fake)
+        asyncio.run(_archive(tmp_path / "archive"))
+        output = tmp_path / "requests.ndjson.gz"
+        
+        with patch('app.config.settings.archive_enabled', True), \
+             patch('app.config.settings.archive_path', str(tmp_path / "archive")), \
+             patch('app.cli.create_redis_client', return_value=fake):
+            code = cli_main(["export", "--until", "2024-01-01T03:00:00", "-o", str(output)])
+        
+        assert code == 0
+        assert len(gzip.decompress(output.read_bytes()).splitlines()) == 8
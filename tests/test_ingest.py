@@ -0,0 +1,164 @@
+"""
+Unit тесты для WebSocket канала приема данных
+"""
+import asyncio
+import json
+import pytest
+from datetime import datetime
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from app.api.ingest import IngestConnection
+from app.main import app
+from app.models.schemas import ExternalApiResponse, ProcessDataResponse
+
+client = TestClient(app)
+
+
+class FakeWebSocket:
+    """Соединение в памяти: входящие сообщения из очереди, исходящие в список"""
+    
+    def __init__(self):
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.sent = []
+        self.received = 0
+    
+    async def receive(self):
+        message = await self.incoming.get()
+        self.received += 1
+        return message
+    
+    async def send_text(self, text: str):
+        self.sent.append(json.loads(text))
+    
+    def push(self, payload):
+        self.incoming.put_nowait({"type": "websocket.receive", "text": json.dumps(payload)})
+
+
+class SlowProcessor:
+    """Обработчик, завершающий сообщения только по команде теста"""
+    
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self.release = asyncio.Event()
+    
+    async def process_data(self, data, request_id=None):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await self.release.wait()
+        finally:
+            self.active -= 1
+        return ProcessDataResponse(
+            success=True,
+            message="ok",
+            processed_data={},
+            external_api_data=None,
+            timestamp=datetime.now(),
+            request_id=request_id
+        )
+
+
+class TestIngestEndpoint:
+    """Тесты для WebSocket эндпоинта /ingest/"""
+    
+    def test_messages_processed_with_correlation_ids(self):
+        """Тест: ответы приходят с id сообщений, request_id уникальны в рамках соединения"""
+        mock_external_response = ExternalApiResponse(fact="Test fact", length=9)
+        
+        with patch('app.services.external_api.ExternalApiService.get_cat_fact') as mock_get_fact, \
+             patch('app.services.redis_service.RedisService.save_request') as mock_save:
+            mock_get_fact.return_value = mock_external_response
+            mock_save.return_value = True
+            
+            with client.websocket_connect("/api/v1/ingest/") as websocket:
+                ready = websocket.receive_json()
+                for i in range(5):
+                    websocket.send_json({"id": f"msg-{i}", "data": {"n": i}})
+                replies = [websocket.receive_json() for _ in range(5)]
+        
+        assert ready["event"] == "ready"
+        assert ready["max_in_flight"] > 0
+        assert sorted(reply["id"] for reply in replies) == [f"msg-{i}" for i in range(5)]
+        for reply in replies:
+            assert reply["result"]["success"] is True
+            n = int(reply["id"].split("-")[1])
+            assert reply["result"]["processed_data"]["original_data"] == {"n": n}
+        request_ids = {reply["result"]["request_id"] for reply in replies}
+        assert len(request_ids) == 5
+        assert len({request_id.rsplit("-", 1)[0] for request_id in request_ids}) == 1
+        assert mock_save.call_count == 5
+    
+    def test_invalid_messages_keep_connection(self):
+        """Тест: ошибки отдельных сообщений не закрывают соединение"""
+        with client.websocket_connect("/api/v1/ingest/") as websocket:
+            websocket.receive_json()
+            websocket.send_text("{not json")
+            assert websocket.receive_json()["error"]["status"] == 422
+            
+            websocket.send_json({"data": {"key": "value"}})
+            assert websocket.receive_json() == {
+                "id": None,
+                "error": {"status": 422, "detail": "Поле id обязательно"}
+            }
+            
+            websocket.send_json({"id": 7, "data": "string"})
+            reply = websocket.receive_json()
+            assert reply["id"] == 7
+            assert reply["error"]["status"] == 422
+    
+    def test_message_too_large(self):
+        """Тест: слишком большое сообщение отклоняется с 413"""
+        with patch('app.config.settings.ingest_max_message_size', 100):
+            with client.websocket_connect("/api/v1/ingest/") as websocket:
+                websocket.receive_json()
+                websocket.send_json({"id": 1, "data": {"key": "x" * 200}})
+                assert websocket.receive_json()["error"]["status"] == 413
+
+
+class TestIngestFlowControl:
+    """Тесты для ограничения сообщений в обработке"""
+    
+    @pytest.mark.asyncio
+    async def test_in_flight_cap(self):
+        """Тест: при исчерпании слотов соединение не читается дальше"""
+        websocket = FakeWebSocket()
+        processor = SlowProcessor()
+        connection = IngestConnection(websocket, processor, max_in_flight=2)
+        
+        for i in range(5):
+            websocket.push({"id": i, "data": {"n": i}})
+        run = asyncio.create_task(connection.run())
+        
+        await asyncio.sleep(0.05)
+        assert processor.active == 2
+        assert websocket.received == 2
+        
+        processor.release.set()
+        while len(websocket.sent) < 6:
+            await asyncio.sleep(0.01)
+        
+        assert processor.max_active == 2
+        assert sorted(reply["id"] for reply in websocket.sent[1:]) == [0, 1, 2, 3, 4]
+        
+        websocket.incoming.put_nowait({"type": "websocket.disconnect"})
+        await asyncio.wait_for(run, 1)
+    
+    @pytest.mark.asyncio
+    async def test_disconnect_cancels_in_flight(self):
+        """Тест: при отключении клиента незавершенная обработка отменяется"""
+        websocket = FakeWebSocket()
+        processor = SlowProcessor()
+        connection = IngestConnection(websocket, processor, max_in_flight=4)
+        
+        websocket.push({"id": 1, "data": {}})
+        run = asyncio.create_task(connection.run())
+        await asyncio.sleep(0.02)
+        assert processor.active == 1
+        
+        websocket.incoming.put_nowait({"type": "websocket.disconnect"})
+        await asyncio.wait_for(run, 1)
+        
+        assert not connection._tasks
+        assert len(websocket.sent) == 1
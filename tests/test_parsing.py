@@ -0,0 +1,61 @@
+"""
+Unit тесты для разбора JSON тел запросов
+"""
+import time
+import pytest
+
+from app.api.parsing import JsonLimitError, check_json_limits, decode_json
+
+
+class TestJsonLimits:
+    """Тесты для проверки ограничений JSON документа"""
+    
+    def test_brackets_inside_strings_ignored(self):
+        """Тест игнорирования скобок и двоеточий внутри строк"""
+        body = b'{"a": "[[[[{{{{: : :", "b": "\\"]]]"}'
+        
+        check_json_limits(body, max_depth=1, max_keys=2)
+    
+    def test_depth_limit(self):
+        """Тест превышения глубины вложенности"""
+        body = b'[' * 4 + b']' * 4
+        
+        check_json_limits(body, max_depth=4, max_keys=0)
+        with pytest.raises(JsonLimitError):
+            check_json_limits(body, max_depth=3, max_keys=0)
+    
+    def test_sibling_containers_do_not_add_depth(self):
+        """Тест того, что соседние контейнеры не увеличивают глубину"""
+        body = b'{"items": [' + b','.join([b'{"x": 1}'] * 100) + b']}'
+        
+        assert decode_json(body, max_depth=3, max_keys=101)["items"][0] == {"x": 1}
+    
+    @pytest.mark.parametrize("length", [1, 7, 8, 9, 150])
+    def test_exact_depth_boundary(self, length):
+        """Тест точной границы глубины при любом выравнивании скобок"""
+        body = b'{"a": 1, "b": ' + b'[' * length + b']' * length + b'}'
+        
+        check_json_limits(body, max_depth=length + 1, max_keys=2)
+        with pytest.raises(JsonLimitError):
+            check_json_limits(body, max_depth=length, max_keys=2)
+    
+    @pytest.mark.parametrize("body", [
+        b'[' * 5_000_000 + b']' * 5_000_000,
+        b'[' * 60 + b','.join([b'[[[]]]'] * 1_000_000) + b']' * 60,
+        b'[' + b','.join([b'[]'] * 2_000_000) + b',' + b'[' * 70 + b']' * 70 + b']',
+        b''.join([b'[' + b'[],' * 33_000] * 100) + b']' * 100
+    ], ids=["deep", "near_limit", "wide_then_deep", "staircase"])
+    def test_large_documents_checked_in_linear_time(self, body):
+        """Тест: проверка глубины 10 МБ документа не держит event loop"""
+        started = time.perf_counter()
+        try:
+            check_json_limits(body, max_depth=64, max_keys=10**9)
+        except JsonLimitError:
+            pass
+        
+        assert time.perf_counter() - started < 1.0
+    
+    def test_key_limit(self):
+        """Тест превышения количества ключей"""
+        with pytest.raises(JsonLimitError):
+            check_json_limits(b'{"a": 1, "b": {"c": 2}}', max_depth=10, max_keys=2)
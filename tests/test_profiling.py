@@ -0,0 +1,71 @@
+"""
+Unit тесты для инструментов диагностики производительности
+"""
+import asyncio
+import threading
+import time
+import pytest
+
+from app.profiling import SamplingProfiler, SlowRequestLog, LoopMonitor
+
+
+class TestSlowRequestLog:
+    """Тесты для SlowRequestLog"""
+    
+    def test_keeps_slowest_requests(self):
+        """Тест сохранения только самых медленных запросов"""
+        log = SlowRequestLog(size=2)
+        
+        for duration in (10, 50, 30, 5):
+            log.add(duration, {"duration_ms": duration})
+        
+        assert [record["duration_ms"] for record in log.snapshot()] == [50, 30]
+        assert log.threshold_ms() == 30
+
+
+class TestSamplingProfiler:
+    """Тесты для SamplingProfiler"""
+    
+    def test_collects_folded_stacks(self):
+        """Тест сбора стеков целевого потока в формате folded stacks"""
+        profiler = SamplingProfiler()
+        stop = threading.Event()
+        
+        def busy_worker():
+            while not stop.is_set():
+                sum(range(1000))
+        
+        worker = threading.Thread(target=busy_worker)
+        worker.start()
+        try:
+            profiler.start(worker.ident, interval=0.001)
+            time.sleep(0.05)
+            folded = profiler.stop()
+        finally:
+            stop.set()
+            worker.join()
+        
+        assert "busy_worker" in folded
+        stack, count = folded.splitlines()[0].rsplit(" ", 1)
+        assert int(count) > 0
+        assert not profiler.running
+
+
+class TestLoopMonitor:
+    """Тесты для LoopMonitor"""
+    
+    @pytest.mark.asyncio
+    async def test_detects_stall(self):
+        """Тест обнаружения блокировки event loop"""
+        monitor = LoopMonitor(interval=0.01, threshold=0.05)
+        monitor.start()
+        await asyncio.sleep(0.02)
+        
+        time.sleep(0.1)  # Блокируем event loop
+        await asyncio.sleep(0.03)
+        await monitor.stop()
+        
+        stats = monitor.stats()
+        assert stats["stall_count"] >= 1
+        assert stats["max_lag_ms"] >= 50
+        assert stats["tasks_total"] >= 1
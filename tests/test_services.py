@@ -3,12 +3,14 @@ Unit тесты для сервисов
 """
 import pytest
 import httpx
-from unittest.mock import AsyncMock, patch
+from redis import exceptions as redis_exceptions
+from unittest.mock import AsyncMock, MagicMock, patch
 from datetime import datetime
 
-from app.services.external_api import ExternalApiService
-from app.services.redis_service import RedisService
-from app.services.data_processor import DataProcessorService
+from app.services.external_api import ExternalApiService, get_external_api_service
+from app.services.redis_service import RedisService, get_redis_service
+from app.services.fallback_store import FallbackStore
+from app.services.data_processor import DataProcessorService, get_data_processor
 from app.models.schemas import ExternalApiResponse
 
 
@@ -52,15 +54,44 @@ class TestExternalApiService:
             result = await service.get_cat_fact()
             
             assert result is None
+    
+    @pytest.mark.asyncio
+    async def test_warmup_opens_connection(self):
+        """Тест: прогрев отправляет запрос и оставляет соединение в пуле клиента"""
+        service = ExternalApiService()
+        requests = []
+        
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200)
+        
+        service._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        
+        assert await service.warmup() is True
+        assert [(request.method, str(request.url)) for request in requests] == [("HEAD", service.base_url)]
+        await service.close()
+    
+    @pytest.mark.asyncio
+    async def test_warmup_failure_not_fatal(self):
+        """Тест: недоступность внешнего API при прогреве не прерывает старт"""
+        service = ExternalApiService()
+        
+        def handler(request):
+            raise httpx.ConnectError("unreachable", request=request)
+        
+        service._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        
+        assert await service.warmup() is False
+        await service.close()
 
 
 class TestRedisService:
     """Тесты для RedisService"""
     
     @pytest.mark.asyncio
-    async def test_connect_success(self):
+    async def test_connect_success(self, tmp_path):
         """Тест успешного подключения к Redis"""
-        service = RedisService()
+        service = RedisService(FallbackStore(str(tmp_path / "fallback.db")))
         
         with patch('redis.asyncio.Redis') as mock_redis_class:
             mock_redis = AsyncMock()
@@ -70,6 +101,7 @@ class TestRedisService:
             await service.connect()
             
             assert service.redis_client is not None
+        await service.disconnect()
     
     @pytest.mark.asyncio
     async def test_save_request_success(self):
@@ -126,6 +158,73 @@ class TestRedisService:
         result = await service.is_healthy()
         
         assert result is False
+    
+    @pytest.mark.asyncio
+    async def test_save_request_buffers_without_connection(self, tmp_path):
+        """Тест сохранения в резервное хранилище при отсутствии подключения"""
+        store = FallbackStore(str(tmp_path / "fallback.db"))
+        service = RedisService(fallback_store=store)
+        service._auto_reconnect = True
+        
+        with patch.object(service, '_schedule_reconnect') as mock_reconnect:
+            result = await service.save_request("test_id", {"test": "data"})
+        
+        mock_reconnect.assert_called_once()
+        
+        assert result is False
+        batch = await store.read_batch(10)
+        assert len(batch) == 1
+        assert batch[0][1] == "request:test_id"
+    
+    @pytest.mark.asyncio
+    async def test_save_request_connection_lost(self, tmp_path):
+        """Тест буферизации записи при обрыве соединения с Redis"""
+        store = FallbackStore(str(tmp_path / "fallback.db"))
+        service = RedisService(fallback_store=store)
+        service.redis_client = AsyncMock()
+        service.redis_client.setex = AsyncMock(side_effect=redis_exceptions.ConnectionError("down"))
+        
+        with patch.object(service, '_schedule_reconnect'):
+            result = await service.save_request("test_id", {"test": "data"})
+        
+        assert result is False
+        assert service.redis_client is None
+        assert len(store) == 1
+    
+    @pytest.mark.asyncio
+    async def test_replay_fallback(self, tmp_path):
+        """Тест переноса резервных записей в Redis после переподключения"""
+        store = FallbackStore(str(tmp_path / "fallback.db"))
+        for i in range(3):
+            await store.append(f"request:{i}", "{}", 3600)
+        
+        service = RedisService(fallback_store=store)
+        pipe = MagicMock()
+        pipe.execute = AsyncMock(return_value=[True] * 3)
+        service.redis_client = MagicMock()
+        service.redis_client.pipeline.return_value = pipe
+        
+        await service._replay_fallback()
+        
+        assert pipe.setex.call_count == 3
+        assert len(store) == 0
+        assert await store.read_batch(10) == []
+
+
+class TestFallbackStore:
+    """Тесты для FallbackStore"""
+    
+    @pytest.mark.asyncio
+    async def test_append_evicts_oldest(self, tmp_path):
+        """Тест вытеснения самых старых записей при переполнении"""
+        store = FallbackStore(str(tmp_path / "fallback.db"), max_records=2)
+        
+        for i in range(3):
+            await store.append(f"request:{i}", "{}", 60)
+        
+        batch = await store.read_batch(10)
+        assert [row[1] for row in batch] == ["request:1", "request:2"]
+        assert len(store) == 2
 
 
 class TestDataProcessorService:
@@ -175,6 +274,14 @@ class TestDataProcessorService:
             assert result.external_api_data is None
             assert "original_data" in result.processed_data
     
+    def test_shared_service_instances(self):
+        """Тест ленивого создания общих экземпляров сервисов"""
+        processor = get_data_processor()
+        
+        assert get_data_processor() is processor
+        assert processor.redis_service is get_redis_service()
+        assert processor.external_api_service is get_external_api_service()
+    
     def test_transform_data(self):
         """Тест трансформации данных"""
         service = DataProcessorService()
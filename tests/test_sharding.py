@@ -0,0 +1,366 @@
+"""
+Unit тесты для шардирования Redis
+"""
+import asyncio
+import fnmatch
+import pytest
+from collections import Counter
+from pydantic import ValidationError
+from redis import exceptions as redis_exceptions
+from unittest.mock import patch
+
+from app.config import Settings
+
+from app.services.archive import SegmentArchive
+from app.services.fallback_store import FallbackStore
+from app.services.redis_service import RedisService
+from app.services.redis_sharding import (
+    HashRing,
+    ShardedRedis,
+    hash_tag,
+    key_partition,
+    request_id_from_key,
+    request_key
+)
+
+
+class FakeRedis:
+    """Узел Redis в памяти с подсчетом отправленных пайплайнов"""
+    
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.zsets = {}
+        self.pipelines = 0
+        self.closed = False
+    
+    async def ping(self):
+        return True
+    
+    async def setex(self, key, ttl, value):
+        self.data[key] = value
+        self.ttls[key] = int(ttl.total_seconds()) if hasattr(ttl, "total_seconds") else int(ttl)
+        return True
+    
+    async def get(self, key):
+        return self.data.get(key)
+    
+    async def delete(self, key):
+        self.ttls.pop(key, None)
+        return int(self.data.pop(key, None) is not None)
+    
+    async def ttl(self, key):
+        if key not in self.data:
+            return -2
+        return self.ttls.get(key, -1)
+    
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+    
+    async def zadd(self, key, mapping):
+        zset = self.zsets.setdefault(key, {})
+        added = len(set(mapping) - set(zset))
+        zset.update(mapping)
+        return added
+    
+    async def zrangebyscore(self, key, min, max, start=None, num=None, withscores=False):
+        low, high = float(min), float(max)
+        members = sorted(
+            (score, member) for member, score in self.zsets.get(key, {}).items()
+            if low <= score <= high
+        )
+        if start is not None:
+            members = members[start:start + num]
+        if withscores:
+            return [(member, score) for score, member in members]
+        return [member for _, member in members]
+    
+    async def zrem(self, key, *members):
+        zset = self.zsets.get(key, {})
+        return sum(zset.pop(member, None) is not None for member in members)
+    
+    async def scan_iter(self, match=None, count=None):
+        for key in list(self.data):
+            if match is None or fnmatch.fnmatchcase(key, match):
+                yield key
+    
+    async def close(self):
+        self.closed = True
+    
+    def pipeline(self, transaction=False):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, node: FakeRedis):
+        self.node = node
+        self.commands = []
+    
+    def __len__(self):
+        return len(self.commands)
+    
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+    
+    async def execute(self):
+        self.node.pipelines += 1
+        return [await getattr(self.node, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+class FlakyRedis(FakeRedis):
+    """Узел, который можно выключить: команды падают с ConnectionError"""
+    
+    def __init__(self):
+        super().__init__()
+        self.down = False
+    
+    def _check(self):
+        if self.down:
+            raise redis_exceptions.ConnectionError("node down")
+    
+    async def ping(self):
+        self._check()
+        return True
+    
+    async def setex(self, key, ttl, value):
+        self._check()
+        return await super().setex(key, ttl, value)
+    
+    def pipeline(self, transaction=False):
+        self._check()
+        return super().pipeline(transaction)
+
+
+def _make_sharded(count: int = 3) -> ShardedRedis:
+    return ShardedRedis({f"redis://node{i}:6379/0": FakeRedis() for i in range(count)})
+
+
+class TestHashRing:
+    """Тесты для кольца консистентного хеширования"""
+    
+    def test_hash_tag(self):
+        """Тест: шард выбирается по хеш-тегу, как в Redis Cluster"""
+        assert hash_tag("request:{abc}") == "abc"
+        assert hash_tag("index:{abc}:saved_at") == "abc"
+        assert hash_tag("request:{}abc") == "request:{}abc"
+        assert hash_tag("request:abc") == "request:abc"
+        assert request_key("abc", partition=7) == "request:{p7}:abc"
+        assert request_key("abc") == "request:abc"
+        assert request_id_from_key("request:{p7}:abc") == "abc"
+        assert request_id_from_key("request:abc") == "abc"
+    
+    def test_keys_with_same_tag_colocated(self):
+        """Тест: ключи с одинаковым хеш-тегом попадают на один узел"""
+        ring = HashRing(["a", "b", "c", "d"])
+        for i in range(100):
+            assert ring.node_for(f"request:{{{i}}}") == ring.node_for(f"index:{{{i}}}")
+    
+    def test_distribution_and_minimal_movement(self):
+        """Тест: ключи распределяются равномерно, при добавлении узла переезжает около 1/N"""
+        nodes = ["a", "b", "c", "d"]
+        ring = HashRing(nodes)
+        keys = [f"request:{{{i}}}" for i in range(20_000)]
+        before = {key: ring.node_for(key) for key in keys}
+        
+        counts = Counter(before.values())
+        assert set(counts) == set(nodes)
+        assert min(counts.values()) > len(keys) / len(nodes) * 0.7
+        
+        extended = HashRing(nodes + ["e"])
+        moved = sum(before[key] != extended.node_for(key) for key in keys)
+        assert moved < len(keys) * 0.3
+        assert all(
+            extended.node_for(key) in (before[key], "e") for key in keys
+        )
+    
+    def test_empty_ring(self):
+        """Тест: кольцо без узлов не создается"""
+        with pytest.raises(ValueError):
+            HashRing([])
+
+
+class TestShardedRedis:
+    """Тесты для клиента поверх нескольких узлов"""
+    
+    @pytest.mark.asyncio
+    async def test_commands_routed_to_owner(self):
+        """Тест: запись и чтение выполняются на узле-владельце ключа"""
+        sharded = _make_sharded()
+        await sharded.setex("request:{1}", 60, "value")
+        
+        owner = sharded.client_for("request:{1}")
+        assert owner.data == {"request:{1}": "value"}
+        assert await sharded.get("request:{1}") == "value"
+        assert sum(len(node.data) for node in sharded.clients.values()) == 1
+    
+    @pytest.mark.asyncio
+    async def test_pipeline_grouped_per_shard(self):
+        """Тест: пайплайн отправляет по одному пакету на шард и сохраняет порядок ответов"""
+        sharded = _make_sharded()
+        pipe = sharded.pipeline(transaction=False)
+        for i in range(50):
+            pipe.setex(f"request:{{{i}}}", 60, str(i))
+        assert len(pipe) == 50
+        assert await pipe.execute() == [True] * 50
+        
+        assert all(node.pipelines == 1 for node in sharded.clients.values())
+        
+        pipe = sharded.pipeline()
+        for i in reversed(range(50)):
+            pipe.get(f"request:{{{i}}}")
+        assert await pipe.execute() == [str(i) for i in reversed(range(50))]
+        assert len(pipe) == 0
+    
+    @pytest.mark.asyncio
+    async def test_mget_and_scan_across_shards(self):
+        """Тест: MGET и SCAN охватывают ключи всех шардов"""
+        sharded = _make_sharded()
+        for i in range(30):
+            await sharded.setex(f"request:{{{i}}}", 60, str(i))
+        
+        keys = [f"request:{{{i}}}" for i in range(31)]
+        assert await sharded.mget(keys) == [str(i) for i in range(30)] + [None]
+        assert sorted([key async for key in sharded.scan_iter(match="request:*")]) == sorted(keys[:30])
+    
+    @pytest.mark.asyncio
+    async def test_close_all_nodes(self):
+        """Тест: закрываются подключения ко всем узлам"""
+        sharded = _make_sharded()
+        await sharded.close()
+        assert all(node.closed for node in sharded.clients.values())
+
+
+class TestRedisServiceSharded:
+    """Тесты для RedisService в режиме клиентского шардирования"""
+    
+    @pytest.mark.asyncio
+    async def test_save_and_get_request(self, tmp_path):
+        """Тест: записи сохраняются с хеш-тегом и читаются с нужного шарда"""
+        sharded = _make_sharded()
+        service = RedisService(fallback_store=FallbackStore(str(tmp_path / "fallback.db")))
+        
+        with patch('app.config.settings.redis_mode', 'sharded'), \
+             patch.object(service, '_create_client', return_value=sharded):
+            assert await service._open_client() is True
+            for i in range(20):
+                assert await service.save_request(f"id-{i}", {"n": i}) is True
+            result = await service.get_request("id-7")
+        
+        assert result["n"] == 7
+        with patch('app.config.settings.redis_mode', 'sharded'):
+            key = RedisService._key("id-7")
+        assert key.startswith("request:{p") and key.endswith("}:id-7")
+        assert key in sharded.client_for(key).data
+        assert sum(len(node.data) for node in sharded.clients.values()) == 20
+    
+    @pytest.mark.asyncio
+    async def test_record_and_index_colocated(self, tmp_path):
+        """Тест: запись и ее элемент индекса времени сохраняются одним пайплайном одного шарда"""
+        nodes = {f"redis://node{i}:6379/0": FakeRedis() for i in range(4)}
+        sharded = ShardedRedis(nodes)
+        archive = SegmentArchive(str(tmp_path / "archive"))
+        service = RedisService(FallbackStore(str(tmp_path / "fallback.db")), archive=archive)
+        service.redis_client = sharded
+        
+        with patch('app.config.settings.redis_mode', 'sharded'):
+            for i in range(200):
+                assert await service.save_request(f"id-{i}", {"n": i}) is True
+        
+        assert sum(node.pipelines for node in nodes.values()) == 200
+        for node in nodes.values():
+            indexed = {member for zset in node.zsets.values() for member in zset}
+            stored = {request_id_from_key(key) for key in node.data}
+            assert indexed == stored
+        service.fallback_store.close()
+    
+    @pytest.mark.asyncio
+    async def test_replay_grouped_per_shard(self, tmp_path):
+        """Тест: резервные записи переносятся одним пайплайном на шард"""
+        store = FallbackStore(str(tmp_path / "fallback.db"))
+        for i in range(30):
+            await store.append(request_key(f"id-{i}", partition=key_partition(f"id-{i}", 1024)), "{}", 3600)
+        
+        sharded = _make_sharded()
+        service = RedisService(fallback_store=store)
+        service.redis_client = sharded
+        
+        await service._replay_fallback()
+        
+        assert len(store) == 0
+        assert sum(len(node.data) for node in sharded.clients.values()) == 30
+        assert all(node.pipelines == 1 for node in sharded.clients.values())
+    
+    @pytest.mark.asyncio
+    async def test_one_shard_down_keeps_other_shards(self, tmp_path):
+        """Тест: отказ одного узла не переводит остальные шарды на резервное хранилище"""
+        nodes = {f"redis://node{i}:6379/0": FlakyRedis() for i in range(3)}
+        sharded = ShardedRedis(nodes)
+        down_node = "redis://node0:6379/0"
+        nodes[down_node].down = True
+        store = FallbackStore(str(tmp_path / "fallback.db"))
+        service = RedisService(fallback_store=store)
+        service._auto_reconnect = True
+        
+        with patch('app.config.settings.redis_mode', 'sharded'), \
+             patch('app.config.settings.redis_reconnect_min_delay', 0.01), \
+             patch.object(service, '_create_client', return_value=sharded):
+            assert await service._open_client() is True
+            
+            results = {}
+            for i in range(30):
+                results[f"id-{i}"] = await service.save_request(f"id-{i}", {"n": i})
+            
+            down_ids = [rid for rid in results if sharded.ring.node_for(RedisService._key(rid)) == down_node]
+            assert down_ids
+            assert all(results[rid] is False for rid in down_ids)
+            assert all(ok for rid, ok in results.items() if rid not in down_ids)
+            assert service.redis_client is sharded
+            assert len(store) == len(down_ids)
+            
+            # Узел вернулся: переподключение переносит его записи из резервного хранилища
+            nodes[down_node].down = False
+            await asyncio.wait_for(service._reconnect_task, 1)
+        
+        assert len(store) == 0
+        assert len(nodes[down_node].data) == len(down_ids)
+        service._auto_reconnect = False
+    
+    @pytest.mark.parametrize("url", ["localhost:6379", "http://a:6379/0", "redis://:6379/0", "redis://a:port/0"])
+    def test_settings_reject_malformed_nodes(self, url):
+        """Тест: узел без схемы redis:// или хоста отклоняется при загрузке настроек"""
+        with pytest.raises(ValidationError):
+            Settings(redis_mode="sharded", redis_nodes=["redis://a:6379/0", url])
+    
+    def test_settings_reject_missing_nodes(self):
+        """Тест: режим шардирования без узлов отклоняется при загрузке настроек"""
+        with pytest.raises(ValidationError):
+            Settings(redis_mode="sharded", redis_nodes=[])
+        with pytest.raises(ValidationError):
+            Settings(redis_mode="cluster")
+        with pytest.raises(ValidationError):
+            Settings(redis_mode="replicated")
+        assert Settings(redis_mode="sharded", redis_nodes=["redis://a:6379/0"]).redis_nodes
+    
+    def test_create_client_modes(self):
+        """Тест: клиент создается согласно режиму"""
+        from redis.asyncio.cluster import RedisCluster
+        
+        service = RedisService(fallback_store=FallbackStore(":memory:"))
+        nodes = ["redis://127.0.0.1:7000/0", "redis://127.0.0.1:7001/0"]
+        
+        with patch('app.config.settings.redis_mode', 'sharded'), \
+             patch('app.config.settings.redis_nodes', nodes):
+            client = service._create_client()
+        assert isinstance(client, ShardedRedis)
+        assert list(client.clients) == nodes
+        
+        with patch('app.config.settings.redis_mode', 'cluster'), \
+             patch('app.config.settings.redis_nodes', nodes):
+            assert isinstance(service._create_client(), RedisCluster)
+        
+        with patch('app.config.settings.redis_mode', 'unknown'):
+            with pytest.raises(ValueError):
+                service._create_client()
@@ -0,0 +1,68 @@
+"""
+Unit тесты для трассировки запросов
+"""
+import pytest
+
+from app.tracing import Tracer, RingBufferSink, OtlpHttpSink, NOOP_SPAN
+
+
+class TestTracer:
+    """Тесты для Tracer"""
+    
+    def test_disabled_sampling_returns_noop(self):
+        """Тест отсутствия трассировки при нулевой доле выборки"""
+        tracer = Tracer(sample_rate=0.0)
+        
+        with tracer.start_trace("GET /") as root:
+            with tracer.span("child") as child:
+                pass
+        
+        assert root is NOOP_SPAN
+        assert child is NOOP_SPAN
+    
+    def test_child_spans_exported_with_root(self):
+        """Тест экспорта трассы со всеми дочерними спанами"""
+        tracer = Tracer(sample_rate=1.0)
+        sink = RingBufferSink(max_traces=10)
+        tracer.add_sink(sink)
+        
+        with tracer.start_trace("GET /") as root:
+            with tracer.span("process_data") as child:
+                tracer.record("external_api.connect", 1, 2)
+        
+        traces = sink.recent()
+        assert len(traces) == 1
+        spans = {span["name"]: span for span in traces[0]["spans"]}
+        assert set(spans) == {"GET /", "process_data", "external_api.connect"}
+        assert spans["process_data"]["parent_id"] == root.span_id
+        assert spans["external_api.connect"]["parent_id"] == child.span_id
+        assert all(span["trace_id"] == root.trace_id for span in spans.values())
+    
+    def test_span_records_error(self):
+        """Тест записи исключения в атрибуты спана"""
+        tracer = Tracer(sample_rate=1.0)
+        sink = RingBufferSink()
+        tracer.add_sink(sink)
+        
+        with pytest.raises(ValueError):
+            with tracer.start_trace("GET /"):
+                raise ValueError("boom")
+        
+        assert "boom" in sink.recent()[0]["spans"][0]["attributes"]["error"]
+    
+    @pytest.mark.asyncio
+    async def test_otlp_encoding(self):
+        """Тест формирования OTLP/JSON тела запроса"""
+        tracer = Tracer(sample_rate=1.0)
+        sink = OtlpHttpSink("http://collector:4318/v1/traces", "test-service")
+        tracer.add_sink(sink)
+        
+        with tracer.start_trace("GET /", http_status=200):
+            pass
+        
+        spans = [sink._queue.get_nowait()]
+        body = sink._encode(spans)
+        otlp_span = body["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        assert otlp_span["name"] == "GET /"
+        assert len(otlp_span["traceId"]) == 32
+        assert otlp_span["attributes"] == [{"key": "http_status", "value": {"intValue": "200"}}]